@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 from secret_info import POSTGRES_CONNECTION, SECRET_KEY
 
@@ -7,10 +8,58 @@ basedir = os.path.abspath(os.path.dirname(__file__))
 date_style = {'format': '%d-%b-%Y',
               'help': 'DD-MMM-YYYY'}
 
+# engine options by environment, see mdt_app/routing.py. Pool sizes are per
+# worker process, statement_timeout is in milliseconds, pre_ping tests
+# connections as they are checked out of the pool
+engine_profiles = {
+    'development': {'pool_size': 5, 'max_overflow': 5, 'pool_timeout': 10,
+                    'pool_recycle': None, 'statement_timeout': None,
+                    'pre_ping': False},
+    'testing': {'pool_size': 5, 'max_overflow': 0, 'pool_timeout': 10,
+                'pool_recycle': None, 'statement_timeout': None,
+                'pre_ping': False},
+    'production': {'pool_size': 10, 'max_overflow': 10, 'pool_timeout': 30,
+                   'pool_recycle': 1800, 'statement_timeout': 30000,
+                   'pre_ping': True},
+}
+
 class Config:
     WTF_CSRF_ENABLED = True
     SECRET_KEY = os.environ.get('SECRET_KEY') or SECRET_KEY
     SQLALCHEMY_TRACK_MODIFICATIONS = True
+    SEARCH_INDEX_DIR = (os.environ.get('SEARCH_INDEX_DIR') or
+                        os.path.join(basedir, 'search_index'))
+    # processes rendering a meeting's PDF reports, None for one per CPU
+    REPORT_WORKERS = None
+    # run background jobs as they are queued instead of on manage.py worker
+    JOBS_INLINE = bool(os.environ.get('JOBS_INLINE'))
+    # write the audit log on a background thread after commit
+    AUDIT_ASYNC = True
+    # seconds the change feed stays behind now, so rows of transactions
+    # still committing aren't skipped
+    CHANGES_SETTLE_SECONDS = 60
+    # bearer token allowing a sync client to read the change feed without
+    # logging in as an admin
+    CHANGES_TOKEN = os.environ.get('CHANGES_TOKEN')
+    # time statements of each request, see instrumentation.py
+    SQL_INSTRUMENTATION = True
+    SERVER_TIMING = True
+    # raise instead of logging when a view goes over its query budget
+    QUERY_BUDGET_RAISE = False
+    # directory each worker process writes its metrics to, see metrics.py
+    METRICS_DIR = os.environ.get('METRICS_DIR')
+    # bearer token allowing a scraper to read the metrics without logging in
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    ENGINE_PROFILE = engine_profiles['development']
+    # read-only views read from this database when set, see routing.py
+    REPLICA_DATABASE_URL = os.environ.get('REPLICA_DATABASE_URL')
+    # seconds a browser reads from the primary after a write
+    REPLICA_PIN_SECONDS = 10
+    # changes the ETags of list pages, see conditional.py; None for the
+    # time of the newest file of the app
+    ETAG_RELEASE = os.environ.get('ETAG_RELEASE')
+    # seconds after a change before a page can be answered 304 Not Modified
+    CONDITIONAL_SETTLE_SECONDS = 10
 
 
     @staticmethod
@@ -36,6 +85,17 @@ class TestingConfig(Config):
     WTF_CSRF_ENABLED = False
     WTF_CSRF_METHODS = []
     TEST_SERVER_PORT = 5001
+    SEARCH_INDEX_DIR = os.path.join(tempfile.gettempdir(),
+                                    'mdt_test_search_index')
+    # render reports in the test process
+    REPORT_WORKERS = 0
+    JOBS_INLINE = True
+    # write the audit log in the test's transaction, so it is rolled back
+    AUDIT_ASYNC = False
+    CHANGES_SETTLE_SECONDS = 0
+    CONDITIONAL_SETTLE_SECONDS = 0
+    QUERY_BUDGET_RAISE = True
+    ENGINE_PROFILE = engine_profiles['testing']
     SQLALCHEMY_DATABASE_URI = (os.environ.get('TEST_DATABASE_URL') or
                                POSTGRES_CONNECTION + 'mdt_test')
 
@@ -43,6 +103,7 @@ class TestingConfig(Config):
 class ProductionConfig(Config):
     DEBUG = False
     TESTING = False
+    ENGINE_PROFILE = engine_profiles['production']
     SQLALCHEMY_DATABASE_URI = (os.environ.get('TEST_DATABASE_URL') or
                                POSTGRES_CONNECTION + 'mdt_db')
 
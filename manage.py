@@ -1,16 +1,30 @@
 #!flask\Scripts\python.exe
+import logging
 import os
 
 from flask_debugtoolbar import DebugToolbarExtension
-from flask_script import Manager, Shell
+from flask_script import Command, Manager, Option, Shell
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate, MigrateCommand
 
 from mdt_app import create_app, db
+from mdt_app.counters import mismatched_counts, recount_actions
+from mdt_app.exporter import (EXPORTS, STATUSES, ExportFilter, csv_lines,
+                              write_xlsx)
+from mdt_app.importer import (BATCH_SIZE, IMPORTERS, RejectedReport,
+                              import_rows, read_rows)
+from mdt_app.jobs import work
+from mdt_app.main.explain import explain_all
+from mdt_app.main.meetings import parse_date
+from mdt_app.search import rebuild_index
+from mdt_app.seed import SeedSizes, seed as seed_database
 
 app = create_app(os.getenv('FLASK_CONFIG') or 'default')
 migrate = Migrate(app, db)
-toolbar = DebugToolbarExtension(app)
+# the toolbar is for development only, instrumentation.py reports
+# statements in production
+if app.debug:
+    DebugToolbarExtension(app)
 manager = Manager(app)
 
 
@@ -20,5 +34,158 @@ def make_shell_context():
 manager.add_command("shell", Shell(make_context=make_shell_context))
 manager.add_command('db', MigrateCommand)
 
+
+class ImportCommand(Command):
+    """Import patients, meetings, cases or actions from a CSV or XLSX file"""
+
+    option_list = (
+        Option('kind', choices=sorted(IMPORTERS),
+               help='What the rows of the file are'),
+        Option('path', help='CSV or XLSX file, first row is column names'),
+        Option('--rejected', dest='rejected', default=None,
+               help='Report of rows not imported, default is '
+                    'PATH.rejected.csv'),
+        Option('--batch-size', dest='batch_size', type=int,
+               default=BATCH_SIZE, help='Rows per INSERT and transaction'),
+    )
+
+    def run(self, kind, path, rejected, batch_size):
+        rejected = rejected or path + '.rejected.csv'
+        with RejectedReport(rejected) as report, \
+                db.engine.connect() as connection:
+            result = import_rows(connection, kind, read_rows(path), report,
+                                 batch_size)
+        print('{read} rows read, {inserted} {kind} imported, '
+              '{rejected} rejected'.format(kind=kind, **result._asdict()))
+        if result.rejected:
+            print('Rejected rows and reasons are in {}'.format(rejected))
+        if kind == 'cases':
+            print('Run rebuild_search_index to search the imported cases')
+
+manager.add_command('import', ImportCommand())
+
+
+class ExportCommand(Command):
+    """Export cases or actions to a CSV or XLSX file, by meeting date"""
+
+    option_list = (
+        Option('kind', choices=sorted(EXPORTS), help='What to export'),
+        Option('path', help='CSV or XLSX file to write, type from extension'),
+        Option('--start', dest='start', type=parse_date, default=None,
+               help='First meeting date, YYYY-MM-DD'),
+        Option('--end', dest='end', type=parse_date, default=None,
+               help='Last meeting date, YYYY-MM-DD'),
+        Option('--consultant', dest='consultant', default=None,
+               help='Username of consultant of the cases'),
+        Option('--status', dest='statuses', action='append',
+               choices=STATUSES, default=[],
+               help='Case status, can be given more than once'),
+    )
+
+    def run(self, kind, path, start, end, consultant, statuses):
+        header, rows = EXPORTS[kind](ExportFilter(start, end, consultant,
+                                                  statuses))
+        if path.lower().endswith('.xlsx'):
+            write_xlsx(header, rows, path)
+        else:
+            with open(path, 'w', newline='') as csv_file:
+                csv_file.writelines(csv_lines(header, rows))
+        print('{} exported to {}'.format(kind, path))
+
+manager.add_command('export', ExportCommand())
+
+
+class SeedCommand(Command):
+    """Fill an empty database with generated data, for scale testing"""
+
+    defaults = SeedSizes()
+    option_list = (
+        Option('--seed', dest='seed', type=int, default=0,
+               help='Seed of the random data, same seed gives same data'),
+        Option('--end', dest='end', type=parse_date, default=None,
+               help='Date of the last past meeting, YYYY-MM-DD, '
+                    'default today'),
+        Option('--years', dest='years', type=int, default=defaults.years,
+               help='Years of weekly meetings'),
+        Option('--users', dest='users', type=int, default=defaults.users,
+               help='Users who are not consultants'),
+        Option('--consultants', dest='consultants', type=int,
+               default=defaults.consultants, help='Consultants'),
+        Option('--patients', dest='patients', type=int,
+               default=defaults.patients, help='Patients'),
+        Option('--cases-per-meeting', dest='cases_per_meeting', type=float,
+               default=defaults.cases_per_meeting,
+               help='Mean cases a meeting'),
+        Option('--actions-per-case', dest='actions_per_case', type=float,
+               default=defaults.actions_per_case,
+               help='Mean actions a discussed case'),
+        Option('--attendees-per-meeting', dest='attendees_per_meeting',
+               type=int, default=defaults.attendees_per_meeting,
+               help='Most attendees of a meeting'),
+    )
+
+    def run(self, seed, end, **sizes):
+        with db.engine.connect() as connection:
+            counts = seed_database(connection, SeedSizes(**sizes), seed, end)
+        for table_name, count in counts.items():
+            print('{} {}'.format(count, table_name))
+        print('Users\' password is "password", run rebuild_search_index to '
+              'search the cases')
+
+manager.add_command('seed', SeedCommand())
+
+
+@manager.option('--fix', dest='fix', action='store_true', default=False,
+                help='Recount actions of cases with wrong counters')
+def check_action_counts(fix):
+    """Compare action counters on cases with their actions"""
+    mismatched = mismatched_counts()
+    for case_id, open_actions, total_actions, actual_open, actual_total in (
+            mismatched):
+        print('Case {id}: open {open} (actual {actual_open}), '
+              'total {total} (actual {actual_total})'.format(
+                  id=case_id, open=open_actions, actual_open=actual_open,
+                  total=total_actions, actual_total=actual_total))
+    print('{} cases with wrong action counters'.format(len(mismatched)))
+    if mismatched and fix:
+        recount_actions(db.session, [row[0] for row in mismatched])
+        db.session.commit()
+        print('Counters fixed')
+
+
+@manager.option('--no-analyze', dest='analyze', action='store_false',
+                default=True, help='Show plans without running the queries')
+def explain(analyze):
+    """Show query plans of the main queries of busy views"""
+    plans = explain_all(analyze)
+    if not plans:
+        print('No cases or actions to take query parameters from, '
+              'seed the database first')
+    for name, lines in plans.items():
+        print('== {} =='.format(name))
+        for line in lines:
+            print(line)
+        print()
+
+
+
+@manager.command
+def rebuild_search_index():
+    """Index all cases for search, replacing the existing index"""
+    count = rebuild_index(db.session)
+    print('{} cases indexed'.format(count))
+
+
+@manager.option('--threads', dest='threads', type=int, default=2,
+                help='Most jobs to run at once')
+@manager.option('--burst', dest='burst', action='store_true', default=False,
+                help='Stop once no jobs are queued')
+def worker(threads, burst):
+    """Run queued background jobs, e.g. pushing cases to the next meeting"""
+    logging.basicConfig(level=logging.INFO)
+    print('Worker running {} jobs at once, Ctrl+C to stop'.format(threads))
+    work(app, threads=threads, burst=burst)
+
+
 if __name__ == '__main__':
     manager.run()
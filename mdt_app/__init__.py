@@ -10,7 +10,6 @@ Forms and views are blueprint specific so are divided by admin, auth and main.
 
 from flask import Flask, render_template
 
-from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_bootstrap import Bootstrap
 from flask_login import LoginManager, current_user
@@ -18,12 +17,13 @@ from flask_admin import Admin
 
 from config import config
 from mdt_app.admin.views import (AdminModelView, CustomAdminModelView,
-                                 MyAdminIndexView)
+                                 MyAdminIndexView, ReadOnlyModelView)
+from mdt_app.routing import RoutingSQLAlchemy
 
 login_manager = LoginManager()
 login_manager.session_protection = 'strong'
 login_manager.login_view = 'auth.login'
-db = SQLAlchemy()
+db = RoutingSQLAlchemy()
 
 
 def create_app(config_name):
@@ -35,6 +35,9 @@ def create_app(config_name):
     Bootstrap(app)
     db.init_app(app)
     login_manager.init_app(app)
+    instrumentation.init_app(app)
+    conditional.init_app(app)
+    metrics.init_app(app)
 
     admin = Admin(template_mode='bootstrap3',
                   index_view=MyAdminIndexView())
@@ -45,6 +48,8 @@ def create_app(config_name):
     admin.add_view(AdminModelView(Case, db.session))
     admin.add_view(AdminModelView(Action, db.session))
     admin.add_view(AdminModelView(Attendee, db.session))
+    admin.add_view(AdminModelView(Job, db.session))
+    admin.add_view(ReadOnlyModelView(AuditEntry, db.session))
 
     from .main import main as main_blueprint
     app.register_blueprint(main_blueprint)
@@ -55,4 +60,7 @@ def create_app(config_name):
     return app
 
 # placed at end to avoid circular argument
-from mdt_app.models import User, Case, Meeting, Action, Patient, Attendee
+from mdt_app.models import (User, Case, Meeting, Action, Patient, Attendee,
+                            Job, AuditEntry)
+from mdt_app import (audit, conditional, counters, instrumentation, metrics,
+                     search)
@@ -1,12 +1,16 @@
 from flask import abort
-from flask_admin import Admin, AdminIndexView
+from flask_admin import Admin, AdminIndexView, expose
 from flask_admin.contrib.sqla import ModelView
 from flask_login import current_user
 
+from mdt_app.cache import all_caches
+
 
 class AdminModelView(ModelView):
     """Model view, must be admin to access"""
     page_size = 50  # the number of entries to display on the list view
+    # set by the model on insert and update
+    form_excluded_columns = ['updated_at']
 
     def is_accessible(self):
         if current_user.is_anonymous:
@@ -19,7 +23,12 @@ class AdminModelView(ModelView):
 
 
 class MyAdminIndexView(AdminIndexView):
-    """Index view, must be admin to access"""
+    """Index view, must be admin to access, shows stats of the caches"""
+    @expose()
+    def index(self):
+        caches = [cache.stats() for cache in all_caches()]
+        return self.render(self._template, caches=caches)
+
     def is_accessible(self):
         if current_user.is_anonymous:
             return False
@@ -33,3 +42,10 @@ class MyAdminIndexView(AdminIndexView):
 class CustomAdminModelView(AdminModelView):
     """Custom list template to show unconfirmed users with a row in red"""
     list_template = 'admin/list.html'
+
+
+class ReadOnlyModelView(AdminModelView):
+    """Model view that can't change rows, for the audit log"""
+    can_create = False
+    can_edit = False
+    can_delete = False
@@ -0,0 +1,296 @@
+"""
+Audit log of changes to cases, actions, meetings, patients, attendees and
+users
+
+A flush event records an entry for each audited row inserted, updated or
+deleted, with the columns that changed and their old and new values.
+Writing entries as part of each save would double its writes, so they are
+buffered: once the session commits they are handed to a background thread,
+which writes them with one multi-row INSERT per batch. Entries of a
+transaction that is rolled back are dropped. Bulk statements bypass the
+flush, so the helpers making them (push.push_cases and
+attendees.sync_attendees) pass their changes to record_bulk. The
+importer's inserts aren't audited.
+
+With AUDIT_ASYNC off in config, entries are inserted during the flush, in
+the same transaction as the changes, which the tests use.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import namedtuple
+from datetime import date, datetime
+
+from flask import _request_ctx_stack, current_app, has_app_context
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from . import db
+from .models import (Action, Attendee, AuditEntry, Case, Meeting, Patient,
+                     User)
+
+logger = logging.getLogger(__name__)
+
+AUDITED = (Case, Action, Meeting, Patient, Attendee, User)
+# columns recorded as changed without their values
+HIDDEN_COLUMNS = {'password_hash'}
+HIDDEN = '(hidden)'
+# columns not recorded, updated_at is when the entry was changed_on
+SKIPPED_COLUMNS = {'updated_at'}
+
+# rows per INSERT, 8 columns a row keeps under SQLite's 999 parameters
+BATCH_SIZE = 100
+# seconds the writer waits for more entries to fill a batch
+BATCH_INTERVAL = 1.0
+HISTORY_PER_PAGE = 50
+
+# entries -- list of (AuditEntry, username or None), newest first
+# older -- int: id to show entries before for the next page, None if last
+HistoryPage = namedtuple('HistoryPage', ['entries', 'older'])
+
+
+def _value(value, column):
+    if value is None:
+        return None
+    if column in HIDDEN_COLUMNS:
+        return HIDDEN
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def _user_id():
+    """Id of the logged in user, None outside a request or if anonymous
+
+    Only a user Flask-Login has already loaded is used, as loading it here
+    could query in the middle of a flush.
+    """
+    user = getattr(_request_ctx_stack.top, 'user', None)
+    return getattr(user, 'id', None)
+
+
+def _entry(instance, operation, user_id, now):
+    """Audit log row of an instance changed by a flush, None if no change"""
+    state = inspect(instance)
+    changes = {}
+    for prop in state.mapper.column_attrs:
+        column = prop.columns[0].name
+        if column in SKIPPED_COLUMNS:
+            continue
+        if operation == 'update':
+            history = state.attrs[prop.key].history
+            if not history.has_changes():
+                continue
+            old = history.deleted[0] if history.deleted else None
+            new = history.added[0] if history.added else None
+        elif operation == 'insert':
+            old, new = None, state.dict.get(prop.key)
+        else:
+            old, new = state.dict.get(prop.key), None
+        changes[column] = [_value(old, column), _value(new, column)]
+    if not changes:
+        return None
+    if isinstance(instance, Case):
+        case_id = instance.id
+    elif isinstance(instance, Action):
+        case_id = instance.case_id
+    else:
+        case_id = None
+    return {'table_name': state.mapper.local_table.name,
+            'row_id': instance.id,
+            'case_id': case_id,
+            'operation': operation,
+            'changes': json.dumps(changes, default=str),
+            'user_id': user_id,
+            'changed_on': now}
+
+
+def _entries(session):
+    user_id = _user_id()
+    now = datetime.utcnow()
+    entries = []
+    for instances, operation in ((session.new, 'insert'),
+                                 (session.dirty, 'update'),
+                                 (session.deleted, 'delete')):
+        for instance in instances:
+            if isinstance(instance, AUDITED):
+                entry = _entry(instance, operation, user_id, now)
+                if entry is not None:
+                    entries.append(entry)
+    return entries
+
+
+class AuditWriter:
+    """Writes audit entries to an engine in batches, on a background thread"""
+
+    def __init__(self, engine, batch_size=BATCH_SIZE,
+                 interval=BATCH_INTERVAL):
+        self.engine = engine
+        self.batch_size = batch_size
+        self.interval = interval
+        self.queue = queue.Queue()
+        self.thread = None
+        self.pid = None
+        self.lock = threading.Lock()
+
+    def put(self, entries):
+        self._start()
+        for entry in entries:
+            self.queue.put(entry)
+
+    def _start(self):
+        with self.lock:
+            # threads don't survive a fork, e.g. gunicorn preloading the app
+            if self.pid != os.getpid():
+                self.queue = queue.Queue()
+                self.thread = None
+            if self.thread is None or not self.thread.is_alive():
+                self.pid = os.getpid()
+                self.thread = threading.Thread(target=self._run,
+                                               name='audit-writer',
+                                               daemon=True)
+                self.thread.start()
+
+    def _next_batch(self):
+        """Entries queued within interval of the first, up to batch_size"""
+        batch = [self.queue.get()]
+        deadline = time.time() + self.interval
+        while len(batch) < self.batch_size and batch[-1] is not None:
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            # None is put on the queue to stop
+            stop = batch[-1] is None
+            batch = [entry for entry in batch if entry is not None]
+            if batch:
+                self.write(batch)
+            if stop:
+                return
+
+    def write(self, batch):
+        try:
+            with self.engine.begin() as connection:
+                connection.execute(AuditEntry.__table__.insert().values(batch))
+        except Exception:
+            logger.exception('%s audit entries could not be written',
+                             len(batch))
+
+    def stop(self, timeout=5):
+        """Write the entries queued so far, then stop the thread"""
+        if (self.thread is not None and self.thread.is_alive() and
+                self.pid == os.getpid()):
+            self.queue.put(None)
+            self.thread.join(timeout)
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_writer(engine):
+    """AuditWriter of an engine, made the first time"""
+    with _writers_lock:
+        if engine not in _writers:
+            _writers[engine] = AuditWriter(engine)
+        return _writers[engine]
+
+
+@atexit.register
+def _stop_writers():
+    for writer in list(_writers.values()):
+        writer.stop()
+
+
+def _is_async():
+    return not has_app_context() or current_app.config.get('AUDIT_ASYNC',
+                                                           True)
+
+
+def _record(session, entries):
+    if not entries:
+        return
+    if _is_async():
+        session.info.setdefault('audit_entries', []).extend(entries)
+    else:
+        session.connection().execute(AuditEntry.__table__.insert(), entries)
+
+
+def record_bulk(session, model, operation, changes):
+    """Record rows changed by a bulk statement, which bypasses the flush
+
+    Arguments:
+    session -- session the statement ran in, entries are written when it
+               commits
+    model -- audited model of the rows, e.g. Case
+    operation -- str: 'insert', 'update' or 'delete'
+    changes -- iterable of (row id, case id or None, dict of column name:
+               (old value, new value))
+    """
+    user_id = _user_id()
+    now = datetime.utcnow()
+    _record(session, [
+        {'table_name': model.__table__.name,
+         'row_id': row_id,
+         'case_id': case_id,
+         'operation': operation,
+         'changes': json.dumps({column: [_value(old, column),
+                                         _value(new, column)]
+                                for column, (old, new) in columns.items()},
+                               default=str),
+         'user_id': user_id,
+         'changed_on': now}
+        for row_id, case_id, columns in changes])
+
+
+@event.listens_for(Session, 'after_flush')
+def _record_changes(session, flush_context):
+    _record(session, _entries(session))
+
+
+@event.listens_for(Session, 'after_commit')
+def _write_entries(session):
+    entries = session.info.pop('audit_entries', None)
+    if entries:
+        get_writer(session.get_bind(AuditEntry.__mapper__)).put(entries)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_entries(session, previous_transaction):
+    session.info.pop('audit_entries', None)
+
+
+def case_history(case_id, before=None, per_page=HISTORY_PER_PAGE):
+    """One page of changes to a case and its actions, newest first
+
+    Pages by entry id (keyset pagination) using the index on
+    audit_log(case_id, id), so a page reads only its own entries however
+    long the history is.
+
+    Arguments:
+    case_id -- int: case id
+    before -- int: show entries with an id below this (older entries)
+    per_page -- int: number of entries on a page
+
+    Returns HistoryPage
+    """
+    query = (db.session.query(AuditEntry, User.username)
+                       .outerjoin(User, AuditEntry.user_id == User.id)
+                       .filter(AuditEntry.case_id == case_id))
+    if before is not None:
+        query = query.filter(AuditEntry.id < before)
+    rows = query.order_by(AuditEntry.id.desc()).limit(per_page + 1).all()
+    older = rows[per_page - 1][0].id if len(rows) > per_page else None
+    return HistoryPage(rows[:per_page], older)
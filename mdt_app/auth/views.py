@@ -7,6 +7,7 @@ from .. import db
 from ..models import User
 from .forms import *
 from ..decorators import admin_required
+from ..instrumentation import query_budget
 
 
 @auth.before_app_request
@@ -28,6 +29,7 @@ def unconfirmed():
 
 
 @auth.route('/login', methods=['GET', 'POST'])
+@query_budget(3)
 def login():
     """Login by user.verify_password"""
     form = LoginForm()
@@ -80,9 +82,10 @@ def change_password():
     """Change password"""
     form = ChangePasswordForm()
     if form.validate_on_submit():
-        if current_user.verify_password(form.old_password.data):
-            current_user.password = form.password.data
-            db.session.add(current_user)
+        # current_user is from the cache, without its password hash
+        user = User.query.get(current_user.id)
+        if user.verify_password(form.old_password.data):
+            user.password = form.password.data
             db.session.commit()
             flash('Your password has been updated.', category='success')
             return redirect(url_for('main.index'))
@@ -0,0 +1,133 @@
+"""
+Small in-process caches
+
+Each gunicorn worker has its own copy of a cache and can only invalidate
+its own entries, so entries also expire after a time to live.
+All caches are registered so that their stats can be reported and so that
+they can all be cleared (e.g. between tests).
+
+invalidate_on_commit removes a cache's entries when changes to them are
+flushed, and again when the session commits or rolls back, as another
+request may fill the cache with the old values between the flush and the
+commit, or with the values of a flush that is then rolled back.
+"""
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+_caches = []
+_missing = object()
+# returned by keys_for_flush of invalidate_on_commit to remove every entry
+ALL_KEYS = object()
+
+
+class TTLCache:
+    """Dictionary cache with expiry of entries and hit/miss counters
+
+    Arguments:
+    name -- str: name used when reporting stats
+    ttl -- float: seconds before an entry expires
+    """
+
+    def __init__(self, name, ttl):
+        self.name = name
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = {}
+        self._lock = threading.Lock()
+        _caches.append(self)
+
+    def get(self, key, default=None):
+        """Return cached value for key, or default if missing or expired"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            self._data.pop(key, None)
+            return default
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+
+    def get_or_set(self, key, create):
+        """Return cached value for key, calling create() to fill a miss"""
+        value = self.get(key, _missing)
+        if value is _missing:
+            value = create()
+            self.set(key, value)
+        return value
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        """Dictionary of name, number of entries, hits and misses"""
+        return {'name': self.name, 'entries': len(self._data),
+                'hits': self.hits, 'misses': self.misses}
+
+
+def all_caches():
+    """All caches created in this process"""
+    return list(_caches)
+
+
+def clear_all():
+    """Remove every entry from every cache"""
+    for cache in _caches:
+        cache.clear()
+
+
+def invalidate_on_commit(cache, keys_for_flush):
+    """Remove entries of cache changed through the ORM
+
+    Arguments:
+    cache -- TTLCache
+    keys_for_flush -- function of a session, called after it flushes,
+                      returning an iterable of the keys changed by the
+                      flush, or ALL_KEYS
+
+    Returns function(keys, session=None) for changes made without the ORM,
+    removing keys (an iterable or ALL_KEYS) now and, if session is given,
+    again when it commits or rolls back.
+    """
+    info_key = 'invalidate_{}'.format(cache.name)
+
+    def invalidate(keys, session=None):
+        if keys is ALL_KEYS:
+            cache.clear()
+        else:
+            keys = set(keys)
+            for key in keys:
+                cache.invalidate(key)
+        if session is not None:
+            pending = session.info.get(info_key, set())
+            if keys is ALL_KEYS or pending is ALL_KEYS:
+                session.info[info_key] = ALL_KEYS
+            else:
+                session.info[info_key] = pending | keys
+
+    def after_flush(session, flush_context):
+        keys = keys_for_flush(session)
+        if keys:
+            invalidate(keys, session)
+
+    def after_end(session, *args):
+        keys = session.info.pop(info_key, None)
+        if keys:
+            invalidate(keys)
+
+    event.listen(Session, 'after_flush', after_flush)
+    event.listen(Session, 'after_commit', after_end)
+    event.listen(Session, 'after_soft_rollback', after_end)
+    return invalidate
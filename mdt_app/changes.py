@@ -0,0 +1,95 @@
+"""
+Change feed of rows inserted or updated since a cursor, for incremental sync
+
+Every feed table has an updated_at column, set on insert and on each update
+(including bulk updates through the ORM or Core, which apply its onupdate),
+and an index on (updated_at, id). A page of the feed is the next rows in
+(updated_at, id) order after the cursor, so pages read only their own rows
+through the index and rows changed at the same time are neither repeated
+nor skipped.
+
+updated_at is set when the row is flushed, not when its transaction
+commits, so a row can become visible after rows with a later updated_at.
+The feed stays CHANGES_SETTLE_SECONDS (config) behind now so such rows are
+not passed over.
+
+Deleted rows are not in the feed. Every delete of a feed table, including
+attendees removed in bulk by sync_attendees, is an entry of the audit log
+(see audit.py) with that table_name and operation 'delete', and the
+deleted row's id as row_id. A client syncing deletes reads those entries
+in id order after the last id it has seen.
+"""
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import and_, or_, select
+
+from . import db
+from .models import Action, Attendee, Case, Meeting, Patient, User
+
+# table name: model
+FEED_MODELS = {model.__tablename__: model for model
+               in (Case, Action, Meeting, Patient, Attendee, User)}
+# columns left out of the feed
+HIDDEN_COLUMNS = {'password_hash'}
+FEED_LIMIT = 500
+MAX_FEED_LIMIT = 5000
+CURSOR_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+# rows -- list of dict: column name: value, dates as ISO 8601 strings
+# cursor -- str: cursor to get the rows after these, None if there are none
+# has_more -- bool: whether there are more rows after the cursor
+ChangesPage = namedtuple('ChangesPage', ['rows', 'cursor', 'has_more'])
+
+
+def format_cursor(updated_at, row_id):
+    return '{},{}'.format(updated_at.strftime(CURSOR_FORMAT), row_id)
+
+
+def parse_cursor(cursor):
+    """(updated_at, id) of a cursor, raises ValueError if it isn't one"""
+    updated_at, row_id = cursor.split(',')
+    return datetime.strptime(updated_at, CURSOR_FORMAT), int(row_id)
+
+
+def _value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def changed_rows(table_name, since=None, limit=FEED_LIMIT):
+    """Next page of rows of a table inserted or updated after a cursor
+
+    Arguments:
+    table_name -- str: name of a table in FEED_MODELS
+    since -- (datetime, int): parsed cursor, None to start from the first row
+    limit -- int: most rows on the page
+
+    Returns ChangesPage, with the since cursor if there are no new rows
+    """
+    table = FEED_MODELS[table_name].__table__
+    updated_at, row_id = table.c.updated_at, table.c.id
+    query = select([column for column in table.columns
+                    if column.name not in HIDDEN_COLUMNS])
+    settle = current_app.config.get('CHANGES_SETTLE_SECONDS', 0)
+    if settle:
+        query = query.where(
+            updated_at <= datetime.utcnow() - timedelta(seconds=settle))
+    if since is not None:
+        since_updated_at, since_id = since
+        query = query.where(or_(updated_at > since_updated_at,
+                                and_(updated_at == since_updated_at,
+                                     row_id > since_id)))
+    query = query.order_by(updated_at, row_id).limit(limit + 1)
+    rows = db.session.execute(query).fetchall()
+
+    page = rows[:limit]
+    if page:
+        cursor = format_cursor(page[-1].updated_at, page[-1].id)
+    else:
+        cursor = format_cursor(*since) if since is not None else None
+    return ChangesPage([{key: _value(value) for key, value in row.items()}
+                        for row in page],
+                       cursor, len(rows) > limit)
@@ -0,0 +1,122 @@
+"""
+Conditional GET for list pages
+
+The conditional decorator gives a view an ETag from a version: columns
+from a function of the view (see main/versions.py), run as one query
+before the view. When the browser already has the page for that version
+(If-None-Match) the response is 304 Not Modified and the view isn't run,
+so refreshing an unchanged page doesn't load its rows or render its
+template. No Last-Modified is sent, as the latest updated_at doesn't
+change when rows are deleted, nor for the user, release or CSRF period.
+If-Modified-Since on its own is answered with the page.
+
+The ETag also covers the user, so a page isn't shared between users, the
+release (ETAG_RELEASE in config, by default the newest file of the app),
+so pages are rendered again after a deploy, and the period of the page's
+CSRF token, so a page kept by the browser never has an expired token.
+Pages are sent with Cache-Control: private, no-cache, so the browser asks
+each time before showing its copy.
+
+A page isn't made conditional while there are flashed messages to show, or
+while its last change is less than CONDITIONAL_SETTLE_SECONDS old, as a
+transaction still committing may have set an earlier updated_at than the
+latest one read, which wouldn't change the version when it commits.
+"""
+import hashlib
+import os
+import time
+from datetime import datetime, timedelta
+from functools import wraps
+
+from flask import current_app, make_response, request, session
+from flask_login import current_user
+from sqlalchemy import select
+from werkzeug.http import is_resource_modified
+
+from . import db
+
+
+def _newest_file(directory):
+    """Modification time of the newest source file in directory, as str"""
+    newest = 0
+    for path, _, filenames in os.walk(directory):
+        for filename in filenames:
+            if filename.endswith('.pyc'):
+                continue
+            newest = max(newest,
+                         os.path.getmtime(os.path.join(path, filename)))
+    return str(int(newest))
+
+
+def _csrf_period():
+    """Period of half the CSRF time limit, None if tokens don't expire
+
+    A page is reused within a period, so its token has at least half the
+    time limit left.
+    """
+    time_limit = current_app.config.get('WTF_CSRF_TIME_LIMIT', 3600)
+    if not current_app.config.get('WTF_CSRF_ENABLED', True) or not time_limit:
+        return None
+    return int(time.time() // (time_limit / 2))
+
+
+def _etag(version):
+    """ETag of a version row, None if it changed too recently
+
+    Arguments:
+    version -- tuple: values of the version's columns
+    """
+    changed = [value for value in version if isinstance(value, datetime)]
+    last_change = max(changed) if changed else None
+    settle = timedelta(
+        seconds=current_app.config.get('CONDITIONAL_SETTLE_SECONDS', 10))
+    if last_change is not None and datetime.utcnow() - last_change < settle:
+        return None
+    key = repr((current_app.config['ETAG_RELEASE'], current_user.get_id(),
+                _csrf_period(), tuple(version)))
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def conditional(version):
+    """Decorator answering GET requests to a view with 304 Not Modified
+    when its version hasn't changed
+
+    Place it below login_required.
+
+    Arguments:
+    version -- function taking the view's arguments and returning a list
+               of column expressions (see main/versions.py), or None for
+               requests that aren't conditional
+    """
+    def decorator(view):
+        @wraps(view)
+        def conditional_view(*args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or '_flashes' in session:
+                return view(*args, **kwargs)
+            columns = version(*args, **kwargs)
+            if columns is None:
+                return view(*args, **kwargs)
+            row = ()
+            if columns:
+                row = db.session.execute(select(columns)).first()
+            etag = _etag(row)
+            if etag is None:
+                return view(*args, **kwargs)
+            if is_resource_modified(request.environ, etag=etag):
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            else:
+                response = current_app.response_class(status=304)
+            response.set_etag(etag)
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            response.vary.add('Cookie')
+            return response
+        return conditional_view
+    return decorator
+
+
+def init_app(app):
+    if not app.config.get('ETAG_RELEASE'):
+        app.config['ETAG_RELEASE'] = _newest_file(app.root_path)
@@ -0,0 +1,152 @@
+"""
+Action counters on cases
+
+Case.open_actions and Case.total_actions let views decide a case's status
+without loading its actions. Mapper events on Action change the counters
+in the same transaction whenever an action is inserted, deleted, completed
+or moved to another case. Bulk statements bypass these events, so anything
+writing actions in bulk must call recount_actions for the cases it changed.
+"""
+from sqlalchemy import and_, event, func, inspect, select
+from sqlalchemy.orm import Session, object_session
+
+from . import db
+from .models import Action, Case
+
+cases = Case.__table__
+actions = Action.__table__
+
+
+def _open(is_completed):
+    return 0 if is_completed else 1
+
+
+def _adjust(connection, case_id, open_change, total_change):
+    """Add to the counters of a case, in SQL so concurrent changes add up"""
+    connection.execute(cases.update()
+                            .where(cases.c.id == case_id)
+                            .values(open_actions=(cases.c.open_actions +
+                                                  open_change),
+                                    total_actions=(cases.c.total_actions +
+                                                   total_change)))
+
+
+def _counted_queries():
+    """Correlated subqueries counting a case's open and total actions"""
+    total = (select([func.count(actions.c.id)])
+             .where(actions.c.case_id == cases.c.id)
+             .as_scalar())
+    open_ = (select([func.count(actions.c.id)])
+             .where(and_(actions.c.case_id == cases.c.id,
+                         actions.c.is_completed == False))
+             .as_scalar())
+    return open_, total
+
+
+def recount_actions(connection, case_ids=None):
+    """Set counters of cases from their actions
+
+    Arguments:
+    connection -- connection or session to run the update on
+    case_ids -- iterable of case ids, None for all cases
+    """
+    open_, total = _counted_queries()
+    update = cases.update().values(open_actions=open_, total_actions=total)
+    if case_ids is not None:
+        case_ids = list(case_ids)
+        if not case_ids:
+            return
+        update = update.where(cases.c.id.in_(case_ids))
+    connection.execute(update)
+
+
+def mismatched_counts():
+    """Cases whose counters don't match their actions
+
+    Returns list of (case id, open_actions, total_actions, actual open,
+    actual total)
+    """
+    open_, total = _counted_queries()
+    query = (select([cases.c.id, cases.c.open_actions, cases.c.total_actions,
+                     open_, total])
+             .where((cases.c.open_actions != open_) |
+                    (cases.c.total_actions != total))
+             .order_by(cases.c.id))
+    return db.session.execute(query).fetchall()
+
+
+_unknown = object()
+
+
+def _committed_value(state, key):
+    """Value of attribute in the database, _unknown if it wasn't loaded"""
+    history = state.attrs[key].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    return _unknown
+
+
+def _changed(target, case_ids):
+    """Remember cases changed in this flush, to expire them afterwards"""
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('counted_case_ids', set()).update(case_ids)
+
+
+@event.listens_for(Action, 'after_insert')
+def _action_inserted(mapper, connection, target):
+    _adjust(connection, target.case_id, _open(target.is_completed), 1)
+    _changed(target, [target.case_id])
+
+
+@event.listens_for(Action, 'after_delete')
+def _action_deleted(mapper, connection, target):
+    state = inspect(target)
+    case_id = _committed_value(state, 'case_id')
+    if case_id is _unknown:
+        case_id = target.case_id
+    was_completed = _committed_value(state, 'is_completed')
+    if was_completed is _unknown:
+        recount_actions(connection, [case_id])
+    else:
+        _adjust(connection, case_id, -_open(was_completed), -1)
+    _changed(target, [case_id])
+
+
+@event.listens_for(Action, 'after_update')
+def _action_updated(mapper, connection, target):
+    state = inspect(target)
+    if not (state.attrs.case_id.history.has_changes() or
+            state.attrs.is_completed.history.has_changes()):
+        return
+    old_case_id = _committed_value(state, 'case_id')
+    was_completed = _committed_value(state, 'is_completed')
+    if old_case_id is _unknown or was_completed is _unknown:
+        # old value wasn't loaded before it was changed, so count again
+        case_ids = {target.case_id}
+        if old_case_id is not _unknown:
+            case_ids.add(old_case_id)
+        recount_actions(connection, case_ids)
+    elif old_case_id == target.case_id:
+        _adjust(connection, target.case_id,
+                _open(target.is_completed) - _open(was_completed), 0)
+        case_ids = {target.case_id}
+    else:
+        _adjust(connection, old_case_id, -_open(was_completed), -1)
+        _adjust(connection, target.case_id, _open(target.is_completed), 1)
+        case_ids = {old_case_id, target.case_id}
+    _changed(target, case_ids)
+
+
+@event.listens_for(Session, 'after_flush_postexec')
+def _expire_counters(session, flush_context):
+    """Counters were changed in SQL, so reload them when next used"""
+    case_ids = session.info.pop('counted_case_ids', None)
+    if not case_ids:
+        return
+    for instance in list(session.identity_map.values()):
+        if isinstance(instance, Case) and instance.id in case_ids:
+            session.expire(instance, ['open_actions', 'total_actions',
+                                      'updated_at'])
@@ -1,6 +1,7 @@
+import hmac
 from functools import wraps
 
-from flask import abort
+from flask import abort, current_app, request
 
 from flask_login import current_user
 
@@ -13,3 +14,22 @@ def admin_required(func):
             return func(*args, **kwargs)
         return decorated_function
     return decorator(func)
+
+
+def admin_or_token(token_key):
+    """Decorator allowing admins, and requests with the token of config
+    token_key as a bearer token in the Authorization header, e.g. from a
+    scraper that can't log in"""
+    def decorator(func):
+        @wraps(func)
+        def decorated_function(*args, **kwargs):
+            token = current_app.config.get(token_key)
+            authorization = request.headers.get('Authorization', '')
+            if not (token and hmac.compare_digest(
+                    authorization.encode('utf-8'),
+                    'Bearer {}'.format(token).encode('utf-8'))):
+                if current_user.is_anonymous or not current_user.is_admin:
+                    abort(403)
+            return func(*args, **kwargs)
+        return decorated_function
+    return decorator
@@ -0,0 +1,180 @@
+"""
+Export of cases and actions to CSV or XLSX
+
+Rows are read with yield_per, which on Postgres uses a server side cursor,
+and written out as they are read, so memory use doesn't grow with the size
+of the export. Columns have the same names as the columns read by the
+importer, so an export can be imported into another database.
+"""
+import csv
+import tempfile
+from collections import namedtuple
+
+from sqlalchemy.orm import aliased
+
+from . import db
+from .models import Action, Case, Meeting, Patient, User
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+YIELD_PER = 1000
+# bytes read at a time when streaming an XLSX file
+CHUNK_SIZE = 64 * 1024
+
+STATUSES = ('TBD', 'DISC', 'COMP')
+# file types exports can be downloaded as, XLSX needs openpyxl
+FILE_TYPES = ('csv', 'xlsx') if openpyxl else ('csv',)
+
+# start, end -- date: first and last meeting dates to export, None for all
+# consultant -- str: username of consultant of the cases, None for all
+# statuses -- list of case statuses to export, empty for all
+ExportFilter = namedtuple('ExportFilter', ['start', 'end', 'consultant',
+                                           'statuses'])
+ExportFilter.__new__.__defaults__ = (None, None, None, ())
+
+
+def _case_columns(consultant, created_by):
+    return [('meeting', Meeting.date),
+            ('hospital_number', Patient.hospital_number),
+            ('first_name', Patient.first_name),
+            ('last_name', Patient.last_name),
+            ('date_of_birth', Patient.date_of_birth),
+            ('consultant', consultant.username),
+            ('created_by', created_by.username),
+            ('created_on', Case.created_on),
+            ('status', Case.status),
+            ('mdt_vcmg', Case.mdt_vcmg),
+            ('clinic_code', Case.clinic_code),
+            ('next_opa', Case.next_opa),
+            ('medical_history', Case.medical_history),
+            ('question', Case.question),
+            ('discussion', Case.discussion),
+            ('planned_surgery', Case.planned_surgery),
+            ('surgery_date', Case.surgery_date),
+            ('open_actions', Case.open_actions),
+            ('total_actions', Case.total_actions)]
+
+
+def _action_columns(assigned_to):
+    return [('meeting', Meeting.date),
+            ('hospital_number', Patient.hospital_number),
+            ('first_name', Patient.first_name),
+            ('last_name', Patient.last_name),
+            ('status', Case.status),
+            ('action', Action.action),
+            ('assigned_to', assigned_to.username),
+            ('is_completed', Action.is_completed)]
+
+
+def _filter_cases(query, export_filter, consultant):
+    if export_filter.start is not None:
+        query = query.filter(Meeting.date >= export_filter.start)
+    if export_filter.end is not None:
+        query = query.filter(Meeting.date <= export_filter.end)
+    if export_filter.consultant:
+        query = query.filter(consultant.username == export_filter.consultant)
+    if export_filter.statuses:
+        query = query.filter(Case.status.in_(export_filter.statuses))
+    return query
+
+
+def case_rows(export_filter):
+    """Header and rows of cases, by meeting date then case
+
+    Returns tuple of (list of column names, iterator of rows)
+    """
+    consultant = aliased(User)
+    created_by = aliased(User)
+    columns = _case_columns(consultant, created_by)
+    query = (db.session.query(*[column for name, column in columns])
+                       .select_from(Case)
+                       .join(Meeting, Case.meeting_id == Meeting.id)
+                       .join(Patient, Case.patient_id == Patient.id)
+                       .join(consultant, Case.consultant_id == consultant.id)
+                       .join(created_by, Case.created_by_id == created_by.id)
+                       .order_by(Meeting.date, Case.id))
+    query = _filter_cases(query, export_filter, consultant)
+    return [name for name, column in columns], query.yield_per(YIELD_PER)
+
+
+def action_rows(export_filter):
+    """Header and rows of actions, filtered by their case
+
+    Returns tuple of (list of column names, iterator of rows)
+    """
+    consultant = aliased(User)
+    assigned_to = aliased(User)
+    columns = _action_columns(assigned_to)
+    query = (db.session.query(*[column for name, column in columns])
+                       .select_from(Action)
+                       .join(Case, Action.case_id == Case.id)
+                       .join(Meeting, Case.meeting_id == Meeting.id)
+                       .join(Patient, Case.patient_id == Patient.id)
+                       .join(consultant, Case.consultant_id == consultant.id)
+                       .join(assigned_to,
+                             Action.assigned_to_id == assigned_to.id)
+                       .order_by(Meeting.date, Case.id, Action.id))
+    query = _filter_cases(query, export_filter, consultant)
+    return [name for name, column in columns], query.yield_per(YIELD_PER)
+
+
+EXPORTS = {'cases': case_rows,
+           'actions': action_rows}
+
+
+class _Line:
+    """File-like object that keeps the last line a csv writer wrote"""
+
+    def write(self, line):
+        self.line = line
+
+
+def _cell(value):
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'yes' if value else 'no'
+    return value
+
+
+def csv_lines(header, rows):
+    """Lines of CSV text for header and rows, made as they are read"""
+    line = _Line()
+    writer = csv.writer(line)
+    writer.writerow(header)
+    yield line.line
+    for row in rows:
+        writer.writerow([_cell(value) for value in row])
+        yield line.line
+
+
+def write_xlsx(header, rows, xlsx_file):
+    """Write header and rows to an XLSX file
+
+    Uses a write only workbook, which writes rows to a temporary file as
+    they are added rather than keeping them.
+    """
+    if openpyxl is None:
+        raise ImportError('openpyxl must be installed to export XLSX files')
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(header)
+    for row in rows:
+        sheet.append([_cell(value) for value in row])
+    workbook.save(xlsx_file)
+
+
+def xlsx_chunks(header, rows):
+    """Bytes of an XLSX file for header and rows, in chunks
+
+    XLSX is a zip file, so can't be sent until it is complete. It is built
+    in a temporary file and then read back a chunk at a time.
+    """
+    with tempfile.TemporaryFile() as xlsx_file:
+        write_xlsx(header, rows, xlsx_file)
+        xlsx_file.seek(0)
+        for chunk in iter(lambda: xlsx_file.read(CHUNK_SIZE), b''):
+            yield chunk
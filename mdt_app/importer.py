@@ -0,0 +1,474 @@
+"""
+Bulk import of patients, meetings, cases and actions from spreadsheets
+
+Rows are read one at a time from a CSV or XLSX file (XLSX needs openpyxl),
+checked with the same rules as the forms, and written with multi-row
+INSERTs, batch_size rows per transaction. Instead of a query per row, the
+unique keys already in the database are loaded into sets up front, and keys
+of imported rows are added as they are accepted, so duplicates within the
+file are caught too. Rows that can't be imported are written to a rejected
+rows report with the reason, which is only created if there are any.
+
+Import patients and meetings before the cases that refer to them, and
+cases before their actions. The inserts bypass the ORM, so the action
+counters of cases are recounted after actions are imported, and the search
+index should be rebuilt after cases are imported.
+"""
+import csv
+from collections import namedtuple
+from datetime import date, datetime
+
+from sqlalchemy import select
+from sqlalchemy.exc import DBAPIError
+
+from .counters import recount_actions
+from .models import Action, Case, Meeting, Patient, User
+from config import date_style
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+BATCH_SIZE = 1000
+
+# Date formats that can be used in files, as well as spreadsheet dates
+DATE_FORMATS = (date_style['format'], '%Y-%m-%d', '%d/%m/%Y')
+
+TRUE_VALUES = ('y', 'yes', 'true', '1')
+FALSE_VALUES = ('', 'n', 'no', 'false', '0')
+
+# read -- int: rows read from the file
+# inserted -- int: rows inserted
+# rejected -- int: rows written to the rejected rows report
+ImportResult = namedtuple('ImportResult', ['read', 'inserted', 'rejected'])
+
+
+class RowError(Exception):
+    """Row can't be imported, the message is the reason"""
+
+
+def _text(value):
+    """Cell value as stripped text, '' for empty cells"""
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        # spreadsheets store numbers such as hospital numbers as floats
+        value = int(value)
+    return str(value).strip()
+
+
+def read_csv(path):
+    """Rows of a CSV file as dicts, header row gives the keys"""
+    with open(path, newline='', encoding='utf-8-sig') as csv_file:
+        for row in csv.DictReader(csv_file):
+            yield row
+
+
+def read_xlsx(path):
+    """Rows of the first sheet of an XLSX file as dicts, header row gives
+    the keys"""
+    if openpyxl is None:
+        raise ImportError('openpyxl must be installed to import XLSX files')
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows()
+        header = [_text(cell.value) for cell in next(rows, ())]
+        for row in rows:
+            yield dict(zip(header, (cell.value for cell in row)))
+    finally:
+        workbook.close()
+
+
+def read_rows(path):
+    """Rows of a CSV or XLSX file, by the file extension"""
+    if path.lower().endswith('.xlsx'):
+        return read_xlsx(path)
+    return read_csv(path)
+
+
+class Importer:
+    """Checks rows and makes the values to insert for one table
+
+    Subclasses set table and columns, and define prepare. load is called
+    before the first row, and finish after the last.
+
+    Arguments:
+    connection -- connection to load existing keys with
+    """
+    table = None
+    # columns the file must have
+    columns = ()
+
+    def __init__(self, connection):
+        self.load(connection)
+
+    def load(self, connection):
+        """Load keys and ids of existing rows"""
+
+    def prepare(self, row):
+        """Values to insert for a row, raise RowError if not valid
+
+        Arguments:
+        row -- dict of column name: cell value from the file
+        """
+        raise NotImplementedError
+
+    def finish(self, connection):
+        """Run after all rows are inserted"""
+
+    def _select(self, connection, *columns):
+        return connection.execute(select(columns))
+
+    # checks of single values, following the rules of the forms
+
+    def required(self, row, name, max_length=None):
+        value = _text(row.get(name))
+        if not value:
+            raise RowError('{} is required'.format(name))
+        return self.length(value, name, max_length)
+
+    def optional(self, row, name, max_length=None):
+        return self.length(_text(row.get(name)), name, max_length) or None
+
+    def length(self, value, name, max_length):
+        if max_length is not None and len(value) > max_length:
+            raise RowError('{} is longer than {} characters'.format(
+                name, max_length))
+        return value
+
+    def date(self, row, name, required=True):
+        value = row.get(name)
+        if isinstance(value, datetime):
+            return value.date()
+        if isinstance(value, date):
+            return value
+        value = _text(value)
+        if not value:
+            if required:
+                raise RowError('{} is required'.format(name))
+            return None
+        for date_format in DATE_FORMATS:
+            try:
+                return datetime.strptime(value, date_format).date()
+            except ValueError:
+                continue
+        raise RowError('{} "{}" is not a date ({})'.format(
+            name, value, date_style['help']))
+
+    def boolean(self, row, name):
+        value = _text(row.get(name)).lower()
+        if value in TRUE_VALUES:
+            return True
+        if value in FALSE_VALUES:
+            return False
+        raise RowError('{} "{}" is not yes or no'.format(name, value))
+
+    def choice(self, value, name, choices):
+        if value not in choices:
+            raise RowError('{} "{}" is not one of {}'.format(
+                name, value, ', '.join(choices)))
+        return value
+
+
+class PatientImporter(Importer):
+    table = Patient.__table__
+    columns = ('hospital_number', 'first_name', 'last_name', 'date_of_birth',
+               'sex')
+
+    def load(self, connection):
+        patients = Patient.__table__.c
+        self.hospital_numbers = set()
+        self.people = set()
+        for hospital_number, first_name, last_name, date_of_birth in (
+                self._select(connection, patients.hospital_number,
+                             patients.first_name, patients.last_name,
+                             patients.date_of_birth)):
+            self.hospital_numbers.add(hospital_number)
+            self.people.add((first_name, last_name, date_of_birth))
+
+    def prepare(self, row):
+        hospital_number = self.required(row, 'hospital_number').upper()
+        if len(hospital_number) != 8:
+            raise RowError('hospital_number must be 8 characters')
+        first_name = self.required(row, 'first_name', 255).title()
+        last_name = self.required(row, 'last_name', 255).upper()
+        date_of_birth = self.date(row, 'date_of_birth')
+        sex = self.choice(self.required(row, 'sex').upper()[:1], 'sex',
+                          ('F', 'M'))
+        if hospital_number in self.hospital_numbers:
+            raise RowError('Patient with hospital number already exists')
+        person = (first_name, last_name, date_of_birth)
+        if person in self.people:
+            raise RowError('Patient with same first name, last name and '
+                           'date of birth already exists')
+        self.hospital_numbers.add(hospital_number)
+        self.people.add(person)
+        return {'hospital_number': hospital_number, 'first_name': first_name,
+                'last_name': last_name, 'date_of_birth': date_of_birth,
+                'sex': sex}
+
+
+class MeetingImporter(Importer):
+    table = Meeting.__table__
+    columns = ('date',)
+
+    def load(self, connection):
+        self.dates = {meeting_date for (meeting_date,) in
+                      self._select(connection, Meeting.__table__.c.date)}
+
+    def prepare(self, row):
+        meeting_date = self.date(row, 'date')
+        if meeting_date in self.dates:
+            raise RowError('Meeting on this date already exists')
+        self.dates.add(meeting_date)
+        return {'date': meeting_date,
+                'comment': self.optional(row, 'comment', 255),
+                'is_cancelled': self.boolean(row, 'is_cancelled')}
+
+
+class _CaseLookups:
+    """Ids of patients, meetings and cases from their keys in files"""
+
+    def load_lookups(self, connection):
+        patients = Patient.__table__.c
+        meetings = Meeting.__table__.c
+        self.patient_ids = dict(self._select(connection,
+                                             patients.hospital_number,
+                                             patients.id).fetchall())
+        self.meeting_ids = dict(self._select(connection, meetings.date,
+                                             meetings.id).fetchall())
+
+    def case_keys(self, row):
+        """(patient id, meeting id) of the case a row refers to"""
+        hospital_number = self.required(row, 'hospital_number').upper()
+        meeting_date = self.date(row, 'meeting')
+        if hospital_number not in self.patient_ids:
+            raise RowError('No patient with hospital number {}'.format(
+                hospital_number))
+        if meeting_date not in self.meeting_ids:
+            raise RowError('No meeting on {}'.format(meeting_date))
+        return (self.patient_ids[hospital_number],
+                self.meeting_ids[meeting_date])
+
+
+class CaseImporter(_CaseLookups, Importer):
+    table = Case.__table__
+    columns = ('hospital_number', 'meeting', 'consultant', 'created_by',
+               'medical_history', 'question')
+
+    def load(self, connection):
+        self.load_lookups(connection)
+        users = User.__table__.c
+        cases = Case.__table__.c
+        self.user_ids = {}
+        self.consultant_ids = {}
+        for user_id, username, is_consultant in self._select(
+                connection, users.id, users.username,
+                users.is_consultant):
+            self.user_ids[username] = user_id
+            if is_consultant:
+                self.consultant_ids[username] = user_id
+        self.cases = {tuple(row) for row in
+                      self._select(connection, cases.patient_id,
+                                   cases.meeting_id)}
+
+    def user(self, row, name, user_ids):
+        username = self.required(row, name).lower()
+        if username not in user_ids:
+            raise RowError('No {} with username {}'.format(name, username))
+        return user_ids[username]
+
+    def prepare(self, row):
+        patient_id, meeting_id = self.case_keys(row)
+        values = {
+            'patient_id': patient_id,
+            'meeting_id': meeting_id,
+            'consultant_id': self.user(row, 'consultant',
+                                       self.consultant_ids),
+            'created_by_id': self.user(row, 'created_by', self.user_ids),
+            'created_on': (self.date(row, 'created_on', required=False) or
+                           self.date(row, 'meeting')),
+            'medical_history': self.required(row, 'medical_history'),
+            'question': self.required(row, 'question'),
+            'discussion': self.optional(row, 'discussion'),
+            'planned_surgery': self.optional(row, 'planned_surgery', 255),
+            'surgery_date': self.date(row, 'surgery_date', required=False),
+            'next_opa': self.date(row, 'next_opa', required=False),
+            'clinic_code': self.optional(row, 'clinic_code', 50),
+            'mdt_vcmg': self.choice(
+                _text(row.get('mdt_vcmg')).upper() or 'MDT', 'mdt_vcmg',
+                ('MDT', 'VCMG')),
+        }
+        status = _text(row.get('status')).upper()
+        if not status:
+            status = 'DISC' if values['discussion'] else 'TBD'
+        values['status'] = self.choice(status, 'status',
+                                       ('TBD', 'DISC', 'COMP'))
+        if (patient_id, meeting_id) in self.cases:
+            raise RowError('Patient already has a case on this date')
+        self.cases.add((patient_id, meeting_id))
+        return values
+
+
+class ActionImporter(_CaseLookups, Importer):
+    table = Action.__table__
+    columns = ('hospital_number', 'meeting', 'action', 'assigned_to')
+
+    def __init__(self, connection):
+        # cases to recount, kept when load is run again after a batch fails
+        self.changed_case_ids = set()
+        Importer.__init__(self, connection)
+
+    def load(self, connection):
+        self.load_lookups(connection)
+        cases = Case.__table__.c
+        actions = Action.__table__.c
+        users = User.__table__.c
+        self.case_ids = {(patient_id, meeting_id): case_id
+                         for case_id, patient_id, meeting_id in
+                         self._select(connection, cases.id,
+                                      cases.patient_id, cases.meeting_id)}
+        self.user_ids = dict(self._select(connection, users.username,
+                                          users.id).fetchall())
+        self.actions = {tuple(row) for row in
+                        self._select(connection, actions.case_id,
+                                     actions.action)}
+
+    def prepare(self, row):
+        case_id = self.case_ids.get(self.case_keys(row))
+        if case_id is None:
+            raise RowError('Patient has no case on this date')
+        action = self.required(row, 'action', 255)
+        username = self.required(row, 'assigned_to').lower()
+        if username not in self.user_ids:
+            raise RowError('No user with username {}'.format(username))
+        if (case_id, action) in self.actions:
+            raise RowError('Action already exists for this case')
+        self.actions.add((case_id, action))
+        self.changed_case_ids.add(case_id)
+        return {'case_id': case_id, 'action': action,
+                'assigned_to_id': self.user_ids[username],
+                'is_completed': self.boolean(row, 'is_completed')}
+
+    def finish(self, connection):
+        case_ids = sorted(self.changed_case_ids)
+        for start in range(0, len(case_ids), BATCH_SIZE):
+            recount_actions(connection, case_ids[start:start + BATCH_SIZE])
+
+
+IMPORTERS = {'patients': PatientImporter,
+             'meetings': MeetingImporter,
+             'cases': CaseImporter,
+             'actions': ActionImporter}
+
+
+class RejectedReport:
+    """CSV of rejected rows, with their line in the file and the reason
+
+    The file is only created when a row is rejected.
+
+    Arguments:
+    path -- str: file to write to, or None to not write one
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.count = 0
+        self._file = None
+        self._writer = None
+
+    def add(self, line, reason, row):
+        self.count += 1
+        if self.path is None:
+            return
+        if self._writer is None:
+            self._file = open(self.path, 'w', newline='')
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(['line', 'reason', 'row'])
+        cells = ['{}={}'.format(key, _text(value))
+                 for key, value in row.items()]
+        self._writer.writerow([line, reason, '; '.join(cells)])
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _batches(rows, columns, batch_size):
+    """Lists of up to batch_size (line, row) of rows
+
+    Raises ValueError if the file is missing one of columns.
+    """
+    batch = []
+    # line 1 is the header
+    for line, row in enumerate(rows, start=2):
+        if line == 2:
+            missing = [column for column in columns if column not in row]
+            if missing:
+                raise ValueError('File has no column {}'.format(
+                    ', '.join(missing)))
+        batch.append((line, row))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def import_rows(connection, kind, rows, report=None, batch_size=BATCH_SIZE):
+    """Import rows of one kind, committing every batch_size rows
+
+    All rows of a batch are checked before it is inserted, in a SAVEPOINT,
+    so a batch the database refuses (e.g. a row added by someone else since
+    the keys were loaded) is rejected and the import goes on with the next.
+
+    Arguments:
+    connection -- connection to the database to import into
+    kind -- str: key of IMPORTERS, e.g. 'patients'
+    rows -- iterable of dict of column name: value, e.g. from read_rows
+    report -- RejectedReport for rows that can't be imported
+    batch_size -- int: rows inserted per INSERT and transaction
+
+    Returns ImportResult
+    """
+    report = report or RejectedReport()
+    importer = IMPORTERS[kind](connection)
+    read = 0
+    inserted = 0
+    for batch in _batches(rows, importer.columns, batch_size):
+        read += len(batch)
+        accepted = []
+        values = []
+        for line, row in batch:
+            if not any(_text(value) for value in row.values()):
+                continue
+            try:
+                values.append(importer.prepare(row))
+            except RowError as error:
+                report.add(line, str(error), row)
+            else:
+                accepted.append((line, row))
+        if not values:
+            continue
+        with connection.begin():
+            try:
+                with connection.begin_nested():
+                    connection.execute(importer.table.insert().values(values))
+            except DBAPIError as error:
+                for line, row in accepted:
+                    report.add(line, 'Batch not inserted: {}'.format(
+                        error.orig), row)
+                # keys of the batch's rows were added as they were accepted
+                importer.load(connection)
+            else:
+                inserted += len(values)
+    with connection.begin():
+        importer.finish(connection)
+    return ImportResult(read, inserted, report.count)
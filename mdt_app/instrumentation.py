@@ -0,0 +1,123 @@
+"""
+Per-request SQL instrumentation
+
+Engine events time each statement run while handling a request. After the
+request its statement count, total database time and slowest statement are
+sent in a Server-Timing header (shown in the browser's network panel) and
+logged as a line of JSON to the mdt_app.instrumentation logger. The events
+only add a couple of clock reads per statement, so this runs in production;
+it is switched off with SQL_INSTRUMENTATION in config.
+
+A view can be given a query budget with the query_budget decorator, the
+most statements a request to it should run. Going over it is logged as a
+warning, or raises QueryBudgetExceeded with QUERY_BUDGET_RAISE in config,
+so that tests fail when a change adds queries to a page. Statements run
+while a streamed response is sent are after the request, so aren't counted.
+"""
+import json
+import logging
+import time
+
+from flask import _request_ctx_stack, current_app, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# characters of the slowest statement that are logged
+STATEMENT_LENGTH = 500
+
+
+class QueryBudgetExceeded(Exception):
+    """Request ran more statements than its view's query budget"""
+
+
+class QueryStats:
+    """Statements run while handling a request"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.count = 0
+        # seconds
+        self.duration = 0.0
+        self.slowest = None
+        self.slowest_duration = 0.0
+
+    def add(self, statement, duration):
+        self.count += 1
+        self.duration += duration
+        if self.slowest is None or duration > self.slowest_duration:
+            self.slowest = statement
+            self.slowest_duration = duration
+
+
+def current_stats():
+    """QueryStats of the request being handled, None outside a request"""
+    return getattr(_request_ctx_stack.top, 'query_stats', None)
+
+
+def query_budget(statements):
+    """Decorator setting the most statements a request to a view should run
+
+    Place it below the route decorator.
+    """
+    def set_budget(view):
+        view.query_budget = statements
+        return view
+    return set_budget
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_timer(conn, cursor, statement, parameters, context, executemany):
+    if current_stats() is not None:
+        # a connection runs one statement at a time
+        conn.info['query_started'] = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _stop_timer(conn, cursor, statement, parameters, context, executemany):
+    stats = current_stats()
+    started = conn.info.pop('query_started', None)
+    if stats is not None and started is not None:
+        stats.add(statement, time.perf_counter() - started)
+
+
+def _start_request():
+    if current_app.config.get('SQL_INSTRUMENTATION', True):
+        _request_ctx_stack.top.query_stats = QueryStats()
+
+
+def _end_request(response):
+    stats = current_stats()
+    if stats is None:
+        return response
+    total = time.perf_counter() - stats.started
+    if current_app.config.get('SERVER_TIMING', True):
+        response.headers.add(
+            'Server-Timing',
+            'db;dur={:.1f};desc="{} statements", app;dur={:.1f}'.format(
+                stats.duration * 1000, stats.count, total * 1000))
+    logger.info(json.dumps({
+        'method': request.method,
+        'path': request.path,
+        'endpoint': request.endpoint,
+        'status': response.status_code,
+        'statements': stats.count,
+        'db_ms': round(stats.duration * 1000, 2),
+        'request_ms': round(total * 1000, 2),
+        'slowest_ms': round(stats.slowest_duration * 1000, 2),
+        'slowest': (stats.slowest or '')[:STATEMENT_LENGTH]}))
+    view = current_app.view_functions.get(request.endpoint)
+    budget = getattr(view, 'query_budget', None)
+    if budget is not None and stats.count > budget:
+        message = '{} ran {} statements, its budget is {}'.format(
+            request.endpoint, stats.count, budget)
+        if current_app.config.get('QUERY_BUDGET_RAISE'):
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
+    return response
+
+
+def init_app(app):
+    app.before_request(_start_request)
+    app.after_request(_end_request)
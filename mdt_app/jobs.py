@@ -0,0 +1,212 @@
+"""
+Background jobs
+
+Slow operations are queued as rows of the jobs table and run by
+manage.py worker, so a request returns straight away with the job's id and
+the page polls the job's status (main.job_status). A worker claims a job
+with an UPDATE that only succeeds if the job is still queued, so any number
+of worker processes can share the queue, on Postgres or SQLite. A job that
+raises is tried again after a delay that doubles each time, up to the job's
+max_attempts.
+
+Job functions are registered with the job decorator. They are called with
+the keyword arguments they were queued with (stored as JSON), use
+db.session, and are committed when they return. What they return is
+stored as JSON in the job's result.
+
+With JOBS_INLINE in config, jobs are run as they are queued, and are failed
+rather than tried again, as there is no worker to try them.
+"""
+import json
+import logging
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from . import db
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# seconds before a failed job is tried again, doubled for each attempt
+RETRY_DELAY = 30
+# seconds a job can be running before its worker is assumed to have died
+JOB_TIMEOUT = 600
+# seconds a worker waits before looking again when no job is queued
+POLL_INTERVAL = 1.0
+
+# kind: job function
+JOB_FUNCTIONS = {}
+
+
+def job(kind):
+    """Decorator registering a function as the job function of kind"""
+    def register(function):
+        JOB_FUNCTIONS[kind] = function
+        return function
+    return register
+
+
+def enqueue(kind, created_by_id=None, max_attempts=3, **kwargs):
+    """Queue a job, commits the session so workers can see it
+
+    Arguments:
+    kind -- str: kind of job, registered with the job decorator
+    created_by_id -- int: id of user queueing the job, None if not a user
+    max_attempts -- int: times to try the job before it fails
+    kwargs -- arguments of the job function, must be JSON serialisable
+
+    Returns Job, already run if JOBS_INLINE is set
+    """
+    if kind not in JOB_FUNCTIONS:
+        raise ValueError('No job function for "{}"'.format(kind))
+    queued = Job(kind=kind, args=json.dumps(kwargs),
+                 created_by_id=created_by_id, max_attempts=max_attempts)
+    db.session.add(queued)
+    db.session.commit()
+    if current_app.config.get('JOBS_INLINE') and claim_job(queued.id):
+        run_job(queued.id, retry=False)
+    return queued
+
+
+def claim_job(job_id=None):
+    """Mark a queued job as running, so no other worker runs it
+
+    Arguments:
+    job_id -- int: job to claim, None for the next job due
+
+    Returns id of the job, None if there was no job or it was claimed first
+    """
+    now = datetime.utcnow()
+    if job_id is None:
+        job_id = (db.session.query(Job.id)
+                            .filter(Job.status == 'queued',
+                                    Job.run_after <= now)
+                            .order_by(Job.run_after, Job.id)
+                            .limit(1)
+                            .scalar())
+    claimed = 0
+    if job_id is not None:
+        claimed = (Job.query.filter(Job.id == job_id,
+                                    Job.status == 'queued')
+                            .update({Job.status: 'running',
+                                     Job.attempts: Job.attempts + 1,
+                                     Job.started_on: now},
+                                    synchronize_session=False))
+    db.session.commit()
+    return job_id if claimed else None
+
+
+def run_job(job_id, retry=True):
+    """Run a claimed job, then record its result or queue it to retry
+
+    Arguments:
+    job_id -- int: id of claimed job
+    retry -- bool: queue the job again if it raises and has attempts left,
+             otherwise it fails
+
+    Returns Job
+    """
+    running = Job.query.get(job_id)
+    try:
+        function = JOB_FUNCTIONS.get(running.kind)
+        if function is None:
+            raise LookupError('No job function for "{}"'.format(running.kind))
+        result = function(**json.loads(running.args))
+        running.result = json.dumps(result)
+        running.status = 'done'
+        running.error = None
+    except Exception:
+        logger.exception('Job %s (%s) failed', job_id, running.kind)
+        db.session.rollback()
+        running = Job.query.get(job_id)
+        running.error = traceback.format_exc()
+        if retry and running.attempts < running.max_attempts:
+            delay = RETRY_DELAY * 2 ** (running.attempts - 1)
+            running.status = 'queued'
+            running.run_after = datetime.utcnow() + timedelta(seconds=delay)
+        else:
+            running.status = 'failed'
+    running.finished_on = datetime.utcnow()
+    db.session.commit()
+    return running
+
+
+def requeue_stale(timeout=JOB_TIMEOUT):
+    """Queue jobs again that have been running for longer than timeout
+
+    Their worker most likely died. Jobs already tried max_attempts times
+    are failed instead, in case they are what killed it.
+
+    Returns number of jobs queued again
+    """
+    now = datetime.utcnow()
+    stale = (Job.query.filter(Job.status == 'running',
+                              Job.started_on < now - timedelta(
+                                  seconds=timeout)))
+    stale.filter(Job.attempts >= Job.max_attempts).update(
+        {Job.status: 'failed', Job.finished_on: now,
+         Job.error: 'Timed out'}, synchronize_session=False)
+    requeued = stale.update({Job.status: 'queued', Job.run_after: now},
+                            synchronize_session=False)
+    db.session.commit()
+    return requeued
+
+
+def _run_in_app(app, job_id):
+    with app.app_context():
+        run_job(job_id)
+
+
+def _requeue_stale(app, timeout):
+    with app.app_context():
+        requeued = requeue_stale(timeout)
+    if requeued:
+        logger.warning('%s stale jobs queued again', requeued)
+
+
+def work(app, threads=2, poll_interval=POLL_INTERVAL, burst=False,
+         timeout=JOB_TIMEOUT):
+    """Run queued jobs on a pool of threads until interrupted
+
+    Jobs mostly wait on the database, so threads are enough to run a few at
+    once; start more worker processes to use more CPUs. Jobs left running
+    by a worker or thread that died are queued again when the worker starts
+    and every timeout seconds after.
+
+    Arguments:
+    app -- Flask app, each job runs in its own app context
+    threads -- int: most jobs to run at once
+    poll_interval -- float: seconds to wait when no job is due
+    burst -- bool: return once no job is due or running
+    timeout -- float: seconds a job can be running before it is stale
+    """
+    _requeue_stale(app, timeout)
+    next_requeue = time.monotonic() + timeout
+    # future: job id
+    running = {}
+    with ThreadPoolExecutor(threads) as pool:
+        while True:
+            for future in [future for future in running if future.done()]:
+                job_id = running.pop(future)
+                if future.exception() is not None:
+                    # run_job records a job's own errors, so this is e.g. a
+                    # failed commit, leaving the job running until stale
+                    logger.error('Job %s was not recorded', job_id,
+                                 exc_info=future.exception())
+            if time.monotonic() >= next_requeue:
+                _requeue_stale(app, timeout)
+                next_requeue = time.monotonic() + timeout
+            job_id = None
+            if len(running) < threads:
+                with app.app_context():
+                    job_id = claim_job()
+            if job_id is not None:
+                running[pool.submit(_run_in_app, app, job_id)] = job_id
+            elif burst and not running:
+                return
+            else:
+                time.sleep(poll_interval)
@@ -6,5 +6,5 @@ from flask import Blueprint
 
 main = Blueprint('main', __name__)
 
-# at end to avoid circular references
-from . import views, errors
+# at end to avoid circular references, push registers its job functions
+from . import views, errors, push
@@ -0,0 +1,33 @@
+"""
+Completing actions and keeping the status of their case up to date
+
+A discussed case is COMP once all of its actions are complete, and DISC
+while any action is still open. Whether actions are open comes from the
+counters on the case (see counters.py), so actions aren't loaded.
+"""
+from .. import db
+from ..models import Case
+
+
+def update_case_status(case_id):
+    """Set case status from its open actions, caller must commit
+
+    Runs one query loading the case, unless it is already in the session
+    with its counters loaded. The case is updated when the session flushes,
+    so the ORM events keeping the summary and audit log up to date run.
+
+    Returns str: new status of the case
+    """
+    case = Case.query.get(case_id)
+    case.status = 'DISC' if case.open_actions else 'COMP'
+    return case.status
+
+
+def complete_action(action):
+    """Mark action as complete and update its case, caller must commit
+
+    Returns str: new status of the action's case
+    """
+    action.is_completed = True
+    db.session.flush()
+    return update_case_status(action.case_id)
@@ -0,0 +1,74 @@
+"""
+Saving the attendees of a meeting
+
+The attendee form sends the full list of users present, so the rows are
+synchronised by comparing sets of user ids: users no longer in the list
+are removed with one DELETE and new users are added with one multi-row
+INSERT. The statements bypass the flush, so the changes are passed to the
+audit log with record_bulk.
+"""
+from .. import db
+from ..audit import record_bulk
+from ..models import Attendee, Meeting, User
+
+
+def _expire_attendees(meeting_id, removed_ids):
+    """Expire objects in the session that the bulk statements made stale"""
+    for instance in list(db.session.identity_map.values()):
+        if (isinstance(instance, Attendee) and
+                instance.meeting_id == meeting_id and
+                instance.user_id in removed_ids):
+            db.session.expunge(instance)
+        elif isinstance(instance, (Meeting, User)):
+            db.session.expire(instance, ['attendees'])
+
+
+def sync_attendees(meeting_id, user_ids):
+    """Make user_ids the attendees of a meeting, caller must commit
+
+    Arguments:
+    meeting_id -- int: meeting id
+    user_ids -- iterable of int: ids of all users at the meeting
+
+    Returns tuple of (set of user ids added, set of user ids removed)
+    """
+    user_ids = set(user_ids)
+    existing = dict(db.session.query(Attendee.user_id, Attendee.id)
+                              .filter(Attendee.meeting_id == meeting_id))
+    added = user_ids - set(existing)
+    removed = set(existing) - user_ids
+    if removed:
+        (Attendee.query.filter(Attendee.meeting_id == meeting_id,
+                               Attendee.user_id.in_(removed))
+                       .delete(synchronize_session=False))
+        record_bulk(db.session(), Attendee, 'delete',
+                    [(existing[user_id], None,
+                      {'meeting_id': (meeting_id, None),
+                       'user_id': (user_id, None)})
+                     for user_id in sorted(removed)])
+    if added:
+        db.session.execute(Attendee.__table__.insert().values(
+            [{'meeting_id': meeting_id, 'user_id': user_id}
+             for user_id in sorted(added)]))
+        # ids of the new rows, for the audit log
+        inserted = (db.session.query(Attendee.id, Attendee.user_id)
+                              .filter(Attendee.meeting_id == meeting_id,
+                                      Attendee.user_id.in_(added))
+                              .order_by(Attendee.id))
+        record_bulk(db.session(), Attendee, 'insert',
+                    [(attendee_id, None,
+                      {'meeting_id': (None, meeting_id),
+                       'user_id': (None, user_id)})
+                     for attendee_id, user_id in inserted])
+    if added or removed:
+        _expire_attendees(meeting_id, removed)
+    return added, removed
+
+
+def attendee_names(meeting_id):
+    """List of (first name, last name) of a meeting's attendees"""
+    return (db.session.query(User.f_name, User.l_name)
+                      .join(Attendee, Attendee.user_id == User.id)
+                      .filter(Attendee.meeting_id == meeting_id)
+                      .order_by(User.f_name, User.l_name)
+                      .all())
@@ -0,0 +1,162 @@
+"""
+Select fields with cached choices
+
+QuerySelectField runs its query and loads a model for every choice each
+time a form is made, which for the case forms is on every GET and POST.
+The fields here keep (pk, label) of each choice in a cache shared by all
+forms, and only load the model that was chosen, when its data is used.
+
+Entries are removed when a User or Meeting is inserted, updated or deleted
+through the ORM (see invalidate_on_commit in cache.py), and expire after
+a time to live for changes made by other workers or outside the ORM (and
+for get_meetings moving on each day).
+"""
+from sqlalchemy import inspect
+from wtforms import widgets
+from wtforms.ext.sqlalchemy.fields import QuerySelectField
+from wtforms.validators import ValidationError
+
+from ..cache import ALL_KEYS, TTLCache, invalidate_on_commit
+from ..models import Meeting, User
+from ..routing import primary
+
+choice_cache = TTLCache('form_choices', ttl=300)
+
+
+class CachedQuerySelectField(QuerySelectField):
+    """QuerySelectField with choices from choice_cache
+
+    Takes the same arguments as QuerySelectField. query_factory and
+    get_label together are the cache key, so should be module level
+    functions (or attribute names) rather than made for each form. Setting
+    the query attribute of the field isn't supported.
+    """
+
+    def __init__(self, label=None, validators=None, query_factory=None,
+                 get_label=None, **kwargs):
+        super(CachedQuerySelectField, self).__init__(
+            label, validators, query_factory=query_factory,
+            get_label=get_label, **kwargs)
+        self.cache_key = (query_factory, get_label)
+
+    def _load_choices(self):
+        query = self.query_factory()
+        model = query.column_descriptions[0]['type']
+        choices = []
+        idents = {}
+        with primary():
+            for obj in query:
+                pk = self.get_pk(obj)
+                choices.append((pk, self.get_label(obj)))
+                idents[pk] = inspect(obj).identity
+        return model, choices, idents
+
+    def _get_choices(self):
+        """Tuple of (model, list of (pk, label), dict of pk: identity)"""
+        return choice_cache.get_or_set(self.cache_key, self._load_choices)
+
+    def _pk_of(self, obj):
+        return None if obj is None else self.get_pk(obj)
+
+    def _get_data(self):
+        if self._formdata is not None:
+            model, choices, idents = self._get_choices()
+            if self._formdata in idents:
+                self._set_data(model.query.get(idents[self._formdata]))
+        return self._data
+
+    def _set_data(self, data):
+        self._data = data
+        self._formdata = None
+
+    data = property(_get_data, _set_data)
+
+    def iter_choices(self):
+        if self._formdata is not None:
+            selected = self._formdata
+        else:
+            selected = self._pk_of(self._data)
+        if self.allow_blank:
+            yield ('__None', self.blank_text, selected is None)
+        for pk, label in self._get_choices()[1]:
+            yield (pk, label, pk == selected)
+
+    def pre_validate(self, form):
+        model, choices, idents = self._get_choices()
+        if self._formdata is not None:
+            is_valid = self._formdata in idents
+        elif self._data is not None:
+            is_valid = self._pk_of(self._data) in idents
+        else:
+            is_valid = self.allow_blank
+        if not is_valid:
+            raise ValidationError(self.gettext('Not a valid choice'))
+
+
+class CachedQuerySelectMultipleField(CachedQuerySelectField):
+    """QuerySelectMultipleField with choices from choice_cache
+
+    The chosen models are loaded with one query when the data is used.
+    """
+    widget = widgets.Select(multiple=True)
+
+    def __init__(self, label=None, validators=None, default=None, **kwargs):
+        if default is None:
+            default = []
+        super(CachedQuerySelectMultipleField, self).__init__(
+            label, validators, default=default, **kwargs)
+        self._invalid_formdata = False
+
+    def _get_data(self):
+        formdata = self._formdata
+        if formdata is not None:
+            model, choices, idents = self._get_choices()
+            self._invalid_formdata = not formdata <= set(idents)
+            chosen = [pk for pk, label in choices if pk in formdata]
+            data = []
+            if chosen:
+                # single column primary keys, as for all models here
+                primary_key = inspect(model).primary_key[0]
+                by_pk = {self.get_pk(obj): obj for obj in
+                         model.query.filter(primary_key.in_(
+                             [idents[pk][0] for pk in chosen]))}
+                data = [by_pk[pk] for pk in chosen if pk in by_pk]
+            self._set_data(data)
+        return self._data
+
+    data = property(_get_data, CachedQuerySelectField._set_data)
+
+    def iter_choices(self):
+        if self._formdata is not None:
+            selected = self._formdata
+        else:
+            selected = {self.get_pk(obj) for obj in self._data}
+        for pk, label in self._get_choices()[1]:
+            yield (pk, label, pk in selected)
+
+    def process_formdata(self, valuelist):
+        self._formdata = set(valuelist)
+
+    def pre_validate(self, form):
+        model, choices, idents = self._get_choices()
+        if self._formdata is not None:
+            is_valid = self._formdata <= set(idents)
+        else:
+            is_valid = (not self._invalid_formdata and
+                        all(self.get_pk(obj) in idents for obj in self._data))
+        if not is_valid:
+            raise ValidationError(self.gettext('Not a valid choice'))
+
+
+def _changed_choices(session):
+    """ALL_KEYS if the flush changed a User or Meeting"""
+    for obj in session.new | session.dirty | session.deleted:
+        if (isinstance(obj, (User, Meeting)) and
+                (obj not in session.dirty or
+                 session.is_modified(obj, include_collections=False))):
+            return ALL_KEYS
+    return None
+
+
+# invalidate_choices(ALL_KEYS, session=None) for changes made without the ORM
+invalidate_choices = invalidate_on_commit(choice_cache, _changed_choices)
@@ -0,0 +1,154 @@
+"""
+Server-side processing for DataTables
+
+When DataTables is set up with serverSide, it sends the page, ordering and
+search terms as request arguments and expects one page of rows back as JSON.
+DataTable applies these to a SQLAlchemy query so that paging, ordering and
+searching are done by the database rather than in the browser.
+"""
+from collections import namedtuple
+
+from sqlalchemy import String, or_
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
+
+# Upper limit on rows per request, DataTables sends length=-1 for "All"
+MAX_PAGE_LENGTH = 100
+
+# name -- key of the column in each row of data
+# search -- list of expressions that a search term is matched against
+# order -- expression to order by, None if column is not orderable
+Column = namedtuple('Column', ['name', 'search', 'order'])
+
+
+class formatted_date(FunctionElement):
+    """Date as text in the format of date_style in config (DD-Mon-YYYY),
+    so it can be searched for as it is shown"""
+    type = String()
+    name = 'formatted_date'
+
+
+@compiles(formatted_date)
+def _formatted_date(element, compiler, **kw):
+    return "to_char({}, 'DD-Mon-YYYY')".format(
+        compiler.process(element.clauses, **kw))
+
+
+@compiles(formatted_date, 'sqlite')
+def _formatted_date_sqlite(element, compiler, **kw):
+    column = compiler.process(element.clauses, **kw)
+    return ("strftime('%d', {column}) || '-' || "
+            "substr('JanFebMarAprMayJunJulAugSepOctNovDec', "
+            "strftime('%m', {column}) * 3 - 2, 3) || '-' || "
+            "strftime('%Y', {column})").format(column=column)
+
+
+def _int_arg(args, key, default):
+    try:
+        return int(args.get(key, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _like_term(term):
+    """Escape LIKE wildcards in user input and match anywhere in the field"""
+    term = (term.replace('\\', '\\\\')
+                .replace('%', '\\%')
+                .replace('_', '\\_'))
+    return '%{}%'.format(term)
+
+
+def _matches(expressions, term):
+    """Clause for term being in any of expressions (case insensitive)"""
+    like_term = _like_term(term)
+    return or_(*[expression.ilike(like_term, escape='\\')
+                 for expression in expressions])
+
+
+class DataTable:
+    """One page of a query in the format used by DataTables server-side mode
+
+    Column order and which columns can be searched or ordered are defined by
+    the server, so only the indexes sent by DataTables are used.
+
+    Arguments:
+    args -- request arguments sent by DataTables
+    query -- base query, joined to any tables used by the columns
+    columns -- list of Column, in the same order as the table columns
+    default_order -- order_by clauses if none sent, and used to break ties
+    """
+
+    def __init__(self, args, query, columns, default_order=()):
+        self.args = args
+        self.query = query
+        self.columns = columns
+        self.default_order = list(default_order)
+
+    @property
+    def draw(self):
+        return _int_arg(self.args, 'draw', 0)
+
+    @property
+    def start(self):
+        return max(_int_arg(self.args, 'start', 0), 0)
+
+    @property
+    def length(self):
+        length = _int_arg(self.args, 'length', 10)
+        if length < 1 or length > MAX_PAGE_LENGTH:
+            return MAX_PAGE_LENGTH
+        return length
+
+    def _column_search(self, query):
+        """Filter by search value of each column"""
+        for index, column in enumerate(self.columns):
+            term = self.args.get('columns[{}][search][value]'.format(index))
+            if term and column.search:
+                query = query.filter(_matches(column.search, term.strip()))
+        return query
+
+    def _global_search(self, query):
+        """Filter so that every word is in at least one searchable column"""
+        term = self.args.get('search[value]', '')
+        expressions = [expression for column in self.columns
+                       for expression in column.search]
+        for word in term.split():
+            query = query.filter(_matches(expressions, word))
+        return query
+
+    def _order(self, query):
+        """Order by columns sent, falling back to default_order"""
+        clauses = []
+        index = 0
+        while 'order[{}][column]'.format(index) in self.args:
+            column_index = _int_arg(self.args,
+                                    'order[{}][column]'.format(index), -1)
+            direction = self.args.get('order[{}][dir]'.format(index))
+            if 0 <= column_index < len(self.columns):
+                expression = self.columns[column_index].order
+                if expression is not None:
+                    clauses.append(expression.desc() if direction == 'desc'
+                                   else expression.asc())
+            index += 1
+        return query.order_by(*(clauses + self.default_order))
+
+    def filtered_query(self):
+        """Query filtered by global and column search, not paged"""
+        return self._column_search(self._global_search(self.query))
+
+    def response(self, render_row):
+        """Dictionary to be returned as JSON to DataTables
+
+        Arguments:
+        render_row -- function taking one result row and returning a dict
+                      with a key for each column name
+        """
+        filtered = self.filtered_query()
+        rows = (self._order(filtered)
+                    .offset(self.start)
+                    .limit(self.length)
+                    .all())
+        return {'draw': self.draw,
+                'recordsTotal': self.query.order_by(None).count(),
+                'recordsFiltered': filtered.order_by(None).count(),
+                'data': [render_row(row) for row in rows]}
@@ -0,0 +1,112 @@
+"""
+Query plans of the hot view queries
+
+Builds the main query of each busy view with parameters taken from the
+database (the meeting with most cases, the user with most actions...) and
+returns its query plan, so that a change to a query or index that makes a
+view fall back to scanning a whole table shows up. Used by the explain
+command in manage.py, ideally against a seeded database as plans for
+near empty tables are not representative.
+"""
+from collections import OrderedDict
+from datetime import date
+
+from sqlalchemy import func
+
+from .. import db
+from ..models import Action, Case, Meeting
+from .forms import get_meetings
+
+
+def _sample_ids():
+    """Ids to run the queries with, the busiest of each where possible"""
+    meeting_id = (db.session.query(Case.meeting_id)
+                            .group_by(Case.meeting_id)
+                            .order_by(func.count(Case.id).desc())
+                            .limit(1)
+                            .scalar())
+    patient_id = (db.session.query(Case.patient_id)
+                            .group_by(Case.patient_id)
+                            .order_by(func.count(Case.id).desc())
+                            .limit(1)
+                            .scalar())
+    user_id = (db.session.query(Action.assigned_to_id)
+                         .group_by(Action.assigned_to_id)
+                         .order_by(func.count(Action.id).desc())
+                         .limit(1)
+                         .scalar())
+    return meeting_id, patient_id, user_id
+
+
+def hot_queries():
+    """Main query of each busy view
+
+    Returns OrderedDict of name: Query, empty if there are no cases or
+    actions to take parameters from
+    """
+    meeting_id, patient_id, user_id = _sample_ids()
+    if None in (meeting_id, patient_id, user_id):
+        return OrderedDict()
+    return OrderedDict([
+        ('case_list cases of meeting',
+         Case.query.filter_by(meeting_id=meeting_id)
+                   .order_by(Case.created_on)),
+        ('meeting summary counts',
+         db.session.query(Case.status, func.count(Case.id))
+                   .filter(Case.meeting_id == meeting_id)
+                   .group_by(Case.status)),
+        ('case_edit cases of patient',
+         Case.query.filter_by(patient_id=patient_id)
+                   .join(Meeting)
+                   .order_by(Meeting.date.desc())),
+        ('case actions',
+         Action.query.join(Case)
+                     .filter(Case.patient_id == patient_id)),
+        ('action_list actions of user',
+         Action.query.filter_by(assigned_to_id=user_id)
+                     .join(Case)
+                     .order_by(Action.is_completed, Case.status.desc(),
+                               Action.id.desc())
+                     .limit(50)),
+        ('upcoming meetings', get_meetings()),
+        ('next meeting',
+         Meeting.query.filter(Meeting.date > date.today(),
+                              Meeting.is_cancelled == False)
+                      .order_by(Meeting.date)
+                      .limit(1)),
+    ])
+
+
+def explain(query, analyze=True):
+    """Query plan of a query, as a list of lines
+
+    Postgres runs the query with EXPLAIN ANALYZE (or EXPLAIN without
+    analyze), other databases show what plan they can.
+    """
+    connection = db.session.connection()
+    dialect = connection.dialect
+    compiled = query.statement.compile(dialect=dialect)
+    if dialect.name == 'postgresql':
+        prefix = 'EXPLAIN (ANALYZE, BUFFERS) ' if analyze else 'EXPLAIN '
+    elif dialect.name == 'sqlite':
+        prefix = 'EXPLAIN QUERY PLAN '
+    else:
+        prefix = 'EXPLAIN '
+    params = compiled.params
+    if compiled.positional:
+        params = tuple(params[name] for name in compiled.positiontup)
+    rows = connection.execute(prefix + str(compiled), params)
+    return [' '.join(str(column) for column in row) for row in rows]
+
+
+def explain_all(analyze=True):
+    """Query plans of all hot queries
+
+    Returns OrderedDict of name: list of lines of the plan
+    """
+    try:
+        return OrderedDict((name, explain(query, analyze))
+                           for name, query in hot_queries().items())
+    finally:
+        # EXPLAIN ANALYZE runs the queries, don't leave anything behind
+        db.session.rollback()
@@ -2,8 +2,6 @@ import datetime
 from wtforms import (StringField, BooleanField, DateField, SubmitField,
                      HiddenField, ValidationError, SelectField, TextAreaField,
                      widgets)
-from wtforms.ext.sqlalchemy.fields import (QuerySelectField,
-                                           QuerySelectMultipleField)
 from wtforms.validators import DataRequired, Length, Regexp, Optional
 from wtforms import widgets
 from datetime import date, timedelta
@@ -11,6 +9,7 @@ from datetime import date, timedelta
 from flask_wtf import FlaskForm
 
 from ..models import Meeting, Patient, Case, Action, User
+from .choices import CachedQuerySelectField, CachedQuerySelectMultipleField
 from config import date_style
 
 # query select functions
@@ -20,7 +19,7 @@ def get_meetings():
     """Get the next 20 non cancelled meetings from 2 weeks ago onwards"""
     earliest_date = str(date.today() - timedelta(days=14))
     return (Meeting.query.filter(Meeting.date >= earliest_date)
-                         .filter(Meeting.is_cancelled == 'FALSE')
+                         .filter(Meeting.is_cancelled == False)
                          .order_by(Meeting.date)
                          .limit(20))
 
@@ -41,17 +40,19 @@ def get_users():
 class CaseForm(FlaskForm):
     case_id = HiddenField()
     patient_id = HiddenField()
-    meeting = QuerySelectField('MDT date', query_factory=get_meetings,
-                               get_label='date_repr',
-                               blank_text='---', allow_blank=True,
-                               validators=[Optional()])
+    meeting = CachedQuerySelectField('MDT date', query_factory=get_meetings,
+                                     get_label='date_repr',
+                                     blank_text='---', allow_blank=True,
+                                     validators=[Optional()])
     add_meeting = DateField('Add new MDT date',
                             format=date_style['format'],
                             validators=[Optional()],
                             description=date_style['help'])
-    consultant = QuerySelectField('Consultant', query_factory=get_consultants,
-                                  get_label='initials', blank_text='---',
-                                  allow_blank=True, validators=[DataRequired()])
+    consultant = CachedQuerySelectField('Consultant',
+                                        query_factory=get_consultants,
+                                        get_label='initials', blank_text='---',
+                                        allow_blank=True,
+                                        validators=[DataRequired()])
     next_opa = DateField('Date of next OPA', format=date_style['format'],
                          validators=[Optional()],
                          description=date_style['help'])
@@ -102,15 +103,17 @@ class CaseEditForm(CaseForm):
     discussion = TextAreaField('Discussion',
                                filters=[lambda x: x.strip() if x else None])
     action = StringField('Action', validators=[Length(0, 255)])
-    action_to = QuerySelectField('Assigned to', query_factory=get_users,
-                                  get_label='username', blank_text='---',
-                                  allow_blank=True)
+    action_to = CachedQuerySelectField('Assigned to', query_factory=get_users,
+                                       get_label='username', blank_text='---',
+                                       allow_blank=True)
     no_actions = BooleanField('No actions required')
     submit = SubmitField('Submit')
 
     def validate_no_actions(self, field):
         if field.data:
-            existing = Action.query.filter_by(case_id=self.case_id.data).all()
+            existing = (Case.query.with_entities(Case.total_actions)
+                                  .filter_by(id=self.case_id.data)
+                                  .scalar())
             if existing or self.action.data:
                 raise ValidationError('Actions already exist for this case')
 
@@ -125,12 +128,11 @@ class CaseEditForm(CaseForm):
 
 
 class AttendeeForm(FlaskForm):
-    user = QuerySelectMultipleField('Members',
-                                    query_factory=get_users,
-                                    get_label=lambda x: str(('{} {}'
-                                                             ).format(x.f_name,
-                                                                      x.l_name))
-                                    )
+    user = CachedQuerySelectMultipleField('Members',
+                                          query_factory=get_users,
+                                          get_label=lambda x: str(
+                                              '{} {}'.format(x.f_name,
+                                                             x.l_name)))
     comment = TextAreaField('Meeting comments',
                             filters=[lambda x: x.strip() if x else None])
     submit = SubmitField('Save attendees')
@@ -195,9 +197,14 @@ class PatientForm(FlaskForm):
 class ActionForm(FlaskForm):
     id = HiddenField('Primary key')
     action = StringField('Action', validators=[Length(1, 255), DataRequired()])
-    assigned_to = QuerySelectField('Assigned to', query_factory=get_users,
-                                   get_label='username', blank_text='---',
-                                   allow_blank=True,
-                                   validators=[DataRequired()])
+    assigned_to = CachedQuerySelectField('Assigned to',
+                                         query_factory=get_users,
+                                         get_label='username',
+                                         blank_text='---', allow_blank=True,
+                                         validators=[DataRequired()])
     is_completed = BooleanField('Completed?')
-    submit = SubmitField('Submit')
\ No newline at end of file
+    submit = SubmitField('Submit')
+
+
+class ActionCompleteForm(FlaskForm):
+    """No fields, csrf protection for marking an action as complete"""
@@ -0,0 +1,71 @@
+"""
+Loader options for the case, action and meeting views
+
+Relationships on the models are lazy, so rendering a table row by row would
+run a query for each relationship of each row. The functions here return
+options for a query so that everything a table shows is loaded up front,
+in the same number of queries however many rows there are.
+"""
+from sqlalchemy.orm import contains_eager, joinedload, subqueryload
+
+from ..models import Action, Attendee, Case
+
+# Many to one relationships of a case shown in the case table
+CASE_RELATIONSHIPS = ('meeting', 'patient', 'created_by', 'consultant')
+
+
+def case_options(joined=None):
+    """Options for cases with everything shown in the case table
+
+    Many to one relationships are joined in the same query, actions and
+    who they are assigned to are loaded in one extra query for all cases.
+
+    Arguments:
+    joined -- dict of relationship name: alias (None if not aliased) for
+              relationships the query has already joined to filter or
+              order by, these are populated from the existing join
+    """
+    joined = joined or {}
+    options = []
+    for name in CASE_RELATIONSHIPS:
+        relationship = getattr(Case, name)
+        if name in joined:
+            options.append(contains_eager(relationship, alias=joined[name]))
+        else:
+            options.append(joinedload(relationship))
+    options.append(subqueryload(Case.actions).joinedload(Action.assigned_to))
+    return options
+
+
+def case_detail_options():
+    """Options for one case with its actions, as shown on case_edit"""
+    return [joinedload(Case.actions).joinedload(Action.assigned_to)]
+
+
+def action_options(case_joined=False):
+    """Options for actions with their case, patient and assigned user
+
+    Arguments:
+    case_joined -- bool: query has already joined Case
+    """
+    if case_joined:
+        case_loader = contains_eager(Action.case)
+    else:
+        case_loader = joinedload(Action.case)
+    return [case_loader.joinedload(Case.patient),
+            joinedload(Action.assigned_to)]
+
+
+def attendee_options():
+    """Options for attendees of a meeting with their user"""
+    return [joinedload(Attendee.user)]
+
+
+def case_report_options():
+    """Options for cases with everything in their PDF report
+
+    Everything is joined, so a meeting's reports are loaded in one query.
+    """
+    options = [joinedload(getattr(Case, name)) for name in CASE_RELATIONSHIPS]
+    options.append(joinedload(Case.actions).joinedload(Action.assigned_to))
+    return options
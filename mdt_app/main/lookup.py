@@ -0,0 +1,68 @@
+"""
+Finding patients as staff type
+
+Each word typed must match the start of the patient's hospital number,
+first name or last name, or be their date of birth. Only the first few
+matches are returned, so the patients page doesn't need the whole patient
+table. On Postgres the name and hospital number columns have trigram
+indexes (see models.Patient), which case insensitive LIKE uses.
+"""
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+
+from ..models import Patient
+from config import date_style
+
+# Most patients returned for a lookup
+LOOKUP_LIMIT = 20
+
+# Date of birth formats that can be typed
+DATE_FORMATS = (date_style['format'], '%Y-%m-%d', '%d/%m/%Y')
+
+
+def _parse_date(word):
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(word, date_format).date()
+        except ValueError:
+            continue
+    return None
+
+
+def _starts_with(word):
+    """LIKE pattern for text starting with word, wildcards escaped"""
+    word = (word.replace('\\', '\\\\')
+                .replace('%', '\\%')
+                .replace('_', '\\_'))
+    return '{}%'.format(word)
+
+
+def _word_clause(word):
+    date_of_birth = _parse_date(word)
+    if date_of_birth is not None:
+        return Patient.date_of_birth == date_of_birth
+    pattern = _starts_with(word)
+    return or_(*[column.ilike(pattern, escape='\\')
+                 for column in (Patient.hospital_number, Patient.first_name,
+                                Patient.last_name)])
+
+
+def find_patients(term, limit=LOOKUP_LIMIT):
+    """Patients matching every word of term, by last then first name
+
+    Arguments:
+    term -- str: words typed, e.g. 'smi jo', '1234' or '09-Oct-1988'
+    limit -- int: most patients to return
+
+    Returns list of Patient
+    """
+    words = term.split()
+    if not words:
+        return []
+    return (Patient.query.filter(and_(*[_word_clause(word)
+                                        for word in words]))
+                         .order_by(Patient.last_name, Patient.first_name,
+                                   Patient.id)
+                         .limit(limit)
+                         .all())
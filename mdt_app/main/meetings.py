@@ -0,0 +1,81 @@
+"""
+Pages of the meeting list
+
+Meetings are paged by date (keyset pagination), so a page is read from the
+meetings index however far back it is, rather than skipping rows with an
+OFFSET. Each meeting comes with counts of its cases by status and of its
+attendees, from correlated subqueries in the same query. The subqueries
+only read the rows of the meetings on the page, using the indexes on
+cases(meeting_id, status) and attendees(meeting_id).
+"""
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import func
+
+from .. import db
+from ..models import Attendee, Case, Meeting
+
+MEETINGS_PER_PAGE = 25
+
+# meeting -- Meeting
+# tbd, disc, comp -- int: number of cases with each status
+# total -- int: number of cases
+# attendees -- int: number of attendees
+MeetingRow = namedtuple('MeetingRow', ['meeting', 'tbd', 'disc', 'comp',
+                                       'total', 'attendees'])
+
+# rows -- list of MeetingRow, newest meeting first
+# newer -- date to show meetings after for the page before, None if first
+# older -- date to show meetings before for the next page, None if last
+MeetingPage = namedtuple('MeetingPage', ['rows', 'newer', 'older'])
+
+
+def parse_date(value):
+    """Date from a YYYY-MM-DD request argument, ValueError if not valid"""
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def _count(model, *criteria):
+    """Correlated subquery counting rows of model for each meeting"""
+    return (db.session.query(func.count(model.id))
+                      .filter(model.meeting_id == Meeting.id, *criteria)
+                      .correlate(Meeting)
+                      .as_scalar())
+
+
+def meeting_page(before=None, after=None, per_page=MEETINGS_PER_PAGE):
+    """One page of meetings with their case and attendee counts
+
+    Arguments:
+    before -- date: show meetings before this date (older meetings)
+    after -- date: show meetings after this date (newer meetings), ignored
+             if before is given
+    per_page -- int: number of meetings on a page
+
+    Returns MeetingPage
+    """
+    query = db.session.query(Meeting,
+                             _count(Case, Case.status == 'TBD'),
+                             _count(Case, Case.status == 'DISC'),
+                             _count(Case, Case.status == 'COMP'),
+                             _count(Case),
+                             _count(Attendee))
+    if before is None and after is not None:
+        # read towards newer meetings, then put newest first again
+        rows = (query.filter(Meeting.date > after)
+                     .order_by(Meeting.date)
+                     .limit(per_page + 1)
+                     .all())
+        has_newer, has_older = len(rows) > per_page, True
+        rows = rows[:per_page][::-1]
+    else:
+        if before is not None:
+            query = query.filter(Meeting.date < before)
+        rows = query.order_by(Meeting.date.desc()).limit(per_page + 1).all()
+        has_newer, has_older = before is not None, len(rows) > per_page
+        rows = rows[:per_page]
+    rows = [MeetingRow(*row) for row in rows]
+    newer = rows[0].meeting.date if rows and has_newer else None
+    older = rows[-1].meeting.date if rows and has_older else None
+    return MeetingPage(rows, newer, older)
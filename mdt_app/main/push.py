@@ -0,0 +1,111 @@
+"""
+Moving cases from a meeting to the next meeting
+
+Used to push undiscussed cases on from case_list and to move all cases of
+a meeting that is cancelled. A patient can only have one case per meeting,
+so a case is not moved if its patient already has a case at the next
+meeting. Views queue push_cases_job to run on a worker.
+"""
+from collections import namedtuple
+
+from sqlalchemy import exists
+from sqlalchemy.orm import aliased
+
+from .. import db
+from ..audit import record_bulk
+from ..jobs import job
+from ..models import Case, Meeting, Patient
+from .summary import invalidate_meetings
+
+# next_meeting -- Meeting: meeting that cases were moved to
+# moved -- list of (case id, patient first name, patient last name)
+# skipped -- list of the same for cases not moved, patient already has case
+PushReport = namedtuple('PushReport', ['next_meeting', 'moved', 'skipped'])
+
+
+def next_meeting_after(meeting_date):
+    """First meeting after meeting_date that is not cancelled, or None"""
+    return (Meeting.query
+                   .filter(Meeting.date > meeting_date,
+                           Meeting.is_cancelled == False)
+                   .order_by(Meeting.date)
+                   .first())
+
+
+def _expire_moved(meeting_ids, case_ids):
+    """Expire objects in the session that the bulk update made stale"""
+    for instance in list(db.session.identity_map.values()):
+        if isinstance(instance, Case) and instance.id in case_ids:
+            db.session.expire(instance, ['meeting_id', 'meeting',
+                                         'updated_at'])
+        elif isinstance(instance, Meeting) and instance.id in meeting_ids:
+            db.session.expire(instance, ['cases'])
+
+
+def push_cases(meeting_id, next_meeting, statuses=None):
+    """Move cases of a meeting to next_meeting, caller must commit
+
+    One query finds the cases to move along with whether their patient
+    already has a case at next_meeting (an anti-join), then the cases
+    without a clash are moved with one UPDATE.
+
+    Arguments:
+    meeting_id -- int: id of meeting to move cases from
+    next_meeting -- Meeting: meeting to move cases to
+    statuses -- list of case statuses to move, None to move all cases
+
+    Returns PushReport
+    """
+    clash = aliased(Case)
+    has_clash = exists().where(clash.meeting_id == next_meeting.id).where(
+                               clash.patient_id == Case.patient_id)
+    query = (db.session.query(Case.id, Patient.first_name,
+                              Patient.last_name, has_clash)
+                       .join(Patient, Case.patient_id == Patient.id)
+                       .filter(Case.meeting_id == meeting_id)
+                       .order_by(Case.created_on, Case.id))
+    if statuses is not None:
+        query = query.filter(Case.status.in_(statuses))
+    moved = []
+    skipped = []
+    for case_id, first_name, last_name, is_clash in query:
+        if is_clash:
+            skipped.append((case_id, first_name, last_name))
+        else:
+            moved.append((case_id, first_name, last_name))
+
+    if moved:
+        moved_ids = {case_id for case_id, first_name, last_name in moved}
+        (Case.query.filter(Case.id.in_(moved_ids))
+                   .update({Case.meeting_id: next_meeting.id},
+                           synchronize_session=False))
+        # bulk update bypasses the ORM, so update session, caches and audit
+        # log here
+        _expire_moved({meeting_id, next_meeting.id}, moved_ids)
+        invalidate_meetings([meeting_id, next_meeting.id], db.session())
+        record_bulk(db.session(), Case, 'update',
+                    [(case_id, case_id,
+                      {'meeting_id': (meeting_id, next_meeting.id)})
+                     for case_id in sorted(moved_ids)])
+    return PushReport(next_meeting, moved, skipped)
+
+
+@job('push_cases')
+def push_cases_job(meeting_id, statuses=None):
+    """Job moving cases of a meeting to the next meeting, see push_cases
+
+    Returns dict of:
+    meeting -- str: date of the meeting cases were moved from
+    next_meeting -- str: date of the meeting cases were moved to, None if
+                    there is no meeting after it
+    moved, skipped -- as in PushReport
+    """
+    meeting = Meeting.query.get(meeting_id)
+    next_meeting = next_meeting_after(meeting.date)
+    result = {'meeting': meeting.date_repr, 'next_meeting': None,
+              'moved': [], 'skipped': []}
+    if next_meeting is not None:
+        report = push_cases(meeting_id, next_meeting, statuses)
+        result.update(next_meeting=next_meeting.date_repr,
+                      moved=report.moved, skipped=report.skipped)
+    return result
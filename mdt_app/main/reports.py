@@ -0,0 +1,199 @@
+"""
+PDF case reports for the notes, one case or a whole meeting at a time
+
+A meeting's cases are loaded in one query and turned into CaseReport
+tuples of plain text, which can be sent to other processes. The PDFs are
+then rendered on a process pool, as rendering is CPU bound, and zipped as
+each is ready so the zip is streamed rather than built up in memory. The
+pool is made on first use and kept for the life of the process.
+"""
+import threading
+import zipfile
+from collections import namedtuple
+from itertools import chain
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from xml.sax.saxutils import escape
+
+from ..models import Case
+from .loaders import case_report_options
+from config import date_style
+
+try:
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import (Paragraph, SimpleDocTemplate, Spacer,
+                                    Table, TableStyle)
+except ImportError:
+    SimpleDocTemplate = None
+
+# PDFs can be made, reportlab is installed
+PDF_REPORTS = SimpleDocTemplate is not None
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# filename -- str: name of the PDF file
+# title -- str: heading of the report
+# details -- list of (label, value) for the details table
+# sections -- list of (heading, text) for the text of the case
+# actions -- list of (action, assigned to, 'Yes' or 'No' for completed)
+CaseReport = namedtuple('CaseReport', ['filename', 'title', 'details',
+                                       'sections', 'actions'])
+
+
+def _date(value):
+    return value.strftime(date_style['format']) if value else ''
+
+
+def _name(user):
+    return '{} {}'.format(user.f_name, user.l_name) if user else ''
+
+
+def report_data(case):
+    """CaseReport of a case, loaded with case_report_options"""
+    patient = case.patient
+    details = [('Meeting', case.meeting.date_repr),
+               ('Hospital number', patient.hospital_number),
+               ('Patient', '{} {}'.format(patient.first_name,
+                                          patient.last_name)),
+               ('Date of birth', patient.date_of_birth_repr),
+               ('Sex', 'Male' if patient.sex == 'M' else 'Female'),
+               ('Consultant', _name(case.consultant)),
+               ('Added by', '{} on {}'.format(_name(case.created_by),
+                                              _date(case.created_on))),
+               ('Status', case.status),
+               ('MDT or VCMG', case.mdt_vcmg),
+               ('Clinic code', case.clinic_code or ''),
+               ('Next OPA', _date(case.next_opa)),
+               ('Planned surgery', case.planned_surgery or ''),
+               ('Surgery date', _date(case.surgery_date))]
+    sections = [('Medical history', case.medical_history),
+                ('Question', case.question),
+                ('Discussion', case.discussion or '')]
+    actions = [(action.action, _name(action.assigned_to),
+                'Yes' if action.is_completed else 'No')
+               for action in case.actions]
+    filename = '{date}-{hospital_number}-case-{id}.pdf'.format(
+        date=case.meeting.date.isoformat(),
+        hospital_number=patient.hospital_number, id=case.id)
+    title = 'MDT case report: {} {}'.format(patient.first_name,
+                                            patient.last_name)
+    return CaseReport(filename, title, details, sections, actions)
+
+
+def case_report(case_id):
+    """CaseReport of one case, None if there is no case"""
+    case = Case.query.options(*case_report_options()).get(case_id)
+    return report_data(case) if case else None
+
+
+def meeting_reports(meeting_id):
+    """CaseReport of each case of a meeting, in the order they were added"""
+    cases = (Case.query.filter_by(meeting_id=meeting_id)
+                       .options(*case_report_options())
+                       .order_by(Case.created_on, Case.id)
+                       .all())
+    return [report_data(case) for case in cases]
+
+
+def _paragraph(text, style):
+    return Paragraph(escape(text).replace('\n', '<br/>'), style)
+
+
+def render_pdf(report):
+    """PDF of a CaseReport, as bytes"""
+    if SimpleDocTemplate is None:
+        raise ImportError('reportlab must be installed to make PDF reports')
+    styles = getSampleStyleSheet()
+    body = styles['BodyText']
+    grid = TableStyle([('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+                       ('VALIGN', (0, 0), (-1, -1), 'TOP')])
+    story = [Paragraph(escape(report.title), styles['Title']),
+             Table([(label, _paragraph(value, body))
+                    for label, value in report.details],
+                   colWidths=(120, 340), style=grid)]
+    for heading, text in report.sections:
+        story.append(Paragraph(heading, styles['Heading2']))
+        story.append(_paragraph(text, body))
+    story.append(Paragraph('Actions', styles['Heading2']))
+    if report.actions:
+        story.append(Table([('Action', 'Assigned to', 'Completed')] +
+                           [(_paragraph(action, body), assigned_to, completed)
+                            for action, assigned_to, completed
+                            in report.actions],
+                           colWidths=(280, 120, 60), style=grid,
+                           repeatRows=1))
+    else:
+        story.append(Paragraph('No actions', body))
+    story.append(Spacer(1, 12))
+    pdf_file = BytesIO()
+    SimpleDocTemplate(pdf_file, pagesize=A4, title=report.title).build(story)
+    return pdf_file.getvalue()
+
+
+def _render_pool(workers):
+    """Process pool shared by all requests, made with workers processes
+    the first time it is used"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(workers)
+        return _pool
+
+
+def render_reports(reports, workers=None):
+    """Iterator of (filename, PDF) for each CaseReport, in order
+
+    The first report is rendered before returning, so that errors (e.g. no
+    reportlab) are raised before a response streaming the rest starts.
+
+    Arguments:
+    reports -- list of CaseReport
+    workers -- int: number of processes to render with, None for one per
+               CPU, 0 to render in this process
+    """
+    if not reports:
+        return iter(())
+    first = [(reports[0].filename, render_pdf(reports[0]))]
+    rest = reports[1:]
+    if workers == 0 or len(rest) < 2:
+        return chain(first, ((report.filename, render_pdf(report))
+                             for report in rest))
+    pdfs = _render_pool(workers).map(render_pdf, rest)
+    return chain(first, zip([report.filename for report in rest], pdfs))
+
+
+class _Chunks:
+    """Write only file for ZipFile, keeps what is written until taken
+
+    It has no tell or seek, so ZipFile writes each file's sizes after its
+    data instead of going back to the file's header.
+    """
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def zip_chunks(files):
+    """Bytes of a zip of (filename, data) files, a chunk per file"""
+    stream = _Chunks()
+    with zipfile.ZipFile(stream, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        for filename, data in files:
+            zip_file.writestr(filename, data)
+            yield stream.take()
+    # central directory, written when the zip is closed
+    yield stream.take()
@@ -0,0 +1,75 @@
+"""
+Progress summary of a meeting
+
+Counts of cases per status for the progress panel of case_list come from
+one GROUP BY query and are cached per meeting. A meeting's entry is removed
+when one of its cases is added or deleted, or changes status or meeting
+(see invalidate_on_commit in cache.py). Changes made without the ORM (e.g.
+bulk updates) must call invalidate_meetings themselves.
+"""
+from sqlalchemy import func, inspect
+
+from .. import db
+from ..cache import TTLCache, invalidate_on_commit
+from ..models import Case
+from ..routing import primary
+
+STATUSES = ('TBD', 'DISC', 'COMP')
+
+# Other workers can't invalidate this worker's entries, so keep ttl short
+summary_cache = TTLCache('meeting_summary', ttl=30)
+
+
+def _count_cases(meeting_id):
+    with primary():
+        rows = (db.session.query(Case.status, func.count(Case.id))
+                          .filter(Case.meeting_id == meeting_id)
+                          .group_by(Case.status)
+                          .all())
+    counts = {status.lower(): 0 for status in STATUSES}
+    counts.update({status.lower(): count for status, count in rows})
+    counts['total'] = sum(count for status, count in rows)
+    counts['percent_discussed'] = 0
+    if counts['total']:
+        # For a case to be complete, it must be discussed so add together
+        counts['percent_discussed'] = int(100 / counts['total'] *
+                                          (counts['disc'] + counts['comp']))
+    return counts
+
+
+def meeting_summary(meeting_id):
+    """Progress of a meeting's cases
+
+    Returns dictionary of:
+    tbd, disc, comp -- int: number of cases with each status
+    total -- int: number of cases
+    percent_discussed -- int: percent of cases that are DISC or COMP
+    """
+    return dict(summary_cache.get_or_set(meeting_id,
+                                         lambda: _count_cases(meeting_id)))
+
+
+def _changed_meeting_ids(session):
+    """Meetings whose summary is changed by pending cases"""
+    meeting_ids = set()
+    for case in session.new | session.deleted:
+        if isinstance(case, Case):
+            meeting_ids.add(case.meeting_id)
+    for case in session.dirty:
+        if not isinstance(case, Case):
+            continue
+        state = inspect(case)
+        meeting_history = state.attrs.meeting_id.history
+        if meeting_history.has_changes():
+            meeting_ids.update(meeting_history.added)
+            meeting_ids.update(meeting_history.deleted)
+        elif state.attrs.status.history.has_changes():
+            meeting_ids.add(case.meeting_id)
+    meeting_ids.discard(None)
+    return meeting_ids
+
+
+# invalidate_meetings(meeting_ids, session=None) for changes made without
+# the ORM
+invalidate_meetings = invalidate_on_commit(summary_cache,
+                                           _changed_meeting_ids)
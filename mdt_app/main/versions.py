@@ -0,0 +1,75 @@
+"""
+Versions of the list pages, for the conditional decorator
+
+A version is the latest updated_at and the number of rows of each table a
+page shows, limited to the page's meeting or user where it has one: a row
+inserted or updated moves updated_at on, and one deleted lowers the count.
+Tables only shown through rows of another table (patients of cases, users
+actions are assigned to) only need their latest updated_at, as their rows
+can't be deleted while they are shown. Each column is a subquery reading
+the updated_at indexes or the indexes the page's own queries use.
+"""
+from flask import request
+from sqlalchemy import func
+
+from .. import db
+from ..models import Action, Attendee, Case, Meeting, Patient, User
+
+
+def last_change(model, *criteria):
+    """Subquery of the latest updated_at of rows of model"""
+    return (db.session.query(func.max(model.updated_at))
+                      .filter(*criteria)
+                      .as_scalar())
+
+
+def row_count(model, *criteria):
+    """Subquery counting rows of model"""
+    return db.session.query(func.count(model.id)).filter(*criteria).as_scalar()
+
+
+def case_list_version():
+    """Cases of the meeting with their actions, and its attendees"""
+    if request.args.get('push_cases') or request.args.get('job'):
+        # pushing cases changes them, and the job's progress is shown
+        return None
+    meeting_date = request.args.get('meeting')
+    if not meeting_date:
+        # the table loads its cases from case_list_data
+        return []
+    meeting_id = (db.session.query(Meeting.id)
+                            .filter(Meeting.date == meeting_date)
+                            .as_scalar())
+    case_ids = db.session.query(Case.id).filter(Case.meeting_id == meeting_id)
+    return [last_change(Meeting),
+            last_change(Case, Case.meeting_id == meeting_id),
+            row_count(Case, Case.meeting_id == meeting_id),
+            last_change(Action, Action.case_id.in_(case_ids)),
+            row_count(Action, Action.case_id.in_(case_ids)),
+            last_change(Attendee, Attendee.meeting_id == meeting_id),
+            row_count(Attendee, Attendee.meeting_id == meeting_id),
+            last_change(Patient),
+            # the attendee form lists every confirmed user
+            last_change(User),
+            row_count(User)]
+
+
+def meeting_list_version():
+    """Meetings with counts of their cases and attendees"""
+    if request.args.get('job'):
+        return None
+    return [last_change(Meeting), row_count(Meeting),
+            last_change(Case), row_count(Case),
+            last_change(Attendee), row_count(Attendee)]
+
+
+def patient_list_version():
+    """Newest patients"""
+    return [last_change(Patient), row_count(Patient)]
+
+
+def action_list_version(user_id=None):
+    """Actions, of a user if given, with their case's status and patient"""
+    criteria = [Action.assigned_to_id == user_id] if user_id else []
+    return [last_change(Action, *criteria), row_count(Action, *criteria),
+            last_change(Case), last_change(Patient), last_change(User)]
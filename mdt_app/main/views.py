@@ -1,12 +1,109 @@
+import json
 from datetime import date
 
-from flask import render_template, redirect, request, url_for, flash, abort
+from flask import (render_template, redirect, request, url_for, flash, abort,
+                   jsonify, get_template_attribute, Response,
+                   stream_with_context, current_app)
 from flask_login import login_required, current_user
+from flask_sqlalchemy import Pagination
+from sqlalchemy import String, cast
+from sqlalchemy.orm import aliased
 
 from .. import db
-from ..models import Case, Meeting, Patient, Action, Attendee, User
+from ..audit import case_history
+from ..changes import (FEED_LIMIT, FEED_MODELS, MAX_FEED_LIMIT, changed_rows,
+                       parse_cursor)
+from ..conditional import conditional
+from ..decorators import admin_or_token
+from ..exporter import (EXPORTS, FILE_TYPES, STATUSES, ExportFilter,
+                        csv_lines, xlsx_chunks)
+from ..instrumentation import query_budget
+from ..jobs import enqueue
+from ..metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, collect, render
+from ..models import Case, Meeting, Patient, Action, Attendee, Job, User
+from ..routing import read_only
+from ..search import search_cases
 from . import main
+from .actions import complete_action, update_case_status
+from .attendees import attendee_names, sync_attendees
+from .datatables import Column, DataTable, formatted_date
 from .forms import *
+from .loaders import (action_options, attendee_options, case_detail_options,
+                      case_options, case_report_options)
+from .lookup import LOOKUP_LIMIT, find_patients
+from .meetings import meeting_page, parse_date
+from .reports import (PDF_REPORTS, case_report, meeting_reports, render_pdf,
+                      render_reports, zip_chunks)
+from .summary import meeting_summary
+from .versions import (action_list_version, case_list_version,
+                       meeting_list_version, patient_list_version)
+
+ACTIONS_PER_PAGE = 50
+SEARCH_RESULTS_PER_PAGE = 20
+RECENT_PATIENTS = 25
+XLSX_MIMETYPE = ('application/'
+                 'vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+
+
+def _flash_push_report(report, old_date=None):
+    """Flash message for each case moved or not moved by a push job
+
+    Arguments:
+    report -- dict: result of push.push_cases_job
+    old_date -- str: date cases were moved from, to show in the messages
+    """
+    new_date = report['next_meeting']
+    if new_date is None:
+        flash('Cases could not be pushed to next meeting, '
+              'no meetings exist after this one',
+              category='warning')
+        return
+    moved_from = ' from {}'.format(old_date) if old_date else ''
+    for case_id, f_name, l_name in report['skipped']:
+        flash(('Case for patient {f_name} {l_name} was not moved as '
+               'patient also has a case on {new_date}'
+               ).format(f_name=f_name, l_name=l_name, new_date=new_date),
+              category='warning')
+    for case_id, f_name, l_name in report['moved']:
+        flash(('Case for patient {f_name} {l_name} was moved{moved_from} '
+               'to {new_date}'
+               ).format(f_name=f_name, l_name=l_name, moved_from=moved_from,
+                        new_date=new_date),
+              category='success')
+
+
+def _push_job_from_args(show_old_date=False):
+    """Push job in the job request argument, flash its outcome if finished
+
+    Once the job has finished, views redirect to _url_without_job, so the
+    outcome is shown once rather than on every reload of the page.
+
+    Arguments:
+    show_old_date -- bool: say which meeting cases were moved from
+
+    Returns Job, None if no job argument
+    """
+    job_id = request.args.get('job', type=int)
+    push_job = Job.query.get(job_id) if job_id else None
+    if push_job is None or push_job.kind != 'push_cases':
+        return None
+    if push_job.status == 'done':
+        report = json.loads(push_job.result)
+        _flash_push_report(report,
+                           report['meeting'] if show_old_date else None)
+    elif push_job.status == 'failed':
+        flash('Cases could not be moved to the next meeting, '
+              'please try again',
+              category='danger')
+    return push_job
+
+
+def _url_without_job():
+    """URL of the request without its job argument"""
+    args = request.args.copy()
+    args.pop('job', None)
+    return url_for(request.endpoint,
+                   **dict(request.view_args, **args.to_dict(flat=False)))
 
 
 @main.route('/index')
@@ -17,117 +114,450 @@ def index():
 
 @main.route('/')
 @main.route('/cases/',  methods=['GET', 'POST'])
+# pushing cases runs the push job in the request when JOBS_INLINE is set
+@query_budget(31)
+@read_only
 @login_required
+@conditional(case_list_version)
 def case_list():
     """Returns cases, progress and attendee form
 
     Fairly bloated view but used for a lot of situations
     If meeting date request argument, generate attendee form and MDT progress
     otherwise set these to be null
-    If push_cases, move undiscussed cases to next meeting
-    For POST method, delete any attendees for meeting that are not in form
-    add any new attendees.
+    If push_cases, queue a job to move undiscussed cases to next meeting,
+    redirecting to show its progress unless it has already run
+    For POST method, save attendees and comment (see meeting_attendees for
+    saving without reloading the page).
+    Without a meeting, cases are not loaded here: the table fetches pages
+    from case_list_data instead.
 
     Request arguments:
     meeting -- date str: meeting date to filter by (e.g. 2017-09-20)
     push_cases -- if exists, push all undiscussed cases to next meeting
+    job -- int: id of push job to show the progress or outcome of
 
 
     Template variables:
     title -- title
-    cases -- all cases (sorted by dec. meeting_date and inc. created_on)
-    counts -- dictionary of total per status of cases, and percent complete
+    cases -- cases for meeting (sorted by inc. created_on), None if all cases
+    counts -- dictionary of total per status of cases, total and percent
+              discussed (from summary.meeting_summary)
     attendee_form -- attendee form of all confirmed users
     attendees -- list of all attendee objects
     meeting -- meeting date
+    meeting_id -- meeting id, None if all cases
+    job -- Job: push job from job request argument, None if no job
     """
 
     meeting_date = request.args.get('meeting')
     title = 'All cases'
+    push_job = _push_job_from_args()
+    if push_job is not None and push_job.status in ('done', 'failed'):
+        return redirect(_url_without_job())
     if meeting_date:
         meeting = Meeting.query.filter_by(date=meeting_date).first()
+        if request.args.get('push_cases'):
+            # Push undiscussed cases to next meeting, before loading cases
+            push_job = enqueue('push_cases',
+                               created_by_id=current_user.get_id(),
+                               meeting_id=meeting.id, statuses=['TBD'])
+            if push_job.status != 'done':
+                # page shows the job's progress until a worker has run it
+                return redirect(url_for('main.case_list',
+                                        meeting=meeting_date,
+                                        job=push_job.id))
+            _flash_push_report(json.loads(push_job.result))
         case_query = Case.query.filter_by(meeting=meeting)
-        attendees = Attendee.query.filter_by(meeting=meeting).all()
+        attendees = (Attendee.query.filter_by(meeting=meeting)
+                                   .options(*attendee_options())
+                                   .all())
         attendee_list = [attendee.user for attendee in attendees]
         attendee_form = AttendeeForm(data={'user': attendee_list,
                                            'comment': meeting.comment})
         title = 'Meeting: {}'.format(meeting.date_repr)
-        counts = {stat.lower(): (Case.query
-                                     .filter_by(status=stat, meeting=meeting)
-                                     .count())
-                  for stat in
-                  ['TBD', 'COMP', 'DISC']}
-        # For a case to be complete, it must be discussed so add together
-        case_count = len(case_query.all())
-        if case_count:
-            counts['percent_discussed'] = int(100 / case_count *
-                                              (counts['disc'] + counts['comp']))
+        counts = meeting_summary(meeting.id)
+        cases = (case_query.join(Meeting)
+                           .options(*case_options({'meeting': None}))
+                           .order_by(Meeting.date.desc(), Case.created_on)
+                           .all())
     else:
-        case_query = Case.query
+        meeting = None
         attendee_form = None
         counts = None
         attendees = None
-    cases = (case_query.join(Meeting)
-                       .order_by(Meeting.date.desc(), Case.created_on)
-                       .all())
-    push_cases = request.args.get('push_cases')
+        cases = None
     # Pick up submission from page
-    if push_cases:
-        # Push cases to next meeting
-        next_meeting = (Meeting.query
-                        .filter(Meeting.date > meeting_date,
-                                Meeting.is_cancelled == False)
-                        .order_by(Meeting.date)
-                        .first())
-        if not next_meeting:
-            flash('Cases could not be pushed to next meeting, '
-                  'no meetings exist after this one',
-                  category='warning')
-        else:
-            for to_push in cases:
-                if to_push.status == 'TBD':
-                    if any(to_push.patient_id == next_meet_case.patient_id
-                           for next_meet_case in next_meeting.cases):
-                        flash(('Case for patient {f_name} {l_name} was not '
-                               'moved as patient also has a case on {new_date}'
-                               ).format(f_name=to_push.patient.first_name,
-                                        l_name=to_push.patient.last_name,
-                                        new_date=next_meeting.date_repr),
-                              category='warning')
-                    else:
-                        to_push.meeting_id = next_meeting.id
-                        flash(
-                              ('Case for patient {f_name} {l_name} was moved '
-                               'to {new_date}'
-                               ).format(f_name=to_push.patient.first_name,
-                                        l_name=to_push.patient.last_name,
-                                        new_date=next_meeting.date_repr),
-                              category='success')
-            db.session.commit()
-    elif attendee_form and attendee_form.validate_on_submit():
+    if attendee_form and attendee_form.validate_on_submit():
         # attendee_form not present if no filter by date
         meeting.comment = attendee_form.comment.data
-        form_attendees = attendee_form.user.data
-        for row_attendee in attendees:
-            # remove users in database that are not in form data
-            if not any(row_attendee.user.username == form_user.username
-                       for form_user in form_attendees):
-                db.session.delete(row_attendee)
-        for form_user in form_attendees:
-            # if form user not in database, add them
-            if not any(form_user.username == row_attendee.user.username
-                       for row_attendee in attendees):
-                new_attendee = Attendee(meeting_id=meeting.id,
-                                        user=form_user)
-                db.session.add(new_attendee)
+        sync_attendees(meeting.id,
+                       [form_user.id for form_user in attendee_form.user.data])
         db.session.commit()
         return redirect(url_for('main.case_list', meeting=meeting_date))
     return render_template('case_list.html', cases=cases, title=title,
                            counts=counts, attendee_form=attendee_form,
-                           attendees=attendees, meeting=meeting_date)
+                           attendees=attendees, meeting=meeting_date,
+                           meeting_id=meeting.id if meeting else None,
+                           job=push_job)
+
+
+@main.route('/cases/data')
+@query_budget(6)
+@read_only
+@login_required
+def case_list_data():
+    """Page of the case overview table for DataTables server-side mode
+
+    Paging, ordering and searching (global and per column) are done in SQL,
+    so only the rows for the requested page are loaded.
+    Each row has the rendered html for each cell, from _case_cells.html
+
+    Request arguments:
+    DataTables server-side arguments (draw, start, length, search, order
+    and columns)
+
+    Returns JSON:
+    draw -- int: draw counter sent by DataTables
+    recordsTotal -- int: total number of cases
+    recordsFiltered -- int: number of cases matching the search
+    data -- list: dict of cell html for each case on the page
+    """
+
+    creator = aliased(User)
+    consultant = aliased(User)
+    query = (Case.query.join(Case.meeting)
+                       .join(Case.patient)
+                       .outerjoin(creator, Case.created_by)
+                       .outerjoin(consultant, Case.consultant)
+                       .options(*case_options({'meeting': None,
+                                               'patient': None,
+                                               'created_by': creator,
+                                               'consultant': consultant})))
+    # meeting dates are searched as shown (DD-Mon-YYYY) and as YYYY-MM-DD
+    columns = [Column('meeting', [formatted_date(Meeting.date),
+                                  cast(Meeting.date, String)], Meeting.date),
+               Column('previous', [], None),
+               Column('created_by', [creator.f_name, creator.l_name],
+                      creator.l_name),
+               Column('patient', [Patient.hospital_number,
+                                  Patient.first_name, Patient.last_name],
+                      Patient.last_name),
+               Column('consultant', [consultant.initials],
+                      consultant.initials),
+               Column('medical_history', [Case.medical_history],
+                      Case.medical_history),
+               Column('question', [Case.question], Case.question),
+               Column('discussion', [Case.discussion], Case.discussion),
+               Column('actions', [], None)]
+    cells = {column.name: get_template_attribute('_case_cells.html',
+                                                 column.name)
+             for column in columns}
+    row_class = {'COMP': 'alert alert-success', 'DISC': 'alert alert-warning'}
+
+    def render_row(case):
+        row = {name: cell(case) for name, cell in cells.items()}
+        row['DT_RowClass'] = row_class.get(case.status, '')
+        return row
+
+    table = DataTable(request.args, query, columns,
+                      default_order=[Meeting.date.desc(), Case.created_on,
+                                     Case.id])
+    return jsonify(table.response(render_row))
+
+
+@main.route('/cases/search')
+@read_only
+@login_required
+def case_search():
+    """Search the text of cases and patient details, a page at a time
+
+    Request arguments:
+    q -- str: words to search for, see search.search_cases
+    page -- int: page of results to show, default is first page
+
+    Template variables:
+    title -- title
+    q -- str: words searched for
+    cases -- list: cases on this page, best match first
+    pagination -- Pagination of results, None if nothing searched for
+    """
+    q = request.args.get('q', '').strip()
+    page = max(request.args.get('page', 1, type=int), 1)
+    cases = []
+    pagination = None
+    if q:
+        total, case_ids = search_cases(q, page, SEARCH_RESULTS_PER_PAGE)
+        if case_ids:
+            found = {case.id: case for case in
+                     (Case.query.filter(Case.id.in_(case_ids))
+                                .options(*case_options()))}
+            # index may have cases not committed by another worker yet
+            cases = [found[case_id] for case_id in case_ids
+                     if case_id in found]
+        pagination = Pagination(None, page, SEARCH_RESULTS_PER_PAGE, total,
+                                cases)
+    return render_template('case_search.html', title='Search cases', q=q,
+                           cases=cases, pagination=pagination)
+
+
+def _export_filter():
+    """exporter.ExportFilter from request arguments
+
+    Dates that aren't valid are ignored, as in the meeting list pager.
+    Statuses that aren't valid abort with 400.
+    """
+    start = request.args.get('start', type=parse_date)
+    end = request.args.get('end', type=parse_date)
+    statuses = request.args.getlist('status')
+    if any(status not in STATUSES for status in statuses):
+        abort(400)
+    return ExportFilter(start, end, request.args.get('consultant') or None,
+                        statuses)
+
+
+@main.route('/export')
+@read_only
+@login_required
+def export():
+    """Form for choosing cases or actions to export
+
+    Template variables:
+    title -- title
+    consultants -- list of consultants to filter by
+    statuses -- list of case statuses to filter by
+    file_types -- list of file types that can be downloaded
+    """
+    return render_template('export.html', title='Export',
+                           consultants=get_consultants().all(),
+                           statuses=STATUSES, file_types=FILE_TYPES)
+
+
+@main.route('/export/<any(cases, actions):kind>.<any(csv, xlsx):file_type>')
+@read_only
+@login_required
+def export_rows(kind, file_type):
+    """Download cases or actions, streamed as they are read
+
+    Request arguments:
+    kind -- str: cases or actions
+    file_type -- str: csv or xlsx
+    start, end -- str: YYYY-MM-DD first and last meeting dates, optional
+    consultant -- str: username of the cases' consultant, optional
+    status -- str: case status, can be repeated, optional
+
+    Returns CSV or XLSX file attachment, 501 if XLSX can't be written
+    """
+    if file_type not in FILE_TYPES:
+        # checked before the response starts, as it can't be an error after
+        abort(501)
+    header, rows = EXPORTS[kind](_export_filter())
+    if file_type == 'csv':
+        chunks, mimetype = csv_lines(header, rows), 'text/csv'
+    else:
+        chunks, mimetype = xlsx_chunks(header, rows), XLSX_MIMETYPE
+    filename = '{kind}-{today}.{file_type}'.format(
+        kind=kind, today=date.today().isoformat(), file_type=file_type)
+    return Response(stream_with_context(chunks), mimetype=mimetype,
+                    headers={'Content-Disposition':
+                             'attachment; filename={}'.format(filename)})
+
+
+@main.route('/meetings/<int:pk>/summary')
+@read_only
+@login_required
+def meeting_summary_data(pk):
+    """Progress of a meeting's cases as JSON, for refreshing progress panel
+
+    Request arguments:
+    pk -- int: meeting id
+
+    Returns JSON of summary.meeting_summary
+    """
+
+    return jsonify(meeting_summary(pk))
+
+
+@main.route('/jobs/<int:job_id>')
+@login_required
+def job_status(job_id):
+    """Status of a background job as JSON, polled while it runs
+
+    Request arguments:
+    job_id -- int: job id
+
+    Returns JSON:
+    id -- int: job id
+    kind -- str: kind of job
+    status -- str: queued, running, done or failed
+    attempts -- int: times the job has been started
+    result -- what the job returned, None until done
+    error -- str: last line of the error of the last attempt, None if none
+    """
+    job = Job.query.get_or_404(job_id)
+    return jsonify(id=job.id, kind=job.kind, status=job.status,
+                   attempts=job.attempts,
+                   result=json.loads(job.result) if job.result else None,
+                   error=job.error.splitlines()[-1] if job.error else None)
+
+
+@main.route('/metrics')
+@admin_or_token('METRICS_TOKEN')
+def metrics_text():
+    """Request, database pool and cache metrics of all workers, for
+    Prometheus
+
+    Only for admins, or with the METRICS_TOKEN of config as a bearer token
+    in the Authorization header.
+
+    Returns text in Prometheus exposition format, see metrics.render
+    """
+    return Response(render(collect(current_app.config.get('METRICS_DIR'))),
+                    mimetype=METRICS_CONTENT_TYPE)
+
+
+@main.route('/changes')
+@read_only
+@admin_or_token('CHANGES_TOKEN')
+def change_feed():
+    """Rows of a table inserted or updated since a cursor, for incremental
+    sync, oldest change first
+
+    Only for admins, or with the CHANGES_TOKEN of config as a bearer token
+    in the Authorization header, as rows include e.g. users' emails.
+
+    Request arguments:
+    table -- str: table name, e.g. cases, see changes.FEED_MODELS
+    since -- str: cursor returned by the last page, none to start from the
+             first row
+    limit -- int: most rows to return, up to changes.MAX_FEED_LIMIT
+
+    Returns JSON:
+    table -- str: table name
+    rows -- list of objects: column name: value
+    cursor -- str: since argument of the next page, None if no rows
+    has_more -- bool: whether there are more rows to fetch now
+    """
+    table_name = request.args.get('table', '')
+    if table_name not in FEED_MODELS:
+        abort(400)
+    since = request.args.get('since')
+    try:
+        since = parse_cursor(since) if since else None
+    except ValueError:
+        abort(400)
+    limit = request.args.get('limit', FEED_LIMIT, type=int)
+    if limit < 1:
+        abort(400)
+    page = changed_rows(table_name, since, min(limit, MAX_FEED_LIMIT))
+    return jsonify(table=table_name, rows=page.rows, cursor=page.cursor,
+                   has_more=page.has_more)
+
+
+@main.route('/cases/<int:case_id>/report.pdf')
+@read_only
+@login_required
+def case_report_pdf(case_id):
+    """PDF report of a case and its actions, for the notes
+
+    Request arguments:
+    case_id -- int: case id
+
+    Returns PDF, see reports.render_pdf, 501 if PDFs can't be made
+    """
+    if not PDF_REPORTS:
+        abort(501)
+    report = case_report(case_id)
+    if report is None:
+        abort(404)
+    return Response(render_pdf(report), mimetype='application/pdf',
+                    headers={'Content-Disposition':
+                             'inline; filename={}'.format(report.filename)})
+
+
+@main.route('/cases/<int:case_id>/history')
+@read_only
+@login_required
+def case_history_list(case_id):
+    """Changes to a case and its actions from the audit log, newest first
+
+    Request arguments:
+    case_id -- int: case id
+    before -- int: show changes older than this audit entry id
+
+    Template variables:
+    title -- title
+    case -- Case
+    page -- audit.HistoryPage: changes on this page, and id for the link
+            to older changes
+    """
+    case = Case.query.options(*case_report_options()).get_or_404(case_id)
+    page = case_history(case_id, before=request.args.get('before', type=int))
+    return render_template('case_history.html', case=case, page=page,
+                           title='History of case {}'.format(case_id))
+
+
+@main.route('/meetings/<int:pk>/reports.zip')
+@read_only
+@login_required
+def meeting_reports_zip(pk):
+    """Zip of the PDF report of every case of a meeting
+
+    Cases are loaded and the first report rendered before the response
+    starts; the rest are rendered on a process pool (REPORT_WORKERS in
+    config) and streamed as they are zipped.
+
+    Request arguments:
+    pk -- int: meeting id
+
+    Returns zip attachment of PDFs, 501 if PDFs can't be made
+    """
+    if not PDF_REPORTS:
+        # checked before the response starts, as it can't be an error after
+        abort(501)
+    meeting = Meeting.query.get_or_404(pk)
+    reports = meeting_reports(meeting.id)
+    chunks = zip_chunks(render_reports(reports,
+                                       current_app.config['REPORT_WORKERS']))
+    filename = 'mdt-{}-reports.zip'.format(meeting.date.isoformat())
+    return Response(chunks, mimetype='application/zip',
+                    headers={'Content-Disposition':
+                             'attachment; filename={}'.format(filename)})
+
+
+@main.route('/meetings/<int:pk>/attendees', methods=['POST'])
+@login_required
+def meeting_attendees(pk):
+    """Save attendees and comment for a meeting from AttendeeForm
+
+    Attendees not in the form are removed and new ones added, see
+    attendees.sync_attendees. Used by the attendee panel of case_list so
+    that the case table isn't reloaded.
+
+    Request arguments:
+    pk -- int: meeting id
+
+    Returns JSON:
+    attendees -- list of attendee names
+    added -- int: number of attendees added
+    removed -- int: number of attendees removed
+    errors -- dict of form errors, only if form is not valid (status 400)
+    """
+
+    meeting = Meeting.query.get_or_404(pk)
+    form = AttendeeForm()
+    if not form.validate_on_submit():
+        return jsonify(errors=form.errors), 400
+    meeting.comment = form.comment.data
+    added, removed = sync_attendees(pk, [user.id for user in form.user.data])
+    db.session.commit()
+    names = ['{} {}'.format(f_name, l_name)
+             for f_name, l_name in attendee_names(pk)]
+    return jsonify(attendees=names, added=len(added), removed=len(removed))
 
 
 @main.route('/cases/create/<patient_id>',  methods=['GET', 'POST'])
+@query_budget(8)
 @login_required
 def case_create(patient_id=None):
     """ Returns cases for patient and form to create new case for patient
@@ -149,6 +579,7 @@ def case_create(patient_id=None):
     cases = (Case.query
                  .filter_by(patient_id=patient_id)
                  .join(Meeting)
+                 .options(*case_options({'meeting': None}))
                  .order_by(Meeting.date.desc())
                  .all())
     title = ('Cases for {f_name} {l_name} {hosp}'
@@ -199,6 +630,7 @@ def case_create(patient_id=None):
 
 
 @main.route('/cases/edit/<patient_id>/<case_id>',  methods=['GET', 'POST'])
+@query_budget(12)
 @login_required
 def case_edit(patient_id=None, case_id=None):
     """ List cases for patient and case edit form
@@ -234,11 +666,12 @@ def case_edit(patient_id=None, case_id=None):
     cases = (Case.query
                  .filter_by(patient_id=patient_id)
                  .join(Meeting)
+                 .options(*case_options({'meeting': None}))
                  .order_by(Meeting.date.desc())
                  .all())
-    case = Case.query.filter_by(id=case_id).first()
-    actions = (Action.query.filter_by(case_id=case_id)
-                           .all())
+    case = (Case.query.filter_by(id=case_id)
+                      .options(*case_detail_options())
+                      .first())
     title = ('Cases for {f_name} {l_name} {hosp}'
              ).format(f_name=patient.first_name,
                       l_name=patient.last_name,
@@ -248,7 +681,7 @@ def case_edit(patient_id=None, case_id=None):
     form = CaseEditForm(obj=case,
                         case_id=case_id)
     if request.method == 'GET':
-        if case.status == 'COMP' and not actions:
+        if case.status == 'COMP' and not case.total_actions:
             # Set up form, if case complete and no actions, tick no actions
             form.no_actions.data = True
     elif form.validate_on_submit():
@@ -296,7 +729,9 @@ def case_edit(patient_id=None, case_id=None):
                                 assigned_to=form.action_to.data)
             db.session.add(new_action)
         db.session.commit()
-        case = Case.query.filter_by(id=case_id).first()
+        case = (Case.query.filter_by(id=case_id)
+                          .options(*case_detail_options())
+                          .first())
         if form.action.data:
             # reset action form to blank and load form at table
             form.action.data = None
@@ -334,10 +769,13 @@ def meeting_create():
 
 
 @main.route('/meetings/edit/<int:pk>', methods=['GET', 'POST'])
+# cancelling runs the push job in the request when JOBS_INLINE is set
+@query_budget(25)
 @login_required
 def meeting_edit(pk):
     """Edit meeting, if meeting is cancelled push cases to next meeting
 
+    Cases are moved by a job, see push.push_cases_job.
     Do not move case if a meeting in the future that is no cancelled
     does not exist.
     Do not move case if the patient already has a case on that date.
@@ -353,55 +791,52 @@ def meeting_edit(pk):
     meeting = Meeting.query.filter_by(id=pk).first()
     form = MeetingForm(obj=meeting)
     if form.validate_on_submit():
+        # cases are only pushed when the meeting is cancelled, not on every
+        # edit of a cancelled meeting
+        cancelled = form.is_cancelled.data and not meeting.is_cancelled
         meeting.date = form.date.data
         meeting.comment = form.comment.data
         meeting.is_cancelled = form.is_cancelled.data
-        if form.is_cancelled.data:
-            next_meeting = (Meeting.query
-                                   .filter(Meeting.date > meeting.date,
-                                           Meeting.is_cancelled == False)
-                                   .order_by(Meeting.date)
-                                   .first())
-            if not next_meeting:
-                flash('Cases could not be pushed to next meeting, '
-                      'no meetings exist after this one',
-                      category='warning')
-            else:
-                cases = Case.query.filter_by(meeting_id=pk)
-                for case in cases:
-                    if any(case.patient_id == next_meet_case.patient_id
-                           for next_meet_case in next_meeting.cases):
-                        flash(('Case for patient {f_name} {l_name} was not '
-                               'moved as patient also has a case on {new_date}')
-                              .format(f_name=case.patient.first_name,
-                                      l_name=case.patient.last_name,
-                                      old_date=meeting.date_repr,
-                                      new_date=next_meeting.date_repr),
-                              category='warning')
-                    else:
-                        case.meeting_id = next_meeting.id
-                        flash(('Case for patient {f_name} {l_name} was moved '
-                              'from {old_date} to {new_date}')
-                              .format(f_name=case.patient.first_name,
-                                      l_name=case.patient.last_name,
-                                      old_date=meeting.date_repr,
-                                      new_date=next_meeting.date_repr),
-                              category='success')
         db.session.commit()
         flash('Meeting for {date} has been edited'.format(date=form.date.data),
               category='success')
+        if cancelled:
+            # meeting list shows the job's progress, then its outcome
+            push_job = enqueue('push_cases',
+                               created_by_id=current_user.get_id(),
+                               meeting_id=pk)
+            return redirect(url_for('main.meeting_list', job=push_job.id))
         return redirect(url_for('main.meeting_list'))
     return render_template('meeting_form.html', form=form, title='Edit meeting')
 
 
 @main.route('/meetings')
+@query_budget(4)
+@read_only
 @login_required
+@conditional(meeting_list_version)
 def meeting_list():
-    """List all meetings by decreasing date"""
+    """List meetings by decreasing date, a page at a time
+
+    Request arguments:
+    before -- date str: show meetings before this date (e.g. 2017-09-20)
+    after -- date str: show meetings after this date
+    job -- int: id of push job to show the progress or outcome of
 
-    meetings = Meeting.query.order_by(Meeting.date.desc()).all()
-    return render_template('meeting_list.html', meetings=meetings,
-                           title='Meetings')
+    Template variables:
+    title -- title
+    page -- meetings.MeetingPage: meetings with counts of cases by status
+            and of attendees, and dates for links to newer and older pages
+    job -- Job: push job from job request argument, None if no job
+    """
+
+    push_job = _push_job_from_args(show_old_date=True)
+    if push_job is not None and push_job.status in ('done', 'failed'):
+        return redirect(_url_without_job())
+    page = meeting_page(before=request.args.get('before', type=parse_date),
+                        after=request.args.get('after', type=parse_date))
+    return render_template('meeting_list.html', page=page, title='Meetings',
+                           job=push_job)
 
 
 @main.route('/patients/create', methods=['GET', 'POST'])
@@ -465,40 +900,77 @@ def patient_edit(pk):
 
 
 @main.route('/patients')
+@query_budget(4)
+@read_only
 @login_required
+@conditional(patient_list_version)
 def patient_list():
-    """List all meetings with newest first
+    """Most recently added patients, others are found with patient_lookup
 
     Template objects:
     title
-    patients -- list of all patients
+    patients -- list of the newest patients
     """
 
-    patients = Patient.query.order_by(Patient.id.desc()).all()
+    patients = (Patient.query.order_by(Patient.id.desc())
+                             .limit(RECENT_PATIENTS)
+                             .all())
     return render_template('patient_list.html', patients=patients,
                            title='Patients')
 
 
-@main.route('/actions/<user_id>/',  methods=['GET', 'POST'])
-@main.route('/actions/',  methods=['GET', 'POST'])
+@main.route('/patients/lookup')
+@query_budget(2)
+@read_only
+@login_required
+def patient_lookup():
+    """Patients matching words typed, for the typeahead on patient_list
+
+    Request arguments:
+    q -- str: words to match, see lookup.find_patients
+    limit -- int: most patients to return, up to lookup.LOOKUP_LIMIT
+
+    Returns JSON:
+    patients -- list of dict of id, hospital_number, first_name, last_name,
+                date_of_birth, sex, cases_url and edit_url
+    """
+    limit = min(request.args.get('limit', LOOKUP_LIMIT, type=int),
+                LOOKUP_LIMIT)
+    patients = find_patients(request.args.get('q', ''), limit)
+    return jsonify(patients=[
+        {'id': patient.id,
+         'hospital_number': patient.hospital_number,
+         'first_name': patient.first_name,
+         'last_name': patient.last_name,
+         'date_of_birth': patient.date_of_birth_repr,
+         'sex': patient.sex,
+         'cases_url': url_for('main.case_create', patient_id=patient.id),
+         'edit_url': url_for('main.patient_edit', pk=patient.id)}
+        for patient in patients])
+
+
+@main.route('/actions/<user_id>/')
+@main.route('/actions/')
+@query_budget(5)
+@read_only
 @login_required
+@conditional(action_list_version)
 def action_list(user_id=None):
-    """List all actions, filter by user_id if given.
+    """List actions a page at a time, filter by user_id if given.
 
     If user_id is given, filter by the user. If not return all actions.
-
-    Complete action directly from list using action_id request argument.
-    If all actions in case are complete, update the case status to be COMP
-    otherwise set status of case as DISC.
+    Actions are completed from the list by posting to action_complete.
 
     Request arguments:
     user_id -- int: user id to filter by if given.
-    action_id -- int: id of action that is completed, update db accordingly
+    page -- int: page of actions to show, default is first page
 
     Template objects:
     title -- title
     user_id -- int: user id for actions
-    actions -- list: action models for user
+    actions -- list: action models for user on this page
+    pagination -- Pagination of actions
+    complete_form -- ActionCompleteForm, for csrf token
     """
     title = 'Actions '
     if user_id:
@@ -507,28 +979,51 @@ def action_list(user_id=None):
         title += 'assigned to {} {}'.format(user.f_name, user.l_name)
     else:
         action_query = Action.query
-    action_id = request.args.get('action_id')
-    if action_id:
-        # action_id to complete
-        complete_action = Action.query.filter_by(id=action_id).first()
-        complete_action.is_completed = True
-        case = Case.query.filter_by(id=complete_action.case_id).first()
-        case_actions = (Action.query
-                              .filter_by(case_id=complete_action.case_id)
-                              .all())
-        if all(case_action.is_completed
-               for case_action in case_actions):
-            case.status = 'COMP'
-        else:
-            case.status = 'DISC'
-        db.session.commit()
-    actions = (action_query.join(Case)
-                           .order_by(Action.is_completed,
-                                     Case.status.desc(),
-                                     Action.id.desc())
-                           .all())
-    return render_template('action_list.html', actions=actions, user_id=user_id,
-                           title=title)
+    page = request.args.get('page', 1, type=int)
+    pagination = (action_query.join(Case)
+                              .options(*action_options(case_joined=True))
+                              .order_by(Action.is_completed,
+                                        Case.status.desc(),
+                                        Action.id.desc())
+                              .paginate(page, per_page=ACTIONS_PER_PAGE,
+                                        error_out=False))
+    return render_template('action_list.html', actions=pagination.items,
+                           pagination=pagination, user_id=user_id,
+                           complete_form=ActionCompleteForm(), title=title)
+
+
+@main.route('/actions/complete/<int:action_id>/', methods=['POST'])
+@query_budget(10)
+@login_required
+def action_complete(action_id):
+    """Mark action as complete, and update status of its case
+
+    If all actions in case are complete, update the case status to be COMP
+    otherwise set status of case as DISC.
+    Returns JSON for AJAX requests, otherwise redirects to action_list.
+
+    Request arguments:
+    action_id -- int: id of action to complete
+    user_id -- int: user id of action list to redirect to
+    page -- int: page of action list to redirect to
+
+    Returns JSON:
+    action_id -- int: id of action completed
+    case_id -- int: id of action's case
+    case_status -- str: new status of case
+    """
+    action = Action.query.get_or_404(action_id)
+    form = ActionCompleteForm()
+    if not form.validate_on_submit():
+        abort(400)
+    case_status = complete_action(action)
+    db.session.commit()
+    if request.is_xhr:
+        return jsonify(action_id=action_id, case_id=action.case_id,
+                       case_status=case_status)
+    return redirect(url_for('main.action_list',
+                            user_id=request.args.get('user_id'),
+                            page=request.args.get('page')))
 
 
 @main.route('/actions/edit/<int:action_id>/', methods=['GET', 'POST'])
@@ -555,9 +1050,8 @@ def action_edit(action_id):
         db.session.commit()
         flash("Action '{act}' deleted".format(act=action.action),
               category='success')
-        remaining_actions = Action.query.filter_by(case_id=case_id).all()
-        if not remaining_actions:
-            case = Case.query.filter_by(id=case_id).first()
+        case = Case.query.filter_by(id=case_id).first()
+        if not case.total_actions:
             case.status = 'TBD'
             db.session.commit()
             flash("Case status is now 'to be discussed' "
@@ -570,13 +1064,8 @@ def action_edit(action_id):
         action.action = form.action.data
         action.assigned_to_id = form.assigned_to.data.id
         action.is_completed = form.is_completed.data
-        case = Case.query.filter_by(id=action.case_id).first()
-        case_actions = Action.query.filter_by(case_id=action.case_id).all()
-        if all(case_action.is_completed
-               for case_action in case_actions):
-            case.status = 'COMP'
-        else:
-            case.status = 'DISC'
+        db.session.flush()
+        update_case_status(action.case_id)
         db.session.commit()
         flash('Action edited ({})'.format(action.action),
               category='success')
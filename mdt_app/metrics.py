@@ -0,0 +1,288 @@
+"""
+Request, database pool and cache metrics in Prometheus text format
+
+Each process counts requests by endpoint, method and status, puts their
+latency in histogram buckets, and counts requests in flight and database
+connection checkouts. Pool sizes and cache hits are read when the metrics
+are collected.
+
+Gunicorn runs several worker processes, each with its own metrics, so with
+METRICS_DIR in config every process writes its metrics to its own JSON file
+there, at most every FLUSH_INTERVAL seconds (to a temporary file renamed
+over the last, so a reader never sees half a file), and main.metrics_text
+adds up the files. Counters of processes that have exited are kept, so
+totals don't go back down when a worker is restarted, but gauges such as
+requests in flight are only taken from processes still running. Empty
+METRICS_DIR when the server starts. Without METRICS_DIR the endpoint shows
+the metrics of the process that handles it.
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+
+from flask import _request_ctx_stack, current_app, request
+from sqlalchemy import event
+from sqlalchemy.pool import Pool
+
+from . import db
+from .cache import all_caches
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# seconds between writes of a process's metrics to METRICS_DIR
+FLUSH_INTERVAL = 1.0
+# upper bounds of the request latency buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# name: (type, help)
+METRICS = {
+    'mdt_http_requests_total': (
+        'counter', 'Requests handled, by endpoint, method and status'),
+    'mdt_http_request_duration_seconds': (
+        'histogram', 'Time to handle a request, by endpoint'),
+    'mdt_http_requests_in_flight': (
+        'gauge', 'Requests being handled'),
+    'mdt_db_pool_checkouts_total': (
+        'counter', 'Connections checked out of the pool'),
+    'mdt_db_pool_size': (
+        'gauge', 'Connections the pool keeps open'),
+    'mdt_db_pool_checked_out': (
+        'gauge', 'Connections checked out of the pool now'),
+    'mdt_db_pool_overflow': (
+        'gauge', 'Connections open beyond the pool size'),
+    'mdt_cache_hits_total': (
+        'counter', 'Hits of an in-process cache, by cache'),
+    'mdt_cache_misses_total': (
+        'counter', 'Misses of an in-process cache, by cache'),
+}
+
+
+def _key(name, labels=None):
+    return (name, tuple(sorted((labels or {}).items())))
+
+
+class Registry:
+    """Metrics of this process"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # (name, labels): value
+        self.counters = {}
+        # (name, labels): [requests up to each bound of BUCKETS,
+        #                  all requests, sum of values]
+        self.histograms = {}
+        self.in_flight = 0
+        self.flushed = 0.0
+
+    def inc(self, name, labels=None, amount=1):
+        key = _key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, labels, value):
+        key = _key(name, labels)
+        with self.lock:
+            histogram = self.histograms.setdefault(
+                key, [0] * (len(BUCKETS) + 1) + [0.0])
+            for index, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    histogram[index] += 1
+            histogram[len(BUCKETS)] += 1
+            histogram[-1] += value
+
+    def add_in_flight(self, amount):
+        with self.lock:
+            self.in_flight += amount
+
+    def snapshot(self, pool=None):
+        """Metrics as a dict that can be saved as JSON
+
+        Arguments:
+        pool -- SQLAlchemy Pool to read the sizes of, None to leave out
+        """
+        with self.lock:
+            counters = dict(self.counters)
+            histograms = {key: list(value)
+                          for key, value in self.histograms.items()}
+            gauges = {_key('mdt_http_requests_in_flight'): self.in_flight}
+        for cache in all_caches():
+            stats = cache.stats()
+            counters[_key('mdt_cache_hits_total',
+                          {'cache': stats['name']})] = stats['hits']
+            counters[_key('mdt_cache_misses_total',
+                          {'cache': stats['name']})] = stats['misses']
+        # only QueuePool, used for Postgres, has a size
+        if pool is not None and hasattr(pool, 'overflow'):
+            gauges[_key('mdt_db_pool_size')] = pool.size()
+            gauges[_key('mdt_db_pool_checked_out')] = pool.checkedout()
+            gauges[_key('mdt_db_pool_overflow')] = max(0, pool.overflow())
+        return {'pid': os.getpid(),
+                'counters': _items(counters),
+                'histograms': _items(histograms),
+                'gauges': _items(gauges)}
+
+
+def _items(metrics):
+    """Metrics dict as a list that can be saved as JSON"""
+    return [[name, list(labels), value]
+            for (name, labels), value in sorted(metrics.items())]
+
+
+registry = Registry()
+
+
+@event.listens_for(Pool, 'checkout')
+def _count_checkout(dbapi_connection, connection_record, connection_proxy):
+    registry.inc('mdt_db_pool_checkouts_total')
+
+
+def _pool():
+    return db.get_engine(current_app).pool
+
+
+def write(directory, snapshot):
+    """Save a snapshot as the metrics file of its process"""
+    handle, path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(handle, 'w') as metrics_file:
+        json.dump(snapshot, metrics_file)
+    os.replace(path, os.path.join(directory,
+                                  '{}.json'.format(snapshot['pid'])))
+
+
+def flush(force=False):
+    """Write this process's metrics to METRICS_DIR, if set and due"""
+    directory = current_app.config.get('METRICS_DIR')
+    now = time.monotonic()
+    if not directory or not (force or
+                             now - registry.flushed >= FLUSH_INTERVAL):
+        return
+    registry.flushed = now
+    write(directory, registry.snapshot(_pool()))
+
+
+def _is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _snapshots(directory):
+    """Snapshots of this process and of the other files in directory"""
+    snapshot = registry.snapshot(_pool())
+    yield snapshot
+    if not directory:
+        return
+    for filename in os.listdir(directory):
+        if not filename.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(directory, filename)) as metrics_file:
+                other = json.load(metrics_file)
+        except (OSError, ValueError):
+            # removed since listed
+            continue
+        if other['pid'] != snapshot['pid']:
+            if not _is_running(other['pid']):
+                other['gauges'] = []
+            yield other
+
+
+def collect(directory=None):
+    """Metrics of all processes added up
+
+    Arguments:
+    directory -- str: METRICS_DIR, None for only this process
+
+    Returns dict of (name, labels): value, a list of bucket counts and sum
+    for histograms
+    """
+    totals = {}
+    for snapshot in _snapshots(directory):
+        for name, labels, value in snapshot['counters'] + snapshot['gauges']:
+            key = (name, tuple(tuple(label) for label in labels))
+            totals[key] = totals.get(key, 0) + value
+        for name, labels, values in snapshot['histograms']:
+            key = (name, tuple(tuple(label) for label in labels))
+            total = totals.setdefault(key, [0] * len(values))
+            totals[key] = [a + b for a, b in zip(total, values)]
+    return totals
+
+
+def _escape(value):
+    return (str(value).replace('\\', '\\\\').replace('"', '\\"')
+                      .replace('\n', '\\n'))
+
+
+def _labels(labels, extra=()):
+    labels = tuple(labels) + tuple(extra)
+    if not labels:
+        return ''
+    return '{{{}}}'.format(','.join('{}="{}"'.format(name, _escape(value))
+                                    for name, value in labels))
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(totals):
+    """Metrics from collect in Prometheus text exposition format"""
+    lines = []
+    for name in sorted(METRICS):
+        kind, help_text = METRICS[name]
+        series = sorted((labels, value) for (metric, labels), value
+                        in totals.items() if metric == name)
+        if not series:
+            continue
+        lines.append('# HELP {} {}'.format(name, help_text))
+        lines.append('# TYPE {} {}'.format(name, kind))
+        for labels, value in series:
+            if kind != 'histogram':
+                lines.append('{}{} {}'.format(name, _labels(labels),
+                                              _number(value)))
+                continue
+            for bound, count in zip(BUCKETS + ('+Inf',), value[:-1]):
+                lines.append('{}_bucket{} {}'.format(
+                    name, _labels(labels, [('le', bound)]), count))
+            lines.append('{}_sum{} {}'.format(name, _labels(labels),
+                                              _number(value[-1])))
+            lines.append('{}_count{} {}'.format(name, _labels(labels),
+                                                value[-2]))
+    return '\n'.join(lines) + '\n'
+
+
+def _start_request():
+    _request_ctx_stack.top.metrics_started = time.perf_counter()
+    registry.add_in_flight(1)
+
+
+def _record_status(response):
+    _request_ctx_stack.top.metrics_status = response.status_code
+    return response
+
+
+def _end_request(exc):
+    context = _request_ctx_stack.top
+    started = getattr(context, 'metrics_started', None)
+    if started is None:
+        return
+    registry.add_in_flight(-1)
+    endpoint = request.endpoint or 'none'
+    status = getattr(context, 'metrics_status', 500)
+    registry.inc('mdt_http_requests_total',
+                 {'endpoint': endpoint, 'method': request.method,
+                  'status': str(status)})
+    registry.observe('mdt_http_request_duration_seconds',
+                     {'endpoint': endpoint}, time.perf_counter() - started)
+    flush()
+
+
+def init_app(app):
+    app.before_request(_start_request)
+    app.after_request(_record_status)
+    app.teardown_request(_end_request)
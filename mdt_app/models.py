@@ -1,6 +1,7 @@
+import json
 from werkzeug.security import generate_password_hash, check_password_hash
 from itsdangerous import TimedJSONWebSignatureSerializer as Serializer
-from datetime import date
+from datetime import date, datetime
 from flask import current_app
 
 from flask_login import UserMixin, AnonymousUserMixin
@@ -12,6 +13,10 @@ from config import date_style
 
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
+    __table_args__ = (
+        # change feed, rows in the order they changed
+        db.Index('ix_users_updated_at_id', 'updated_at', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     f_name = db.Column(db.String(50), nullable=False)
     l_name = db.Column(db.String(50), nullable=False)
@@ -22,6 +27,9 @@ class User(UserMixin, db.Model):
     is_confirmed = db.Column(db.Boolean(), default=False)
     is_consultant = db.Column(db.Boolean(), default=False)
     is_admin = db.Column(db.Boolean(), default=False)
+    # set when the row is inserted or updated, for the change feed
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow,
+                           onupdate=datetime.utcnow, nullable=False)
 
     def __repr__(self):
         return '<User: {:s}>'.format(self.username)
@@ -39,15 +47,24 @@ class User(UserMixin, db.Model):
 
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        return cached_user(int(user_id))
 
 
 class Meeting(db.Model):
     __tablename__ = 'meetings'
+    __table_args__ = (
+        # upcoming meetings and next meeting lookups
+        db.Index('ix_meetings_is_cancelled_date', 'is_cancelled', 'date'),
+        # change feed, rows in the order they changed
+        db.Index('ix_meetings_updated_at_id', 'updated_at', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     date = db.Column(db.Date, nullable=False, unique=True)
     comment = db.Column(db.String(255))
     is_cancelled = db.Column(db.Boolean(), default=False)
+    # set when the row is inserted or updated, for the change feed
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow,
+                           onupdate=datetime.utcnow, nullable=False)
 
     @property
     def date_repr(self):
@@ -59,6 +76,13 @@ class Meeting(db.Model):
 
 class Case(db.Model):
     __tablename__ = 'cases'
+    __table_args__ = (
+        # cases of a meeting and the meeting's progress counts
+        db.Index('ix_cases_meeting_id_status', 'meeting_id', 'status'),
+        db.Index('ix_cases_patient_id', 'patient_id'),
+        # change feed, rows in the order they changed
+        db.Index('ix_cases_updated_at_id', 'updated_at', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     created_by_id = db.Column(db.Integer, db.ForeignKey('users.id'),
                                                         nullable=False)
@@ -78,6 +102,14 @@ class Case(db.Model):
     discussion = db.Column(db.Text)
     mdt_vcmg = db.Column(db.String(10), default='MDT', nullable=False)
     status = db.Column(db.String(10), default='TBD', nullable=False)
+    # kept up to date by events in counters.py
+    open_actions = db.Column(db.Integer, default=0, server_default='0',
+                             nullable=False)
+    total_actions = db.Column(db.Integer, default=0, server_default='0',
+                              nullable=False)
+    # set when the row is inserted or updated, for the change feed
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow,
+                           onupdate=datetime.utcnow, nullable=False)
     created_by = db.relationship('User', foreign_keys=created_by_id,
                                  uselist=False)
     consultant = db.relationship('User',
@@ -95,12 +127,30 @@ class Case(db.Model):
 
 class Patient(db.Model):
     __tablename__ = 'patients'
+    __table_args__ = (
+        # patient lookup, trigram indexes are used by ILIKE on Postgres
+        db.Index('ix_patients_hospital_number_trgm', 'hospital_number',
+                 postgresql_using='gin',
+                 postgresql_ops={'hospital_number': 'gin_trgm_ops'}),
+        db.Index('ix_patients_first_name_trgm', 'first_name',
+                 postgresql_using='gin',
+                 postgresql_ops={'first_name': 'gin_trgm_ops'}),
+        db.Index('ix_patients_last_name_trgm', 'last_name',
+                 postgresql_using='gin',
+                 postgresql_ops={'last_name': 'gin_trgm_ops'}),
+        db.Index('ix_patients_date_of_birth', 'date_of_birth'),
+        # change feed, rows in the order they changed
+        db.Index('ix_patients_updated_at_id', 'updated_at', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     hospital_number = db.Column(db.String(20), nullable=False, unique=True)
     first_name = db.Column(db.String(255), nullable=False)
     last_name = db.Column(db.String(255), nullable=False)
     date_of_birth = db.Column(db.Date, nullable=False)
     sex = db.Column(db.String(1), nullable=False)
+    # set when the row is inserted or updated, for the change feed
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow,
+                           onupdate=datetime.utcnow, nullable=False)
 
     @property
     def date_of_birth_repr(self):
@@ -118,15 +168,32 @@ class Patient(db.Model):
                 '{l_name}, {f_name}>').format(f_name=self.first_name,
                                               l_name=self.last_name.upper())
 
+# gin_trgm_ops of the lookup indexes, so create_all works on Postgres as the
+# migrations do
+db.event.listen(Patient.__table__, 'before_create',
+                db.DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+                  .execute_if(dialect='postgresql'))
+
 
 class Action(db.Model):
     __tablename__ = 'actions'
+    __table_args__ = (
+        # actions of a user, open actions first
+        db.Index('ix_actions_assigned_to_id_is_completed',
+                 'assigned_to_id', 'is_completed'),
+        db.Index('ix_actions_case_id', 'case_id'),
+        # change feed, rows in the order they changed
+        db.Index('ix_actions_updated_at_id', 'updated_at', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     case_id = db.Column(db.Integer, db.ForeignKey('cases.id'), nullable=False)
     action = db.Column(db.String(255), nullable=False)
     assigned_to_id = db.Column(db.Integer, db.ForeignKey('users.id'),
                                                          nullable=False)
     is_completed = db.Column(db.Boolean(), default=False)
+    # set when the row is inserted or updated, for the change feed
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow,
+                           onupdate=datetime.utcnow, nullable=False)
 
     case = db.relationship('Case', backref='actions',
                            order_by=id)
@@ -140,10 +207,19 @@ class Action(db.Model):
 
 class Attendee(db.Model):
     __tablename__ = 'attendees'
+    __table_args__ = (
+        # attendees of a meeting and the meeting list's attendee counts
+        db.Index('ix_attendees_meeting_id', 'meeting_id'),
+        # change feed, rows in the order they changed
+        db.Index('ix_attendees_updated_at_id', 'updated_at', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     meeting_id = db.Column(db.Integer, db.ForeignKey('meetings.id'),
                                                      nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    # set when the row is inserted or updated, for the change feed
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow,
+                           onupdate=datetime.utcnow, nullable=False)
 
     meeting = db.relationship('Meeting', backref='attendees')
     user = db.relationship('User', backref='attendees')
@@ -151,4 +227,75 @@ class Attendee(db.Model):
 
     def __repr__(self):
         return '<Attendee: {} ({}, {})>'.format(self.id, self.meeting.date,
-                                                self.user.username)
\ No newline at end of file
+                                                self.user.username)
+
+
+# background job, run by manage.py worker, see jobs.py
+class Job(db.Model):
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        # worker's lookup of the next queued job
+        db.Index('ix_jobs_status_run_after', 'status', 'run_after'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    # JSON of the keyword arguments of the job function
+    args = db.Column(db.Text, default='{}', nullable=False)
+    # queued, running, done or failed
+    status = db.Column(db.String(10), default='queued', nullable=False)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    max_attempts = db.Column(db.Integer, default=3, nullable=False)
+    # JSON of what the job function returned
+    result = db.Column(db.Text)
+    error = db.Column(db.Text)
+    created_by_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    created_on = db.Column(db.DateTime, default=datetime.utcnow,
+                           nullable=False)
+    run_after = db.Column(db.DateTime, default=datetime.utcnow,
+                          nullable=False)
+    started_on = db.Column(db.DateTime)
+    finished_on = db.Column(db.DateTime)
+
+    created_by = db.relationship('User', foreign_keys=created_by_id,
+                                 uselist=False)
+
+    def __repr__(self):
+        return '<Job: {} {} ({})>'.format(self.id, self.kind, self.status)
+
+
+# change to a row of an audited table, written by events in audit.py
+class AuditEntry(db.Model):
+    __tablename__ = 'audit_log'
+    __table_args__ = (
+        # history of a case, newest first
+        db.Index('ix_audit_log_case_id_id', 'case_id', 'id'),
+        # history of any other row
+        db.Index('ix_audit_log_table_name_row_id_id', 'table_name', 'row_id',
+                 'id'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    table_name = db.Column(db.String(50), nullable=False)
+    row_id = db.Column(db.Integer, nullable=False)
+    # case of a case or action, so a case's history includes its actions
+    case_id = db.Column(db.Integer)
+    # insert, update or delete
+    operation = db.Column(db.String(10), nullable=False)
+    # JSON of column: [old value, new value]
+    changes = db.Column(db.Text, nullable=False)
+    # no foreign keys, entries are kept when users and rows are deleted
+    user_id = db.Column(db.Integer)
+    changed_on = db.Column(db.DateTime, nullable=False)
+
+    @property
+    def change_list(self):
+        """List of (column, old value, new value), by column"""
+        return [(column, old, new) for column, (old, new)
+                in sorted(json.loads(self.changes).items())]
+
+    def __repr__(self):
+        return '<AuditEntry: {} {} {} {}>'.format(
+            self.id, self.operation, self.table_name, self.row_id)
+
+
+# placed at end to avoid circular import, users.py imports the models
+from .users import cached_user
@@ -0,0 +1,180 @@
+"""
+Engine profiles and routing of reads to a replica
+
+RoutingSQLAlchemy is the Flask-SQLAlchemy extension (mdt_app.db) with two
+additions.
+
+Engines are made with the options of ENGINE_PROFILE in config: pool sizes,
+a Postgres statement timeout, and testing connections as they are checked
+out (pre_ping) so connections closed by the server are replaced instead of
+failing a request. Pool sizes and the timeout only apply to Postgres,
+SQLite engines are left as Flask-SQLAlchemy makes them.
+
+With REPLICA_DATABASE_URL in config, GET requests to views marked with the
+read_only decorator read from the replica. Everything else uses the
+primary, as do writes (flushes, and INSERT, UPDATE and DELETE statements)
+whatever the view. Once a request writes, the rest of it reads from the
+primary, and a cookie keeps the browser's requests on the primary for
+REPLICA_PIN_SECONDS, so a page shown after a save isn't missing the save
+while the replica catches up. read_from overrides the routing of the rest
+of a request, and an X-Read-From: primary header that of a whole request.
+
+Caches shared by all requests of a process (see cache.py) are filled
+within primary(), as an entry read from a lagging replica would be served
+to every request, including those pinned to the primary, until it expires.
+"""
+import time
+import weakref
+from contextlib import contextmanager
+
+from flask import _request_ctx_stack, current_app, request
+from flask_sqlalchemy import SignallingSession, SQLAlchemy
+from sqlalchemy import event, exc, orm, select
+from sqlalchemy.sql.dml import UpdateBase
+
+REPLICA_BIND = 'replica'
+PIN_COOKIE = 'read_primary_until'
+# ENGINE_PROFILE keys passed to create_engine for Postgres
+POOL_OPTIONS = ('pool_size', 'max_overflow', 'pool_timeout', 'pool_recycle')
+
+
+def read_only(view):
+    """Decorator marking a view that only reads, so its GET requests can
+    read from the replica
+
+    Place it below the route decorator.
+    """
+    view.read_only = True
+    return view
+
+
+def read_from(target):
+    """Read from 'primary' or 'replica' for the rest of the request"""
+    context = _request_ctx_stack.top
+    if context is not None:
+        context.read_from = target
+
+
+@contextmanager
+def primary():
+    """Read from the primary within the with block, e.g. to fill a cache"""
+    context = _request_ctx_stack.top
+    previous = getattr(context, 'read_from', None)
+    read_from('primary')
+    try:
+        yield
+    finally:
+        # stay on the primary after a write
+        if context is not None and not getattr(context, 'wrote', False):
+            context.read_from = previous
+
+
+def _has_replica(app):
+    return REPLICA_BIND in (app.config.get('SQLALCHEMY_BINDS') or {})
+
+
+def _route_request():
+    if not _has_replica(current_app):
+        return
+    view = current_app.view_functions.get(request.endpoint)
+    pinned = (request.cookies.get(PIN_COOKIE, 0, type=float) > time.time() or
+              request.headers.get('X-Read-From') == 'primary')
+    if (request.method in ('GET', 'HEAD') and
+            getattr(view, 'read_only', False) and not pinned):
+        read_from('replica')
+    else:
+        read_from('primary')
+
+
+def _set_pin_cookie(response):
+    if getattr(_request_ctx_stack.top, 'wrote', False):
+        seconds = current_app.config.get('REPLICA_PIN_SECONDS', 10)
+        response.set_cookie(PIN_COOKIE, str(int(time.time()) + seconds),
+                            max_age=seconds, httponly=True)
+    return response
+
+
+def _wrote():
+    context = _request_ctx_stack.top
+    if context is not None:
+        context.read_from = 'primary'
+        context.wrote = True
+
+
+class RoutingSession(SignallingSession):
+    """Session reading from the replica when the request is routed to it"""
+
+    def get_bind(self, mapper=None, clause=None):
+        info = getattr(getattr(mapper, 'mapped_table', None), 'info', {})
+        if info.get('bind_key') is None and _has_replica(self.app):
+            if self._flushing or isinstance(clause, UpdateBase):
+                _wrote()
+            elif ((mapper is not None or clause is not None) and
+                  getattr(_request_ctx_stack.top, 'read_from',
+                          None) == 'replica'):
+                return self.app.extensions['sqlalchemy'].db.get_engine(
+                    self.app, bind=REPLICA_BIND)
+        return SignallingSession.get_bind(self, mapper, clause)
+
+
+def _ping(connection, branch):
+    """Test a connection as it is checked out, reconnecting if it was closed
+
+    From SQLAlchemy's pessimistic disconnect handling recipe.
+    """
+    if branch:
+        return
+    should_close_with_result = connection.should_close_with_result
+    connection.should_close_with_result = False
+    try:
+        connection.scalar(select([1]))
+    except exc.DBAPIError as error:
+        if not error.connection_invalidated:
+            raise
+        # the pool replaced the closed connection
+        connection.scalar(select([1]))
+    finally:
+        connection.should_close_with_result = should_close_with_result
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """Flask-SQLAlchemy with engine profiles and replica routing"""
+
+    def __init__(self, *args, **kwargs):
+        self._profiled = weakref.WeakSet()
+        SQLAlchemy.__init__(self, *args, **kwargs)
+
+    def init_app(self, app):
+        replica = app.config.get('REPLICA_DATABASE_URL')
+        if replica:
+            binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+            binds[REPLICA_BIND] = replica
+            app.config['SQLALCHEMY_BINDS'] = binds
+        SQLAlchemy.init_app(self, app)
+        app.before_request(_route_request)
+        app.after_request(_set_pin_cookie)
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def apply_driver_hacks(self, app, info, options):
+        SQLAlchemy.apply_driver_hacks(self, app, info, options)
+        if not info.drivername.startswith('postgresql'):
+            return
+        profile = app.config.get('ENGINE_PROFILE') or {}
+        for option in POOL_OPTIONS:
+            if profile.get(option) is not None:
+                options.setdefault(option, profile[option])
+        if profile.get('statement_timeout'):
+            connect_args = options.setdefault('connect_args', {})
+            connect_args['options'] = '-c statement_timeout={:d}'.format(
+                profile['statement_timeout'])
+
+    def get_engine(self, app=None, bind=None):
+        engine = SQLAlchemy.get_engine(self, app, bind)
+        if engine not in self._profiled:
+            profile = self.get_app(app).config.get('ENGINE_PROFILE') or {}
+            if profile.get('pre_ping'):
+                event.listen(engine, 'engine_connect', _ping)
+            self._profiled.add(engine)
+        return engine
@@ -0,0 +1,186 @@
+"""
+Full text search of cases
+
+Cases are indexed with Whoosh in the directory SEARCH_INDEX_DIR, one
+document per case with its text fields and its patient's names and hospital
+number. Session events keep the index up to date: documents for cases (and
+cases of patients) changed in a flush are made after the flush, and written
+to the index once the session commits. Bulk statements bypass these events,
+so after changing cases in bulk rebuild the index with manage.py
+rebuild_search_index.
+"""
+import os
+import threading
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect, or_
+from sqlalchemy.orm import Session
+from whoosh import index
+from whoosh.analysis import StemmingAnalyzer
+from whoosh.fields import ID, KEYWORD, TEXT, Schema
+from whoosh.qparser import MultifieldParser
+from whoosh.writing import AsyncWriter
+
+from .models import Case, Patient
+
+# fields of a case and its patient that are indexed
+CASE_FIELDS = ('medical_history', 'question', 'discussion', 'planned_surgery')
+PATIENT_FIELDS = ('first_name', 'last_name', 'hospital_number')
+
+schema = Schema(case_id=ID(stored=True, unique=True),
+                patient=TEXT,
+                hospital_number=KEYWORD(lowercase=True),
+                medical_history=TEXT(analyzer=StemmingAnalyzer()),
+                question=TEXT(analyzer=StemmingAnalyzer()),
+                discussion=TEXT(analyzer=StemmingAnalyzer()),
+                planned_surgery=TEXT(analyzer=StemmingAnalyzer()))
+
+SEARCH_FIELDS = ('patient', 'hospital_number') + CASE_FIELDS
+
+_indexes = {}
+_lock = threading.Lock()
+
+
+def get_index():
+    """Whoosh index in SEARCH_INDEX_DIR, created if it doesn't exist"""
+    index_dir = current_app.config['SEARCH_INDEX_DIR']
+    with _lock:
+        if index_dir not in _indexes:
+            if index.exists_in(index_dir):
+                _indexes[index_dir] = index.open_dir(index_dir)
+            else:
+                os.makedirs(index_dir, exist_ok=True)
+                _indexes[index_dir] = index.create_in(index_dir, schema)
+        return _indexes[index_dir]
+
+
+def _document_query(session):
+    """Query of the columns that make up the document of each case"""
+    return (session.query(Case.id, Patient.first_name, Patient.last_name,
+                          Patient.hospital_number,
+                          *[getattr(Case, name) for name in CASE_FIELDS])
+                   .join(Patient, Case.patient_id == Patient.id))
+
+
+def _document(row):
+    case_id, first_name, last_name, hospital_number = row[:4]
+    document = {'case_id': str(case_id),
+                'patient': '{} {}'.format(first_name, last_name),
+                'hospital_number': hospital_number}
+    for name, value in zip(CASE_FIELDS, row[4:]):
+        document[name] = value or ''
+    return document
+
+
+def rebuild_index(session, batch_size=1000):
+    """Replace the index with documents of all cases
+
+    Returns int: number of cases indexed
+    """
+    index_dir = current_app.config['SEARCH_INDEX_DIR']
+    os.makedirs(index_dir, exist_ok=True)
+    new_index = index.create_in(index_dir, schema)
+    writer = new_index.writer(limitmb=256)
+    count = 0
+    for row in _document_query(session).yield_per(batch_size):
+        writer.add_document(**_document(row))
+        count += 1
+    writer.commit(optimize=True)
+    with _lock:
+        _indexes[index_dir] = new_index
+    return count
+
+
+def search_cases(query_string, page=1, per_page=20):
+    """Ids of cases matching a search, best match first
+
+    All words must match, in any of the fields. Whoosh query syntax can be
+    used, e.g. OR, NOT, quoted phrases and field:word.
+
+    Returns tuple of (total number of matching cases, list of case ids on
+    the page)
+    """
+    search_index = get_index()
+    parser = MultifieldParser(SEARCH_FIELDS, schema=search_index.schema)
+    query = parser.parse(query_string)
+    with search_index.searcher() as searcher:
+        results = searcher.search_page(query, page, pagelen=per_page)
+        if page > results.pagecount:
+            return len(results), []
+        return len(results), [int(hit['case_id']) for hit in results]
+
+
+def _changed_ids(session):
+    """Ids of cases and patients in a flush that change the index
+
+    Returns tuple of (set of case ids to update, set of case ids to delete,
+    set of patient ids to update the cases of)
+    """
+    case_ids = set()
+    deleted_ids = set()
+    patient_ids = set()
+    for instance in session.new:
+        if isinstance(instance, Case):
+            case_ids.add(instance.id)
+    for instance in session.dirty:
+        attrs = inspect(instance).attrs
+        if isinstance(instance, Case):
+            names = CASE_FIELDS + ('patient_id',)
+            if any(attrs[name].history.has_changes() for name in names):
+                case_ids.add(instance.id)
+        elif isinstance(instance, Patient):
+            if any(attrs[name].history.has_changes()
+                   for name in PATIENT_FIELDS):
+                patient_ids.add(instance.id)
+    for instance in session.deleted:
+        if isinstance(instance, Case):
+            deleted_ids.add(instance.id)
+    return case_ids - deleted_ids, deleted_ids, patient_ids
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changes(session, flush_context):
+    case_ids, deleted_ids, patient_ids = _changed_ids(session)
+    if case_ids or deleted_ids or patient_ids:
+        session.info['search_changes'] = (case_ids, deleted_ids, patient_ids)
+
+
+@event.listens_for(Session, 'after_flush_postexec')
+def _make_documents(session, flush_context):
+    """Documents for changed cases as they are now, written at commit"""
+    changes = session.info.pop('search_changes', None)
+    if changes is None:
+        return
+    case_ids, deleted_ids, patient_ids = changes
+    documents = session.info.setdefault('search_documents', {})
+    for case_id in deleted_ids:
+        documents[case_id] = None
+    changed = []
+    if case_ids:
+        changed.append(Case.id.in_(case_ids))
+    if patient_ids:
+        changed.append(Case.patient_id.in_(patient_ids))
+    if changed:
+        for row in _document_query(session).filter(or_(*changed)):
+            documents[row[0]] = _document(row)
+
+
+@event.listens_for(Session, 'after_commit')
+def _write_documents(session):
+    documents = session.info.pop('search_documents', None)
+    if not documents or not has_app_context():
+        return
+    # waits for the index lock in a thread if another writer has it
+    writer = AsyncWriter(get_index())
+    for case_id, document in documents.items():
+        if document is None:
+            writer.delete_by_term('case_id', str(case_id))
+        else:
+            writer.update_document(**document)
+    writer.commit()
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_documents(session, previous_transaction):
+    session.info.pop('search_changes', None)
+    session.info.pop('search_documents', None)
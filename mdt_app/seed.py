@@ -0,0 +1,320 @@
+"""
+Synthetic data for scale testing, see manage.py seed
+
+Generates users, meetings, patients, cases, actions and attendees at a
+chosen volume: a meeting a week for a number of years with a few cancelled,
+a varying number of cases a meeting, patients coming back to later
+meetings, free text of realistic lengths, and cases and actions of past
+meetings mostly completed. All values come from a random.Random of the
+seed, so the same seed, sizes and end date give the same rows (apart from
+the salted password hash).
+
+Rows are generated with their ids, so they can refer to each other without
+reading ids back, and written with COPY on Postgres, or batched INSERTs
+on other databases. Like the importer this bypasses the ORM, so the action
+counters of cases are set as they are generated and the search index
+should be rebuilt afterwards. Only an empty database can be seeded.
+"""
+import csv
+import io
+import random
+from collections import OrderedDict, namedtuple
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import func, select, text
+from werkzeug.security import generate_password_hash
+
+from .models import Action, Attendee, Case, Meeting, Patient, User
+
+# rows per COPY or INSERT
+BATCH_SIZE = 5000
+DEFAULT_PASSWORD = 'password'
+
+# users -- int: users who aren't consultants
+# consultants -- int: consultants, cases are spread between them
+# patients -- int: patients, fewer than cases so some come back
+# years -- int: years of weekly meetings up to the end date
+# cases_per_meeting -- float: mean cases a meeting
+# actions_per_case -- float: mean actions a case
+# attendees_per_meeting -- int: most attendees of a meeting
+SeedSizes = namedtuple('SeedSizes', ['users', 'consultants', 'patients',
+                                     'years', 'cases_per_meeting',
+                                     'actions_per_case',
+                                     'attendees_per_meeting'])
+SeedSizes.__new__.__defaults__ = (60, 12, 12000, 10, 30.0, 1.5, 15)
+
+# table, in the order they are written (foreign keys first)
+TABLES = (User.__table__, Meeting.__table__, Patient.__table__,
+          Case.__table__, Action.__table__, Attendee.__table__)
+
+FIRST_NAMES = ('Olivia', 'Amelia', 'Isla', 'Ava', 'Mia', 'Grace', 'Sophia',
+               'Lily', 'Emily', 'Ella', 'Margaret', 'Susan', 'Patricia',
+               'Aisha', 'Priya', 'Fatima', 'Oliver', 'George', 'Harry',
+               'Jack', 'Noah', 'Leo', 'Arthur', 'Oscar', 'David', 'John',
+               'Michael', 'Peter', 'Robert', 'Mohammed', 'Ravi', 'Tomasz')
+LAST_NAMES = ('Smith', 'Jones', 'Williams', 'Taylor', 'Brown', 'Davies',
+              'Evans', 'Wilson', 'Thomas', 'Johnson', 'Roberts', 'Walker',
+              'Wright', 'Robinson', 'Thompson', 'White', 'Hughes', 'Edwards',
+              'Green', 'Hall', 'Wood', 'Harris', 'Lewis', 'Martin', 'Jackson',
+              'Clarke', 'Patel', 'Khan', 'Singh', 'Ali', 'Nowak', 'Okafor')
+WORDS = ('pain', 'swelling', 'left', 'right', 'knee', 'hip', 'shoulder',
+         'spine', 'wrist', 'ankle', 'fracture', 'lesion', 'mass', 'biopsy',
+         'MRI', 'CT', 'x-ray', 'ultrasound', 'shows', 'suggests', 'no',
+         'previous', 'surgery', 'history', 'of', 'with', 'and', 'since',
+         'months', 'weeks', 'worsening', 'stable', 'improved', 'night',
+         'weight', 'loss', 'bone', 'soft', 'tissue', 'tumour', 'benign',
+         'malignant', 'review', 'referral', 'GP', 'physiotherapy',
+         'analgesia', 'diabetes', 'hypertension', 'smoker', 'the', 'a')
+QUESTIONS = ('Suitable for surgery?', 'Further imaging needed?',
+             'Biopsy or surveillance?', 'Conservative management?',
+             'Refer to oncology?', 'Repeat MRI in 3 months?',
+             'Fit for general anaesthetic?', 'Diagnosis?')
+ACTIONS = ('Book MRI', 'Book CT', 'Book biopsy', 'Refer to oncology',
+           'Refer to physiotherapy', 'Letter to GP', 'Clinic appointment',
+           'Add to surgery waiting list', 'Repeat bloods',
+           'Discuss at sarcoma MDT', 'Review imaging with radiology',
+           'Request previous notes')
+# choices of CaseForm.clinic_code, so seeded cases can be edited
+CLINIC_CODES = ('TJG1A', 'TJG2A', 'RH11A', 'JO12A', 'JO11A', 'MHP02', 'MHP2D')
+PLANNED_SURGERY = ('Total knee replacement', 'Total hip replacement',
+                   'Excision biopsy', 'Wide local excision', 'Arthroscopy',
+                   'ORIF', 'Spinal decompression')
+
+
+def _sentences(rng, low, high):
+    """Between low and high sentences of 5 to 20 words"""
+    sentences = []
+    for _ in range(rng.randint(low, high)):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(5, 20))]
+        sentences.append(' '.join(words).capitalize() + '.')
+    return ' '.join(sentences)
+
+
+def _count(rng, mean):
+    """Random count around mean, never below 0"""
+    return max(0, int(round(rng.gauss(mean, mean / 3.0))))
+
+
+def _at(rng, day):
+    """Random time in working hours of a day"""
+    return datetime.combine(day, time(8)) + timedelta(
+        seconds=rng.randrange(10 * 60 * 60),
+        microseconds=rng.randrange(10 ** 6))
+
+
+def _users(rng, sizes, password_hash):
+    rows = []
+    usernames = set()
+    for user_id in range(1, sizes.users + sizes.consultants + 1):
+        is_consultant = user_id <= sizes.consultants
+        f_name, l_name = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        username = (f_name[0] + l_name).lower()
+        while username in usernames:
+            username = '{}{}{}'.format(f_name[0], l_name,
+                                       rng.randint(2, 999)).lower()
+        usernames.add(username)
+        rows.append(OrderedDict([
+            ('id', user_id), ('f_name', f_name), ('l_name', l_name),
+            ('initials', f_name[0] + l_name[0] if is_consultant else None),
+            ('username', username),
+            ('email', '{}@example.nhs.uk'.format(username)),
+            ('password_hash', password_hash), ('is_confirmed', True),
+            ('is_consultant', is_consultant),
+            ('is_admin', user_id == sizes.consultants + 1),
+            ('updated_at', datetime(2010, 1, 1))]))
+    return rows
+
+
+def _patients(rng, sizes, end):
+    rows = []
+    hospital_numbers = rng.sample(range(10000000, 100000000), sizes.patients)
+    people = set()
+    for patient_id, hospital_number in enumerate(hospital_numbers, 1):
+        # most patients are 40 to 80
+        age = int(rng.triangular(16, 98, 65))
+        while True:
+            person = (rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES).upper(),
+                      end - timedelta(days=age * 365 + rng.randrange(365)))
+            if person not in people:
+                break
+        people.add(person)
+        first_name, last_name, date_of_birth = person
+        rows.append(OrderedDict([
+            ('id', patient_id), ('hospital_number', str(hospital_number)),
+            ('first_name', first_name), ('last_name', last_name),
+            ('date_of_birth', date_of_birth), ('sex', rng.choice('FM')),
+            ('updated_at', datetime(2010, 1, 1))]))
+    return rows
+
+
+def _meetings(rng, sizes, end):
+    """Weekly meetings for sizes.years up to end, and 4 weeks after"""
+    first = end - timedelta(weeks=52 * sizes.years)
+    rows = []
+    for week in range(52 * sizes.years + 5):
+        meeting_date = first + timedelta(weeks=week)
+        is_cancelled = rng.random() < 0.03
+        rows.append(OrderedDict([
+            ('id', week + 1), ('date', meeting_date),
+            ('comment', 'Cancelled, no consultant' if is_cancelled else None),
+            ('is_cancelled', is_cancelled),
+            ('updated_at', _at(rng, meeting_date - timedelta(days=28)))]))
+    return rows
+
+
+def _cases_and_actions(rng, sizes, meetings, end):
+    cases = []
+    actions = []
+    user_ids = range(1, sizes.users + sizes.consultants + 1)
+    for meeting in meetings:
+        if meeting['is_cancelled']:
+            continue
+        is_past = meeting['date'] < end
+        count = min(_count(rng, sizes.cases_per_meeting), sizes.patients)
+        for patient_id in rng.sample(range(1, sizes.patients + 1), count):
+            case_id = len(cases) + 1
+            status = (rng.choice(('COMP', 'COMP', 'COMP', 'DISC'))
+                      if is_past else 'TBD')
+            created_on = meeting['date'] - timedelta(days=rng.randint(1, 21))
+            case_actions = []
+            if status != 'TBD':
+                for action in rng.sample(ACTIONS, min(
+                        _count(rng, sizes.actions_per_case), len(ACTIONS))):
+                    case_actions.append(OrderedDict([
+                        ('id', len(actions) + len(case_actions) + 1),
+                        ('case_id', case_id), ('action', action),
+                        ('assigned_to_id', rng.choice(user_ids)),
+                        ('is_completed', status == 'COMP' or
+                                         rng.random() < 0.5),
+                        ('updated_at', _at(rng, meeting['date']))]))
+            surgery = rng.random() < 0.2
+            cases.append(OrderedDict([
+                ('id', case_id), ('created_by_id', rng.choice(user_ids)),
+                ('created_on', created_on), ('meeting_id', meeting['id']),
+                ('patient_id', patient_id),
+                ('consultant_id', rng.randint(1, sizes.consultants)),
+                ('next_opa', (meeting['date'] + timedelta(
+                    weeks=rng.randint(2, 12))) if is_past else None),
+                ('clinic_code', rng.choice(CLINIC_CODES)),
+                ('planned_surgery', (rng.choice(PLANNED_SURGERY)
+                                     if surgery else None)),
+                ('surgery_date', (meeting['date'] + timedelta(
+                    weeks=rng.randint(2, 20))) if surgery else None),
+                ('medical_history', _sentences(rng, 2, 8)),
+                ('question', rng.choice(QUESTIONS)),
+                ('discussion', (_sentences(rng, 1, 4) if status != 'TBD'
+                                else None)),
+                ('mdt_vcmg', 'VCMG' if rng.random() < 0.1 else 'MDT'),
+                ('status', status),
+                ('open_actions', sum(not action['is_completed']
+                                     for action in case_actions)),
+                ('total_actions', len(case_actions)),
+                ('updated_at', _at(rng, meeting['date'] if is_past
+                                   else created_on))]))
+            actions.extend(case_actions)
+    return cases, actions
+
+
+def _attendees(rng, sizes, meetings, end):
+    rows = []
+    user_ids = range(1, sizes.users + sizes.consultants + 1)
+    for meeting in meetings:
+        if meeting['is_cancelled'] or meeting['date'] >= end:
+            continue
+        count = rng.randint(min(3, sizes.attendees_per_meeting),
+                            sizes.attendees_per_meeting)
+        for user_id in sorted(rng.sample(user_ids, min(count,
+                                                       len(user_ids)))):
+            rows.append(OrderedDict([
+                ('id', len(rows) + 1), ('meeting_id', meeting['id']),
+                ('user_id', user_id),
+                ('updated_at', _at(rng, meeting['date']))]))
+    return rows
+
+
+def generate(sizes=SeedSizes(), seed=0, end=None,
+             password=DEFAULT_PASSWORD):
+    """Rows of every table, the same for the same arguments
+
+    Arguments:
+    sizes -- SeedSizes
+    seed -- int: seed of the random values
+    end -- date: date of the last past meeting, default today
+    password -- str: password of every user
+
+    Returns OrderedDict of table name: list of row dicts, in TABLES order
+    """
+    rng = random.Random(seed)
+    end = end or date.today()
+    meetings = _meetings(rng, sizes, end)
+    cases, actions = _cases_and_actions(rng, sizes, meetings, end)
+    return OrderedDict([
+        ('users', _users(rng, sizes, generate_password_hash(password))),
+        ('meetings', meetings),
+        ('patients', _patients(rng, sizes, end)),
+        ('cases', cases),
+        ('actions', actions),
+        ('attendees', _attendees(rng, sizes, meetings, end))])
+
+
+def _csv_value(value):
+    if value is True or value is False:
+        return 't' if value else 'f'
+    return value
+
+
+def _copy(connection, table, rows):
+    """Write rows with COPY, through the connection's psycopg2 cursor"""
+    columns = list(rows[0])
+    copy_file = io.StringIO()
+    writer = csv.writer(copy_file)
+    for row in rows:
+        writer.writerow([_csv_value(value) for value in row.values()])
+    copy_file.seek(0)
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert('COPY {} ({}) FROM STDIN WITH CSV'.format(
+            table.name, ', '.join(columns)), copy_file)
+    finally:
+        cursor.close()
+
+
+def write_rows(connection, table, rows, batch_size=BATCH_SIZE):
+    """Write rows to a table, with COPY on Postgres"""
+    use_copy = connection.dialect.name == 'postgresql'
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        if use_copy:
+            _copy(connection, table, batch)
+        else:
+            connection.execute(table.insert(), batch)
+    if use_copy and rows:
+        # ids were given, so the id sequence must be moved past them
+        connection.execute(text(
+            "SELECT setval(pg_get_serial_sequence('{0}', 'id'), "
+            "(SELECT max(id) FROM {0}))".format(table.name)))
+
+
+def seed(connection, sizes=SeedSizes(), seed=0, end=None,
+         password=DEFAULT_PASSWORD, batch_size=BATCH_SIZE):
+    """Fill an empty database with generated rows, in one transaction
+
+    Arguments:
+    connection -- connection to the database
+    sizes, seed, end, password -- see generate
+    batch_size -- int: rows per COPY or INSERT
+
+    Returns OrderedDict of table name: rows written
+    """
+    for table in TABLES:
+        if connection.execute(select([func.count()])
+                              .select_from(table)).scalar():
+            raise ValueError('{} already has rows, only an empty database '
+                             'can be seeded'.format(table.name))
+    counts = OrderedDict()
+    with connection.begin():
+        for table, rows in zip(TABLES, generate(sizes, seed, end,
+                                                password).values()):
+            write_rows(connection, table, rows, batch_size)
+            counts[table.name] = len(rows)
+    return counts
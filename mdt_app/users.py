@@ -0,0 +1,60 @@
+"""
+Cache of logged in users
+
+Flask-Login loads the user on every request. The column values of each
+user are cached here, and a detached user is rebuilt from them without a
+query. An entry is removed when its user is updated or
+deleted through the ORM (e.g. confirmed in the admin site or given a new
+password, see invalidate_on_commit in cache.py), and expires after a short
+time to live for changes made by other workers.
+"""
+from sqlalchemy import inspect
+from sqlalchemy.orm import make_transient_to_detached
+
+from .cache import TTLCache, invalidate_on_commit
+from .models import User
+from .routing import primary
+
+user_cache = TTLCache('users', ttl=60)
+# not cached, so a password can't be checked against a stale hash
+UNCACHED_COLUMNS = {'password_hash'}
+
+
+def _columns(user):
+    return {attr.key: getattr(user, attr.key)
+            for attr in inspect(User).column_attrs
+            if attr.key not in UNCACHED_COLUMNS}
+
+
+def cached_user(user_id):
+    """User with id user_id, from the cache if possible, None if not found
+
+    The user is detached, without a session, and its password_hash isn't
+    loaded, so it is only for reading (e.g. as current_user). Views that
+    change a user or check its password load it with User.query.get.
+    """
+    columns = user_cache.get(user_id)
+    if columns is None:
+        with primary():
+            user = User.query.get(user_id)
+        if user is None:
+            return None
+        columns = _columns(user)
+        user_cache.set(user_id, columns)
+    user = User()
+    for key, value in columns.items():
+        setattr(user, key, value)
+    make_transient_to_detached(user)
+    return user
+
+
+def _changed_user_ids(session):
+    """Users updated or deleted by the flush"""
+    return {user.id for user in session.dirty | session.deleted
+            if isinstance(user, User) and
+            (user in session.deleted or
+             session.is_modified(user, include_collections=False))}
+
+
+# invalidate_users(user_ids, session=None) for changes made without the ORM
+invalidate_users = invalidate_on_commit(user_cache, _changed_user_ids)
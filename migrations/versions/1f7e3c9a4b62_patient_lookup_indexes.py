@@ -0,0 +1,35 @@
+"""patient lookup indexes
+
+Revision ID: 1f7e3c9a4b62
+Revises: e6d24b8a01f3
+Create Date: 2026-10-18 13:41:05.220417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1f7e3c9a4b62'
+down_revision = 'e6d24b8a01f3'
+branch_labels = None
+depends_on = None
+
+TRIGRAM_COLUMNS = ('hospital_number', 'first_name', 'last_name')
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for column in TRIGRAM_COLUMNS:
+        op.create_index('ix_patients_{}_trgm'.format(column), 'patients',
+                        [column], unique=False, postgresql_using='gin',
+                        postgresql_ops={column: 'gin_trgm_ops'})
+    op.create_index('ix_patients_date_of_birth', 'patients',
+                    ['date_of_birth'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_patients_date_of_birth', table_name='patients')
+    for column in TRIGRAM_COLUMNS:
+        op.drop_index('ix_patients_{}_trgm'.format(column),
+                      table_name='patients')
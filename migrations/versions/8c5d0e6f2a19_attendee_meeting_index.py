@@ -0,0 +1,25 @@
+"""attendee meeting index
+
+Revision ID: 8c5d0e6f2a19
+Revises: 1f7e3c9a4b62
+Create Date: 2026-10-18 14:27:51.093611
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c5d0e6f2a19'
+down_revision = '1f7e3c9a4b62'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_attendees_meeting_id', 'attendees', ['meeting_id'],
+                    unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_attendees_meeting_id', table_name='attendees')
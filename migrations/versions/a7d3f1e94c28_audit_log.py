@@ -0,0 +1,40 @@
+"""audit log
+
+Revision ID: a7d3f1e94c28
+Revises: 5e2b7d9c1a40
+Create Date: 2026-10-18 17:12:40.734519
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7d3f1e94c28'
+down_revision = '5e2b7d9c1a40'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('audit_log',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('table_name', sa.String(length=50), nullable=False),
+    sa.Column('row_id', sa.Integer(), nullable=False),
+    sa.Column('case_id', sa.Integer(), nullable=True),
+    sa.Column('operation', sa.String(length=10), nullable=False),
+    sa.Column('changes', sa.Text(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('changed_on', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_audit_log_case_id_id', 'audit_log',
+                    ['case_id', 'id'], unique=False)
+    op.create_index('ix_audit_log_table_name_row_id_id', 'audit_log',
+                    ['table_name', 'row_id', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_audit_log_table_name_row_id_id', table_name='audit_log')
+    op.drop_index('ix_audit_log_case_id_id', table_name='audit_log')
+    op.drop_table('audit_log')
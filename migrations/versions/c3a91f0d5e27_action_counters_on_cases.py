@@ -0,0 +1,37 @@
+"""action counters on cases
+
+Revision ID: c3a91f0d5e27
+Revises: 40b27cc01b52
+Create Date: 2026-10-18 10:12:41.518204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3a91f0d5e27'
+down_revision = '40b27cc01b52'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('cases', sa.Column('open_actions', sa.Integer(),
+                                     server_default='0', nullable=False))
+    op.add_column('cases', sa.Column('total_actions', sa.Integer(),
+                                     server_default='0', nullable=False))
+    # backfill counters from existing actions
+    op.execute("""
+        UPDATE cases SET
+            open_actions = (SELECT count(actions.id) FROM actions
+                            WHERE actions.case_id = cases.id
+                            AND NOT actions.is_completed),
+            total_actions = (SELECT count(actions.id) FROM actions
+                             WHERE actions.case_id = cases.id)
+        """)
+
+
+def downgrade():
+    op.drop_column('cases', 'total_actions')
+    op.drop_column('cases', 'open_actions')
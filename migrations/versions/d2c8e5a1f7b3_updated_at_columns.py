@@ -0,0 +1,35 @@
+"""updated_at columns
+
+Revision ID: d2c8e5a1f7b3
+Revises: a7d3f1e94c28
+Create Date: 2026-10-18 18:04:11.208653
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2c8e5a1f7b3'
+down_revision = 'a7d3f1e94c28'
+branch_labels = None
+depends_on = None
+
+TABLES = ('users', 'meetings', 'cases', 'patients', 'actions', 'attendees')
+
+
+def upgrade():
+    for table in TABLES:
+        # existing rows start from now, the app sets it from then on
+        op.add_column(table, sa.Column(
+            'updated_at', sa.DateTime(), nullable=False,
+            server_default=sa.text("timezone('utc', now())")))
+        op.alter_column(table, 'updated_at', server_default=None)
+        op.create_index('ix_{}_updated_at_id'.format(table), table,
+                        ['updated_at', 'id'], unique=False)
+
+
+def downgrade():
+    for table in TABLES:
+        op.drop_index('ix_{}_updated_at_id'.format(table), table_name=table)
+        op.drop_column(table, 'updated_at')
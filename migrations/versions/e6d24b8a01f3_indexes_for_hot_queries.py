@@ -0,0 +1,38 @@
+"""indexes for hot queries
+
+Revision ID: e6d24b8a01f3
+Revises: c3a91f0d5e27
+Create Date: 2026-10-18 11:02:17.843092
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e6d24b8a01f3'
+down_revision = 'c3a91f0d5e27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_meetings_is_cancelled_date', 'meetings',
+                    ['is_cancelled', 'date'], unique=False)
+    op.create_index('ix_cases_meeting_id_status', 'cases',
+                    ['meeting_id', 'status'], unique=False)
+    op.create_index('ix_cases_patient_id', 'cases',
+                    ['patient_id'], unique=False)
+    op.create_index('ix_actions_assigned_to_id_is_completed', 'actions',
+                    ['assigned_to_id', 'is_completed'], unique=False)
+    op.create_index('ix_actions_case_id', 'actions',
+                    ['case_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_actions_case_id', table_name='actions')
+    op.drop_index('ix_actions_assigned_to_id_is_completed',
+                  table_name='actions')
+    op.drop_index('ix_cases_patient_id', table_name='cases')
+    op.drop_index('ix_cases_meeting_id_status', table_name='cases')
+    op.drop_index('ix_meetings_is_cancelled_date', table_name='meetings')
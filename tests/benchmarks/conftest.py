@@ -0,0 +1,190 @@
+"""
+Fixtures of the view benchmarks, run with:
+
+    pytest benchmarks --benchmarks [--benchmarks-scales 1000,10000]
+
+Each scale seeds the test database (see mdt_app.seed) with about that many
+cases, the benchmarks of that scale run against it with real commits, and
+the database is emptied afterwards, so run the benchmarks on their own.
+"""
+import json
+import platform
+import statistics
+import time
+import tracemalloc
+from collections import namedtuple
+from datetime import date, datetime
+
+import pytest
+
+from mdt_app.models import *
+from mdt_app.seed import SeedSizes, seed
+
+
+def scale_sizes(cases):
+    """SeedSizes giving about cases cases, over more years as it grows"""
+    years = 1 if cases <= 1000 else 4 if cases <= 10000 else 10
+    # 3% of meetings are cancelled
+    meetings = (52 * years + 5) * 0.97
+    return SeedSizes(patients=int(cases * 0.8), years=years,
+                     cases_per_meeting=cases / meetings)
+
+
+# cases -- int: scale
+# counts -- OrderedDict of table name: rows seeded
+# past_meeting -- date: latest past meeting with cases
+# meeting_id, meeting -- int, date: next meeting with cases that isn't
+#                        cancelled
+# case_id, patient_id, consultant_id -- int: a case of that meeting
+# username -- str: username of a user, password is 'password'
+Dataset = namedtuple('Dataset', ['cases', 'counts', 'past_meeting',
+                                 'meeting_id', 'meeting', 'case_id',
+                                 'patient_id', 'consultant_id', 'username'])
+
+
+def pytest_generate_tests(metafunc):
+    if 'scale' in metafunc.fixturenames:
+        scales = metafunc.config.getoption('--benchmarks-scales')
+        metafunc.parametrize('scale', [int(scale) for scale
+                                       in scales.split(',')],
+                             scope='session')
+
+
+@pytest.yield_fixture(scope='session')
+def dataset(db, scale):
+    """Test database seeded with about scale cases"""
+    db.session.remove()
+    db.drop_all()
+    db.create_all()
+    with db.engine.connect() as connection:
+        counts = seed(connection, scale_sizes(scale), seed=0,
+                      end=date.today())
+    today = date.today()
+    past_meeting = (db.session.query(Meeting.date)
+                              .join(Case)
+                              .filter(Meeting.date < today)
+                              .order_by(Meeting.date.desc())
+                              .first())
+    case = (Case.query.join(Meeting)
+                      .filter(Meeting.date >= today,
+                              Meeting.is_cancelled == False)
+                      .order_by(Meeting.date, Case.id)
+                      .first())
+    username = User.query.filter_by(is_consultant=False).first().username
+
+    yield Dataset(scale, counts, past_meeting.date, case.meeting_id,
+                  case.meeting.date, case.id, case.patient_id,
+                  case.consultant_id, username)
+
+    db.session.remove()
+    db.drop_all()
+    db.create_all()
+
+
+class Recorder:
+    """Times views, counts their SQL statements and measures their peak
+    memory, and compares with an earlier run
+
+    Arguments:
+    baseline -- dict of (name, cases): result of an earlier run
+    tolerance -- float: fraction slower than the baseline allowed
+    """
+
+    def __init__(self, baseline=None, tolerance=0.25):
+        self.baseline = baseline or {}
+        self.tolerance = tolerance
+        self.results = []
+
+    def run(self, name, dataset, query_counter, make_request, repeat=5):
+        """Measure make_request, after a request to warm the caches
+
+        Time and statements are of repeat requests. Peak memory is of one
+        more, as tracing memory slows the request.
+
+        Arguments:
+        name -- str: name of the benchmark
+        dataset -- Dataset the requests run against
+        query_counter -- QueryCounter of the engine
+        make_request -- function making the request, returns the response
+        repeat -- int: timed requests, 1 for requests that change data so
+                  they can't be repeated, which aren't warmed up or traced
+
+        Returns dict of the result
+        """
+        if repeat > 1:
+            self._check(make_request())
+        times = []
+        with query_counter:
+            for _ in range(repeat):
+                start = time.perf_counter()
+                response = make_request()
+                times.append(time.perf_counter() - start)
+                self._check(response)
+        statements = query_counter.count // repeat
+        peak = None
+        if repeat > 1:
+            tracemalloc.start()
+            try:
+                self._check(make_request())
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+        result = {'name': name, 'cases': dataset.cases,
+                  'repeat': repeat,
+                  'median_ms': round(statistics.median(times) * 1000, 2),
+                  'min_ms': round(min(times) * 1000, 2),
+                  'max_ms': round(max(times) * 1000, 2),
+                  'statements': statements,
+                  'peak_kb': round(peak / 1024, 1) if peak else None}
+        self.results.append(result)
+        self._compare(result)
+        return result
+
+    def _check(self, response):
+        assert response.status_code < 400, response.status
+
+    def _compare(self, result):
+        baseline = self.baseline.get((result['name'], result['cases']))
+        if baseline is None:
+            return
+        assert result['statements'] <= baseline['statements'], (
+            '{name}: {statements} statements, was {was}'.format(
+                was=baseline['statements'], **result))
+        allowed = baseline['median_ms'] * (1 + self.tolerance)
+        assert result['median_ms'] <= allowed, (
+            '{name}: {median_ms} ms, was {was} ms'.format(
+                was=baseline['median_ms'], **result))
+
+    def save(self, path, database):
+        with open(path, 'w') as results_file:
+            json.dump({'created': datetime.utcnow().isoformat(),
+                       'database': database,
+                       'python': platform.python_version(),
+                       'results': self.results}, results_file, indent=2)
+
+
+def load_results(path):
+    """Results of a saved run, by (name, cases)"""
+    with open(path) as results_file:
+        return {(result['name'], result['cases']): result
+                for result in json.load(results_file)['results']}
+
+
+@pytest.yield_fixture(scope='session')
+def recorder(request, db):
+    """Recorder for the session, results are saved at the end"""
+    compare = request.config.getoption('--benchmarks-compare')
+    recorder = Recorder(load_results(compare) if compare else None,
+                        request.config.getoption('--benchmarks-tolerance'))
+
+    yield recorder
+
+    if recorder.results:
+        recorder.save(request.config.getoption('--benchmarks-json'),
+                      db.engine.dialect.name)
+
+
+@pytest.fixture
+def client(app):
+    """Test client that doesn't keep request contexts, as the views commit"""
+    return app.test_client()
@@ -0,0 +1,94 @@
+from flask import url_for
+
+import pytest
+
+from config import date_style
+
+pytestmark = pytest.mark.benchmark
+
+
+def test_case_list_all(client, dataset, recorder, query_counter):
+    recorder.run('case_list', dataset, query_counter,
+                 lambda: client.get(url_for('main.case_list')))
+    # the page's table loads its first page from case_list_data
+    recorder.run('case_list_data', dataset, query_counter,
+                 lambda: client.get(url_for('main.case_list_data', draw=1,
+                                            start=0, length=25)))
+
+
+def test_case_list_search(client, dataset, recorder, query_counter):
+    recorder.run('case_list_data_search', dataset, query_counter,
+                 lambda: client.get(url_for('main.case_list_data', draw=1,
+                                            start=0, length=25,
+                                            **{'search[value]': 'knee'})))
+
+
+def test_case_list_meeting(client, dataset, recorder, query_counter):
+    recorder.run('case_list_meeting', dataset, query_counter,
+                 lambda: client.get(url_for('main.case_list',
+                                            meeting=dataset.past_meeting)))
+
+
+def test_case_edit(client, dataset, recorder, query_counter):
+    edit_url = url_for('main.case_edit', patient_id=dataset.patient_id,
+                       case_id=dataset.case_id)
+    form = {'case_id': dataset.case_id, 'patient_id': dataset.patient_id,
+            'meeting': dataset.meeting_id,
+            'consultant': dataset.consultant_id,
+            'clinic_code': '', 'mdt_vcmg': 'MDT',
+            'medical_history': 'Pain in left knee for 3 months.',
+            'question': 'Suitable for surgery?',
+            'discussion': 'Book MRI and review.'}
+
+    def post():
+        response = client.post(edit_url, data=form)
+        assert response.status_code == 302, 'form not valid'
+        return response
+
+    recorder.run('case_edit_get', dataset, query_counter,
+                 lambda: client.get(edit_url))
+    recorder.run('case_edit_post', dataset, query_counter, post)
+
+
+def test_action_list(client, dataset, recorder, query_counter):
+    recorder.run('action_list', dataset, query_counter,
+                 lambda: client.get(url_for('main.action_list')))
+    recorder.run('action_list_last_page', dataset, query_counter,
+                 lambda: client.get(url_for(
+                     'main.action_list',
+                     page=max(1, dataset.counts['actions'] // 50))))
+
+
+def test_patient_list(client, dataset, recorder, query_counter):
+    recorder.run('patient_list', dataset, query_counter,
+                 lambda: client.get(url_for('main.patient_list')))
+    recorder.run('patient_lookup', dataset, query_counter,
+                 lambda: client.get(url_for('main.patient_lookup',
+                                            q='smith')))
+
+
+def test_login(client, dataset, recorder, query_counter):
+    def login():
+        client.get(url_for('auth.login'))
+        return client.post(url_for('auth.login'),
+                           data={'username': dataset.username,
+                                 'password': 'password'},
+                           follow_redirects=True)
+
+    recorder.run('login', dataset, query_counter, login)
+
+
+def test_meeting_edit_cancel(client, dataset, recorder, query_counter):
+    """Last, as cancelling the meeting pushes its cases to the next one"""
+    form = {'id': dataset.meeting_id, 'comment': 'no consultant',
+            'is_cancelled': 'y',
+            'date': dataset.meeting.strftime(date_style['format'])}
+
+    def post():
+        response = client.post(url_for('main.meeting_edit',
+                                       pk=dataset.meeting_id), data=form)
+        assert response.status_code == 302, 'form not valid'
+        return response
+
+    recorder.run('meeting_edit_cancel', dataset, query_counter, post,
+                 repeat=1)
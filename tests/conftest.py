@@ -4,9 +4,34 @@ from flask.ext.sqlalchemy import event
 
 from mdt_app import create_app
 from mdt_app import db as _db
+from mdt_app.cache import clear_all as clear_caches
 from mdt_app.models import *
 
 
+def pytest_addoption(parser):
+    group = parser.getgroup('benchmarks', 'view benchmarks, see benchmarks/')
+    group.addoption('--benchmarks', action='store_true', default=False,
+                    help='Run the benchmarks, which are skipped otherwise')
+    group.addoption('--benchmarks-scales', default='1000,10000,100000',
+                    help='Comma separated numbers of cases to seed')
+    group.addoption('--benchmarks-json', default='benchmark_results.json',
+                    help='File to save the results to')
+    group.addoption('--benchmarks-compare', default=None,
+                    help='Results of an earlier run, a benchmark fails if '
+                         'it runs more statements or is slower')
+    group.addoption('--benchmarks-tolerance', type=float, default=0.25,
+                    help='Fraction slower than --benchmarks-compare allowed')
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption('--benchmarks'):
+        return
+    skip = pytest.mark.skip(reason='benchmarks only run with --benchmarks')
+    for item in items:
+        if 'benchmark' in item.keywords:
+            item.add_marker(skip)
+
+
 @pytest.yield_fixture(scope='session')
 def app(request):
     """An application for the tests."""
@@ -58,6 +83,8 @@ def db_session(db):
             session.begin_nested()
 
     db.session = session
+    # cached values may be from data rolled back by another test class
+    clear_caches()
 
     yield session
 
@@ -67,6 +94,31 @@ def db_session(db):
     connection.close()
 
 
+class QueryCounter:
+    """Counts SQL statements sent to the database within a with block"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _increment(self, *args):
+        self.count += 1
+
+    def __enter__(self):
+        self.count = 0
+        event.listen(self.engine, 'before_cursor_execute', self._increment)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(self.engine, 'before_cursor_execute', self._increment)
+
+
+@pytest.fixture
+def query_counter(db):
+    """QueryCounter for the test database engine"""
+    return QueryCounter(db.engine)
+
+
 @pytest.yield_fixture(scope='class')
 def populate_db(db_session):
     user1 = User(id=1, f_name='first', l_name='user',
@@ -0,0 +1,146 @@
+import json
+from datetime import datetime
+
+import pytest
+from flask import url_for
+from sqlalchemy import create_engine
+
+from mdt_app.audit import HIDDEN, AuditWriter, case_history
+from mdt_app.main.actions import complete_action
+from mdt_app.main.attendees import sync_attendees
+from mdt_app.main.push import push_cases
+from mdt_app.models import *
+
+
+def entries_of(table_name, row_id):
+    return (AuditEntry.query.filter_by(table_name=table_name, row_id=row_id)
+                            .order_by(AuditEntry.id)
+                            .all())
+
+
+@pytest.mark.usefixtures('db_session', 'populate_db')
+class TestAuditEvents:
+    def test_update(self, db_session):
+        case = Case.query.get(1)
+        case.discussion = 'operate'
+        case.status = 'COMP'
+        db_session.commit()
+        entry = entries_of('cases', 1)[-1]
+
+        assert entry.operation == 'update'
+        assert entry.case_id == 1
+        assert entry.change_list == [('discussion', None, 'operate'),
+                                     ('status', 'DISC', 'COMP')]
+
+    def test_action_insert_and_delete(self, db_session):
+        action = Action(case_id=2, action='book scan', assigned_to_id=1)
+        db_session.add(action)
+        db_session.commit()
+        db_session.delete(action)
+        db_session.commit()
+        inserted, deleted = entries_of('actions', action.id)
+
+        assert (inserted.operation, deleted.operation) == ('insert',
+                                                           'delete')
+        assert inserted.case_id == deleted.case_id == 2
+        assert json.loads(inserted.changes)['action'] == [None, 'book scan']
+        assert json.loads(deleted.changes)['action'] == ['book scan', None]
+
+    def test_date_values(self, db_session):
+        Meeting.query.get(3).date = datetime(2050, 10, 17).date()
+        db_session.commit()
+
+        assert entries_of('meetings', 3)[-1].change_list == [
+            ('date', '2050-10-16', '2050-10-17')]
+
+    def test_password_hidden(self, db_session):
+        User.query.get(1).password = 'new_pass'
+        db_session.commit()
+
+        assert entries_of('users', 1)[-1].change_list == [
+            ('password_hash', HIDDEN, HIDDEN)]
+
+    def test_rollback(self, db_session):
+        before = AuditEntry.query.count()
+        Patient.query.get(1).first_name = 'Changed'
+        db_session.flush()
+        db_session.rollback()
+
+        assert AuditEntry.query.count() == before
+
+    def test_buffered_until_commit(self, app, db_session):
+        app.config['AUDIT_ASYNC'] = True
+        try:
+            Patient.query.get(1).first_name = 'Buffered'
+            db_session.flush()
+            assert len(db_session.info['audit_entries']) == 1
+            db_session.rollback()
+            assert 'audit_entries' not in db_session.info
+        finally:
+            app.config['AUDIT_ASYNC'] = False
+
+
+@pytest.mark.usefixtures('db_session', 'populate_db')
+class TestCaseHistory:
+    def test_pages(self, db_session):
+        case = Case.query.get(3)
+        for discussion in ('first', 'second', 'third'):
+            case.discussion = discussion
+            db_session.commit()
+
+        first = case_history(3, per_page=2)
+        second = case_history(3, before=first.older, per_page=2)
+
+        assert [entry.change_list[0][2] for entry, username
+                in first.entries] == ['third', 'second']
+        # then the case being added by populate_db
+        assert [entry.operation for entry, username
+                in second.entries] == ['update', 'insert']
+        assert second.entries[0][0].change_list[0][2] == 'first'
+        assert second.older is None
+
+    def test_bulk_changes(self, db_session):
+        db_session.add(Meeting(id=10, date='2050-12-30'))
+        db_session.commit()
+        push_cases(1, Meeting.query.get(10), statuses=['TBD'])
+        complete_action(Action.query.get(1))
+        complete_action(Action.query.get(2))
+        sync_attendees(1, [1, 3])
+        db_session.commit()
+        sync_attendees(1, [3])
+        db_session.commit()
+
+        pushed = case_history(4).entries[0][0]
+        assert pushed.change_list == [('meeting_id', 1, 10)]
+        status, action = [entry for entry, username
+                          in case_history(1).entries[:2]]
+        assert status.change_list == [('status', 'DISC', 'COMP')]
+        assert (action.table_name, action.row_id) == ('actions', 2)
+        attendees = (AuditEntry.query.filter_by(table_name='attendees')
+                                     .order_by(AuditEntry.id)
+                                     .all())
+        assert [entry.operation for entry in attendees] == [
+            'insert', 'insert', 'delete']
+        assert attendees[-1].change_list == [('meeting_id', 1, None),
+                                             ('user_id', 1, None)]
+
+    def test_page_load(self, client, db_session):
+        Case.query.get(4).question = 'changed question'
+        db_session.commit()
+        request = client.get(url_for('main.case_history_list', case_id=4))
+
+        assert request.status_code == 200
+        assert b'changed question' in request.data
+
+
+def test_writer_batches(tmpdir):
+    engine = create_engine('sqlite:///{}'.format(tmpdir.join('audit.db')))
+    AuditEntry.__table__.create(engine)
+    writer = AuditWriter(engine, batch_size=3, interval=0.1)
+    writer.put([{'table_name': 'cases', 'row_id': row_id, 'case_id': row_id,
+                 'operation': 'update', 'changes': '{}', 'user_id': None,
+                 'changed_on': datetime.utcnow()} for row_id in range(7)])
+    writer.stop()
+
+    rows = engine.execute('SELECT row_id FROM audit_log ORDER BY id')
+    assert [row_id for row_id, in rows] == list(range(7))
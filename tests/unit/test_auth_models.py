@@ -41,5 +41,5 @@ class TestUserModel():
         user1 = User.query.first()
         login_user(user1)
 
-        assert User.load_user(user1.id) == user1
-        assert current_user == user1
\ No newline at end of file
+        assert User.load_user(user1.id).id == user1.id
+        assert current_user.id == user1.id
\ No newline at end of file
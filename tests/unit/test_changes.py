@@ -0,0 +1,144 @@
+from datetime import datetime
+
+import pytest
+from flask import url_for
+
+from mdt_app.changes import changed_rows, format_cursor, parse_cursor
+from mdt_app.models import *
+
+
+def all_changes(table_name, since=None, limit=2):
+    """Rows of every page of the feed after since, and the last cursor"""
+    rows = []
+    while True:
+        page = changed_rows(table_name, since, limit)
+        rows.extend(page.rows)
+        since = parse_cursor(page.cursor) if page.cursor else None
+        if not page.has_more:
+            return rows, page.cursor
+
+
+def test_cursor_round_trip():
+    updated_at = datetime(2050, 10, 16, 9, 30, 0, 15)
+
+    assert parse_cursor(format_cursor(updated_at, 7)) == (updated_at, 7)
+    for cursor in ('', '2050-10-16', 'not a date,7', '2050-10-16T09:30:00.0,x'):
+        with pytest.raises(ValueError):
+            parse_cursor(cursor)
+
+
+@pytest.mark.usefixtures('db_session', 'populate_db')
+class TestUpdatedAt:
+    def test_insert_and_update(self, db_session):
+        patient = Patient.query.get(1)
+        inserted_at = patient.updated_at
+        patient.first_name = 'Changed'
+        db_session.commit()
+
+        assert inserted_at is not None
+        assert patient.updated_at > inserted_at
+
+    def test_bulk_update(self, db_session):
+        updated_at = Case.query.get(2).updated_at
+        Case.query.filter_by(id=2).update({Case.status: 'COMP'},
+                                          synchronize_session=False)
+        db_session.commit()
+
+        assert Case.query.get(2).updated_at > updated_at
+
+    def test_counters(self, db_session):
+        case = Case.query.get(3)
+        updated_at = case.updated_at
+        db_session.add(Action(case_id=3, action='new action',
+                              assigned_to_id=1))
+        db_session.commit()
+
+        assert case.updated_at > updated_at
+
+
+@pytest.mark.usefixtures('db_session', 'populate_db')
+class TestChangedRows:
+    def test_pages(self, db_session):
+        rows, cursor = all_changes('patients')
+        ordered = sorted(Patient.query.all(),
+                         key=lambda patient: (patient.updated_at, patient.id))
+
+        assert [row['id'] for row in rows] == [patient.id for patient
+                                                in ordered]
+        assert rows[0]['date_of_birth'] == ordered[0].date_of_birth.isoformat()
+
+        Patient.query.get(2).first_name = 'Changed'
+        db_session.commit()
+        rows, next_cursor = all_changes('patients', parse_cursor(cursor))
+
+        assert [(row['id'], row['first_name']) for row in rows] == [
+            (2, 'Changed')]
+        # nothing new keeps the cursor
+        assert changed_rows('patients', parse_cursor(next_cursor)).cursor == (
+            next_cursor)
+
+    def test_settle(self, app):
+        app.config['CHANGES_SETTLE_SECONDS'] = 60
+        try:
+            assert changed_rows('meetings').rows == []
+        finally:
+            app.config['CHANGES_SETTLE_SECONDS'] = 0
+
+    def test_hidden_columns(self):
+        rows = changed_rows('users').rows
+
+        assert rows and all('password_hash' not in row for row in rows)
+
+
+@pytest.fixture
+def changes_token(app):
+    app.config['CHANGES_TOKEN'] = 'secret'
+    yield {'Authorization': 'Bearer secret'}
+    app.config['CHANGES_TOKEN'] = None
+
+
+@pytest.mark.usefixtures('client_class', 'db_session', 'populate_db')
+class TestChangeFeed:
+    def test_feed(self, changes_token):
+        first = self.client.get(url_for('main.change_feed', table='meetings',
+                                        limit=3), headers=changes_token)
+        second = self.client.get(url_for('main.change_feed', table='meetings',
+                                         since=first.json['cursor']),
+                                 headers=changes_token)
+
+        assert first.status_code == 200
+        assert len(first.json['rows']) == 3
+        assert first.json['has_more']
+        assert len(second.json['rows']) == 1
+        assert not second.json['has_more']
+
+    @pytest.mark.parametrize('args', [{'table': 'jobs'},
+                                      {'table': 'cases', 'since': 'bad'},
+                                      {'table': 'cases', 'limit': 0}])
+    def test_bad_request(self, args, changes_token):
+        request = self.client.get(url_for('main.change_feed', **args),
+                                  headers=changes_token)
+
+        assert request.status_code == 400
+
+    def test_forbidden(self, changes_token):
+        # logged in, but not an admin
+        self.client.post(url_for('auth.login'),
+                         data={'username': 'fuser', 'password': 'test_pass'})
+        request = self.client.get(url_for('main.change_feed', table='users'))
+        wrong_token = self.client.get(
+            url_for('main.change_feed', table='users'),
+            headers={'Authorization': 'Bearer wrong'})
+
+        assert request.status_code == 403
+        assert wrong_token.status_code == 403
+
+    def test_admin(self, db_session):
+        User.query.get(1).is_admin = True
+        db_session.commit()
+        self.client.post(url_for('auth.login'),
+                         data={'username': 'fuser', 'password': 'test_pass'})
+        request = self.client.get(url_for('main.change_feed', table='users'))
+
+        assert request.status_code == 200
+        assert 'password_hash' not in request.json['rows'][0]
@@ -0,0 +1,107 @@
+import pytest
+from flask import url_for
+
+from mdt_app.models import *
+
+
+@pytest.mark.usefixtures('client_class', 'db_session', 'populate_db')
+class TestConditional:
+    def get(self, etag=None, **kwargs):
+        headers = {'If-None-Match': etag} if etag else {}
+        return self.client.get(url_for('main.case_list', **kwargs),
+                               headers=headers)
+
+    def test_not_modified(self, query_counter):
+        first = self.get(meeting='2050-10-30')
+        assert first.status_code == 200
+        assert first.headers['ETag']
+        assert 'Last-Modified' not in first.headers
+        assert first.cache_control.private and first.cache_control.no_cache
+
+        with query_counter:
+            again = self.get(first.headers['ETag'], meeting='2050-10-30')
+        assert again.status_code == 304
+        assert again.data == b''
+        assert query_counter.count == 1
+
+    def test_modified_since_only(self):
+        # a deleted row doesn't change the latest updated_at, so only a
+        # matching ETag is answered with 304
+        request = self.client.get(
+            url_for('main.case_list', meeting='2050-10-30'),
+            headers={'If-Modified-Since': 'Fri, 01 Jan 2100 00:00:00 GMT'})
+
+        assert request.status_code == 200
+
+    def test_update(self, db_session):
+        etag = self.get(meeting='2050-10-30').headers['ETag']
+        Case.query.get(1).question = 'new question'
+        db_session.commit()
+
+        request = self.get(etag, meeting='2050-10-30')
+        assert request.status_code == 200
+        assert b'new question' in request.data
+
+    def test_delete(self, db_session):
+        etag = self.get(meeting='2050-10-30').headers['ETag']
+        db_session.delete(Action.query.get(2))
+        db_session.commit()
+
+        assert self.get(etag, meeting='2050-10-30').status_code == 200
+
+    def test_other_meeting(self, db_session):
+        etag = self.get(meeting='2050-10-30').headers['ETag']
+        Case.query.get(2).question = 'new question'
+        db_session.commit()
+
+        assert self.get(etag, meeting='2050-10-30').status_code == 304
+
+    def test_action_list_user(self, db_session):
+        url = url_for('main.action_list', user_id=3)
+        etag = self.client.get(url).headers['ETag']
+        # assigned to another user
+        Action.query.get(1).action = 'changed'
+        db_session.commit()
+
+        request = self.client.get(url, headers={'If-None-Match': etag})
+        assert request.status_code == 304
+
+    def test_meeting_list(self, db_session):
+        url = url_for('main.meeting_list')
+        etag = self.client.get(url).headers['ETag']
+        db_session.add(Meeting(date='2050-11-06'))
+        db_session.commit()
+
+        request = self.client.get(url, headers={'If-None-Match': etag})
+        assert request.status_code == 200
+        assert b'06-Nov-2050' in request.data
+
+    def test_flashed_messages(self):
+        etag = self.get().headers['ETag']
+        with self.client.session_transaction() as session:
+            session['_flashes'] = [('success', 'Patient edited')]
+
+        request = self.get(etag)
+        assert request.status_code == 200
+        assert 'ETag' not in request.headers
+        assert b'Patient edited' in request.data
+
+    def test_push_job(self, db_session):
+        job = Job(kind='push_cases')
+        db_session.add(job)
+        db_session.commit()
+        request = self.get(meeting='2050-10-30', job=job.id)
+
+        assert 'ETag' not in request.headers
+
+    def test_settle(self, app, monkeypatch):
+        monkeypatch.setitem(app.config, 'CONDITIONAL_SETTLE_SECONDS', 3600)
+        request = self.client.get(url_for('main.patient_list'))
+
+        assert 'ETag' not in request.headers
+
+    def test_release(self, app, monkeypatch):
+        etag = self.get().headers['ETag']
+        monkeypatch.setitem(app.config, 'ETAG_RELEASE', 'next')
+
+        assert self.get(etag).status_code == 200
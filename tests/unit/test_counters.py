@@ -0,0 +1,59 @@
+import pytest
+
+from mdt_app.models import *
+from mdt_app.counters import mismatched_counts, recount_actions
+
+
+def counts(case_id):
+    return (db.session.query(Case.open_actions, Case.total_actions)
+                      .filter_by(id=case_id)
+                      .one())
+
+
+@pytest.mark.usefixtures('db_session', 'populate_db')
+class TestActionCounters:
+    def test_populated(self):
+        assert counts(1) == (2, 2)
+        assert counts(2) == (0, 0)
+        assert mismatched_counts() == []
+
+    def test_action_added(self, db_session):
+        action = Action(id=3, case_id=2, action='book scan', assigned_to_id=1)
+        db_session.add(action)
+        db_session.commit()
+
+        assert counts(2) == (1, 1)
+
+    def test_action_completed(self, db_session):
+        Action.query.get(3).is_completed = True
+        db_session.commit()
+
+        assert counts(2) == (0, 1)
+        # loaded case sees the new counters after the flush
+        assert Case.query.get(2).open_actions == 0
+
+    def test_action_moved(self, db_session):
+        Action.query.get(3).case_id = 1
+        db_session.commit()
+
+        assert counts(1) == (2, 3)
+        assert counts(2) == (0, 0)
+
+    def test_action_deleted(self, db_session):
+        db_session.delete(Action.query.get(3))
+        db_session.commit()
+
+        assert counts(1) == (2, 2)
+        assert mismatched_counts() == []
+
+    def test_recount(self, db_session):
+        Case.query.filter_by(id=1).update({Case.open_actions: 5},
+                                          synchronize_session=False)
+        db_session.commit()
+        assert [row[0] for row in mismatched_counts()] == [1]
+
+        recount_actions(db_session, [1])
+        db_session.commit()
+
+        assert counts(1) == (2, 2)
+        assert mismatched_counts() == []
@@ -0,0 +1,89 @@
+import csv
+import io
+from datetime import date
+
+import pytest
+
+from mdt_app.exporter import (ExportFilter, action_rows, case_rows,
+                              csv_lines, write_xlsx)
+from mdt_app.importer import IMPORTERS
+
+
+def export_csv(rows_function, export_filter):
+    header, rows = rows_function(export_filter)
+    return list(csv.DictReader(io.StringIO(''.join(csv_lines(header,
+                                                              rows)))))
+
+
+@pytest.mark.usefixtures('db_session', 'populate_db')
+class TestCaseRows:
+    def test_all(self):
+        rows = export_csv(case_rows, ExportFilter())
+
+        # by meeting date, then case
+        assert [(row['meeting'], row['hospital_number']) for row in rows] == [
+            ('2050-10-16', '98765432'), ('2050-10-30', '12345678'),
+            ('2050-10-30', '95765432'), ('2050-10-30', '98765432')]
+        assert rows[1]['consultant'] == 'ctest'
+        assert rows[1]['created_by'] == 'fuser'
+        assert rows[1]['total_actions'] == '2'
+        assert rows[1]['surgery_date'] == ''
+
+    def test_filters(self):
+        rows = export_csv(case_rows,
+                          ExportFilter(start=date(2050, 10, 17),
+                                       end=date(2050, 10, 30),
+                                       consultant='ctest',
+                                       statuses=['TBD']))
+
+        assert [row['hospital_number'] for row in rows] == ['95765432',
+                                                            '98765432']
+
+    def test_other_consultant(self):
+        rows = export_csv(case_rows, ExportFilter(consultant='aconsultant'))
+
+        assert rows == []
+
+    def test_importer_columns(self):
+        """Exports have the columns the importer reads"""
+        header, rows = case_rows(ExportFilter())
+
+        assert set(IMPORTERS['cases'].columns) <= set(header)
+
+
+@pytest.mark.usefixtures('db_session', 'populate_db')
+class TestActionRows:
+    def test_all(self):
+        rows = export_csv(action_rows, ExportFilter())
+
+        assert [row['action'] for row in rows] == [
+            'this is something that you need to do', 'contact gp']
+        assert rows[0]['assigned_to'] == 'fuser'
+        assert rows[0]['is_completed'] == 'no'
+
+    def test_importer_columns(self):
+        header, rows = action_rows(ExportFilter())
+
+        assert set(IMPORTERS['actions'].columns) <= set(header)
+
+    def test_case_status_filter(self):
+        rows = export_csv(action_rows, ExportFilter(statuses=['TBD']))
+
+        assert rows == []
+
+
+def test_csv_lines_generator():
+    lines = csv_lines(['a', 'b'], iter([(1, None), (True, 'x,y')]))
+
+    assert next(lines) == 'a,b\r\n'
+    assert list(lines) == ['1,\r\n', 'yes,"x,y"\r\n']
+
+
+def test_write_xlsx(tmpdir):
+    openpyxl = pytest.importorskip('openpyxl')
+    path = str(tmpdir.join('export.xlsx'))
+    write_xlsx(['a', 'b'], [(1, None), (False, 'x')], path)
+
+    sheet = openpyxl.load_workbook(path).active
+    assert [[cell.value for cell in row] for row in sheet.rows] == [
+        ['a', 'b'], [1, None], ['no', 'x']]
@@ -0,0 +1,161 @@
+import os
+import tempfile
+
+import pytest
+
+from mdt_app.importer import (PatientImporter, RejectedReport, import_rows,
+                              read_rows)
+from mdt_app.models import *
+
+
+def run_import(db_session, kind, rows, **kwargs):
+    """ImportResult and rejected rows report, '' if it wasn't written"""
+    path = os.path.join(tempfile.mkdtemp(), 'rejected.csv')
+    with RejectedReport(path) as report:
+        result = import_rows(db_session.connection(), kind, rows, report,
+                             **kwargs)
+    if not os.path.exists(path):
+        return result, ''
+    with open(path, newline='') as report_file:
+        return result, report_file.read()
+
+
+@pytest.mark.usefixtures('db_session', 'populate_db')
+class TestImportPatients:
+    def test_import(self, db_session, query_counter):
+        rows = [{'hospital_number': 'a0000001', 'first_name': 'new',
+                 'last_name': 'patient', 'date_of_birth': '01-Feb-1950',
+                 'sex': 'F'},
+                {'hospital_number': 'A0000002', 'first_name': 'Other',
+                 'last_name': 'PATIENT', 'date_of_birth': '1950-02-01',
+                 'sex': 'male'},
+                {'hospital_number': 'A0000003', 'first_name': 'Third',
+                 'last_name': 'PATIENT', 'date_of_birth': '02/02/1950',
+                 'sex': 'M'}]
+        db_session.connection()
+        with query_counter:
+            result, report = run_import(db_session, 'patients', rows,
+                                        batch_size=2)
+
+        assert tuple(result) == (3, 3, 0)
+        assert report == ''
+        # select of existing patients then an insert in a savepoint (and
+        # its release) per batch
+        assert query_counter.count == 7
+        patient = Patient.query.filter_by(hospital_number='A0000001').one()
+        assert (patient.first_name, patient.last_name) == ('New', 'PATIENT')
+        assert str(patient.date_of_birth) == '1950-02-01'
+
+    def test_rejected(self, db_session):
+        valid = {'hospital_number': 'B0000001', 'first_name': 'Valid',
+                 'last_name': 'PATIENT', 'date_of_birth': '1950-02-01',
+                 'sex': 'F'}
+        rows = [valid,
+                dict(valid, first_name='Duplicate'),
+                dict(valid, hospital_number='12345678'),
+                dict(valid, hospital_number='B0000002'),
+                dict(valid, hospital_number='B0000003',
+                     date_of_birth='31-Feb-1950'),
+                dict(valid, hospital_number='B0000004', sex='X'),
+                dict(valid, hospital_number='B0000005', last_name='')]
+        result, report = run_import(db_session, 'patients', rows)
+
+        assert tuple(result) == (7, 1, 6)
+        lines = report.splitlines()
+        assert lines[0] == 'line,reason,row'
+        assert lines[1].startswith('3,Patient with hospital number already')
+        assert lines[3].startswith('5,"Patient with same first name')
+        assert 'is not a date' in lines[4]
+        assert 'last_name is required' in lines[6]
+
+    def test_failed_batch(self, db_session, monkeypatch):
+        rows = [{'hospital_number': 'C000000{}'.format(number),
+                 'first_name': 'Batch', 'last_name': 'PATIENT',
+                 'date_of_birth': '1950-02-0{}'.format(number), 'sex': 'F'}
+                for number in range(1, 6)]
+        # added by someone else after the existing patients were loaded
+        load = PatientImporter.load
+
+        def load_then_insert(importer, connection):
+            load(importer, connection)
+            if 'C0000003' not in importer.hospital_numbers:
+                connection.execute(Patient.__table__.insert(),
+                                   dict(rows[2], first_name='Other'))
+        monkeypatch.setattr(PatientImporter, 'load', load_then_insert)
+        result, report = run_import(db_session, 'patients', rows,
+                                    batch_size=2)
+
+        # the second batch fails, the third is still imported
+        assert tuple(result) == (5, 3, 2)
+        assert [line.split(',')[0] for line in report.splitlines()] == [
+            'line', '4', '5']
+        assert 'Batch not inserted' in report
+        assert Patient.query.filter_by(first_name='Batch').count() == 3
+
+    def test_missing_column(self, db_session):
+        with pytest.raises(ValueError):
+            run_import(db_session, 'patients', [{'hospital_number': 'x'}])
+
+
+@pytest.mark.usefixtures('db_session', 'populate_db')
+class TestImportCases:
+    def test_meetings(self, db_session):
+        rows = [{'date': '01-Jan-2001', 'comment': 'old', 'is_cancelled': ''},
+                {'date': '2001-01-01'},
+                {'date': '2001-01-08', 'is_cancelled': 'yes'},
+                {'date': '15-Nov-2010'}]
+        result, report = run_import(db_session, 'meetings', rows)
+
+        assert tuple(result) == (4, 2, 2)
+        assert Meeting.query.filter_by(comment='old').one().is_cancelled is \
+            False
+
+    def test_cases(self, db_session):
+        case = {'hospital_number': '12345678', 'meeting': '2001-01-01',
+                'consultant': 'CTest', 'created_by': 'fuser',
+                'medical_history': 'history', 'question': 'question',
+                'discussion': 'discussed'}
+        rows = [case,
+                dict(case, discussion=''),
+                dict(case, hospital_number='98765432', consultant='fuser'),
+                dict(case, hospital_number='99999999'),
+                dict(case, hospital_number='98765432', meeting='2001-02-01'),
+                dict(case, hospital_number='98765432', question='')]
+        result, report = run_import(db_session, 'cases', rows)
+
+        assert tuple(result) == (6, 1, 5)
+        imported = (Case.query.join(Meeting)
+                              .filter(Meeting.date == '2001-01-01')
+                              .one())
+        assert imported.status == 'DISC'
+        assert str(imported.created_on) == '2001-01-01'
+        assert 'No consultant with username fuser' in report
+        assert 'No patient with hospital number 99999999' in report
+        assert 'No meeting on 2001-02-01' in report
+
+    def test_actions(self, db_session):
+        action = {'hospital_number': '12345678', 'meeting': '2001-01-01',
+                  'action': 'book scan', 'assigned_to': 'fuser'}
+        rows = [action,
+                dict(action, action='letter to GP', is_completed='yes'),
+                action,
+                dict(action, meeting='2050-10-16')]
+        result, report = run_import(db_session, 'actions', rows)
+
+        assert tuple(result) == (4, 2, 2)
+        case = (Case.query.join(Meeting)
+                          .filter(Meeting.date == '2001-01-01')
+                          .one())
+        # counters are recounted after the inserts
+        assert (case.open_actions, case.total_actions) == (1, 2)
+        assert 'Action already exists for this case' in report
+        assert 'Patient has no case on this date' in report
+
+
+def test_read_csv(tmpdir):
+    path = tmpdir.join('patients.csv')
+    path.write_text('﻿hospital_number,first_name\nA0000001,New\n',
+                    encoding='utf-8')
+
+    assert list(read_rows(str(path))) == [{'hospital_number': 'A0000001',
+                                           'first_name': 'New'}]
@@ -0,0 +1,103 @@
+import json
+import logging
+import re
+
+import pytest
+from flask import url_for
+
+from mdt_app.instrumentation import QueryBudgetExceeded, QueryStats
+
+
+@pytest.fixture
+def budget(app):
+    """Set the query budget of patient_list for a test"""
+    view = app.view_functions['main.patient_list']
+    original = view.query_budget
+
+    def set_budget(statements):
+        view.query_budget = statements
+
+    yield set_budget
+    view.query_budget = original
+
+
+class ListHandler(logging.Handler):
+    """Keeps the records logged to it"""
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+@pytest.fixture
+def log_records():
+    """Records logged to mdt_app.instrumentation during a test"""
+    logger = logging.getLogger('mdt_app.instrumentation')
+    handler = ListHandler()
+    level = logger.level
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    yield handler.records
+    logger.removeHandler(handler)
+    logger.setLevel(level)
+
+
+def test_stats():
+    stats = QueryStats()
+    stats.add('SELECT 1', 0.002)
+    stats.add('SELECT 2', 0.005)
+    stats.add('SELECT 3', 0.001)
+
+    assert stats.count == 3
+    assert stats.duration == pytest.approx(0.008)
+    assert (stats.slowest, stats.slowest_duration) == ('SELECT 2', 0.005)
+
+
+@pytest.mark.usefixtures('client_class', 'db_session', 'populate_db')
+class TestInstrumentation:
+    def test_server_timing(self):
+        request = self.client.get(url_for('main.patient_list'))
+
+        assert re.match(r'db;dur=[\d.]+;desc="\d+ statements", '
+                        r'app;dur=[\d.]+$', request.headers['Server-Timing'])
+
+    def test_log(self, log_records):
+        self.client.get(url_for('main.patient_list'))
+        logged = json.loads(log_records[-1].getMessage())
+
+        assert logged['endpoint'] == 'main.patient_list'
+        assert logged['status'] == 200
+        # the page's version, then its patients
+        assert logged['statements'] == 2
+        assert logged['slowest'].startswith('SELECT')
+
+    def test_budget_raises(self, budget):
+        budget(0)
+
+        with pytest.raises(QueryBudgetExceeded):
+            self.client.get(url_for('main.patient_list'))
+
+    def test_budget_logged(self, app, budget, log_records):
+        budget(0)
+        app.config['QUERY_BUDGET_RAISE'] = False
+        try:
+            request = self.client.get(url_for('main.patient_list'))
+        finally:
+            app.config['QUERY_BUDGET_RAISE'] = True
+
+        assert request.status_code == 200
+        assert log_records[-1].levelno == logging.WARNING
+        assert log_records[-1].getMessage() == (
+            'main.patient_list ran 2 statements, its budget is 0')
+
+    def test_disabled(self, app):
+        app.config['SQL_INSTRUMENTATION'] = False
+        try:
+            request = self.client.get(url_for('main.patient_list'))
+        finally:
+            app.config['SQL_INSTRUMENTATION'] = True
+
+        assert 'Server-Timing' not in request.headers
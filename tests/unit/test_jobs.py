@@ -0,0 +1,169 @@
+import json
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from flask import url_for
+
+from mdt_app.jobs import (claim_job, enqueue, job, requeue_stale, run_job,
+                          work)
+from mdt_app.models import *
+
+
+@job('test_add')
+def add(a, b):
+    return a + b
+
+
+@job('test_fail')
+def fail():
+    raise RuntimeError('job failed')
+
+
+@pytest.fixture
+def queue_only(app):
+    """Queue jobs without running them, as there is a worker"""
+    app.config['JOBS_INLINE'] = False
+    yield
+    app.config['JOBS_INLINE'] = True
+
+
+@pytest.mark.usefixtures('db_session', 'populate_db')
+class TestJobs:
+    def test_inline(self):
+        added = enqueue('test_add', a=1, b=2)
+
+        assert added.status == 'done'
+        assert added.attempts == 1
+        assert json.loads(added.result) == 3
+
+    def test_unknown_kind(self):
+        with pytest.raises(ValueError):
+            enqueue('not_a_job')
+
+    def test_claim_once(self, queue_only):
+        added = enqueue('test_add', a=1, b=2)
+        assert added.status == 'queued'
+
+        assert claim_job() == added.id
+        # already claimed, e.g. by another worker
+        assert claim_job(added.id) is None
+        assert run_job(added.id).status == 'done'
+
+    def test_not_due(self, queue_only):
+        added = enqueue('test_add', a=1, b=2)
+        added.run_after = datetime.utcnow() + timedelta(minutes=5)
+
+        assert claim_job() is None
+
+    def test_retry_then_fail(self, queue_only):
+        failed = enqueue('test_fail', max_attempts=2)
+        claim_job(failed.id)
+        failed = run_job(failed.id)
+
+        assert failed.status == 'queued'
+        assert failed.run_after > datetime.utcnow()
+        assert 'RuntimeError: job failed' in failed.error
+
+        failed.run_after = datetime.utcnow()
+        assert claim_job() == failed.id
+        failed = run_job(failed.id)
+
+        assert failed.status == 'failed'
+        assert failed.attempts == 2
+
+    def test_inline_not_retried(self):
+        # there is no worker to try it again
+        failed = enqueue('test_fail', max_attempts=2)
+
+        assert failed.status == 'failed'
+        assert failed.attempts == 1
+
+    def test_requeue_stale(self, queue_only, db_session):
+        added = enqueue('test_add', a=1, b=2)
+        claim_job(added.id)
+        added.started_on = datetime.utcnow() - timedelta(hours=1)
+        db_session.commit()
+
+        assert requeue_stale() == 1
+        assert Job.query.get(added.id).status == 'queued'
+
+
+class TestWork:
+    """work with claim_job, run_job and requeue_stale replaced, as the
+    worker's threads can't see the test's transaction"""
+
+    def setup(self):
+        self.job_ids = [1]
+        self.requeued = []
+        self.errors = []
+
+    def claim_job(self):
+        return self.job_ids.pop() if self.job_ids else None
+
+    def requeue_stale(self, timeout):
+        self.requeued.append(timeout)
+        return 0
+
+    def work(self, app, monkeypatch, run_job, **kwargs):
+        monkeypatch.setattr('mdt_app.jobs.claim_job', self.claim_job)
+        monkeypatch.setattr('mdt_app.jobs.run_job', run_job)
+        monkeypatch.setattr('mdt_app.jobs.requeue_stale', self.requeue_stale)
+        monkeypatch.setattr('mdt_app.jobs.logger.error',
+                            lambda *args, **kwargs: self.errors.append(args))
+        work(app, burst=True, poll_interval=0, **kwargs)
+
+    def test_failed_future_logged(self, app, monkeypatch):
+        def run_job(job_id):
+            raise RuntimeError('commit failed')
+        self.work(app, monkeypatch, run_job)
+
+        assert self.errors == [('Job %s was not recorded', 1)]
+
+    def test_requeue_while_working(self, app, monkeypatch):
+        def run_job(job_id):
+            time.sleep(0.05)
+        self.work(app, monkeypatch, run_job, timeout=0.01)
+
+        # when the worker starts, then while the job runs
+        assert len(self.requeued) > 1
+        assert self.errors == []
+
+
+@pytest.mark.usefixtures('client_class', 'db_session', 'populate_db')
+class TestJobViews:
+    def test_job_status(self):
+        added = enqueue('test_add', a=1, b=2)
+        request = self.client.get(url_for('main.job_status', job_id=added.id))
+
+        assert request.json['status'] == 'done'
+        assert request.json['result'] == 3
+
+    def test_error_last_line(self):
+        failed = enqueue('test_fail')
+        request = self.client.get(url_for('main.job_status', job_id=failed.id))
+
+        assert request.json['status'] == 'failed'
+        assert request.json['error'] == 'RuntimeError: job failed'
+
+    def test_push_in_background(self, queue_only):
+        request = self.client.get(url_for('main.case_list',
+                                          meeting='2050-10-30',
+                                          push_cases=1))
+        push_job = Job.query.filter_by(kind='push_cases').one()
+
+        assert request.status_code == 302
+        assert 'job={}'.format(push_job.id) in request.location
+        progress = self.client.get(request.location)
+        assert b'job_status' in progress.data
+
+        run_job(push_job.id)
+        finished = self.client.get(request.location)
+        assert finished.status_code == 302
+        assert 'job=' not in finished.location
+        assert 'meeting=2050-10-30' in finished.location
+        outcome = self.client.get(finished.location)
+        assert b'no meetings exist after this one' in outcome.data
+        # flashed once, not again when the page is reloaded
+        assert b'no meetings exist' not in self.client.get(
+            finished.location).data
@@ -0,0 +1,34 @@
+import pytest
+
+from mdt_app.models import *
+from mdt_app.main.actions import complete_action, update_case_status
+
+
+@pytest.mark.usefixtures('db_session', 'populate_db')
+class TestCompleteAction:
+    def test_open_actions_remain(self, db_session):
+        status = complete_action(Action.query.get(1))
+        db_session.commit()
+
+        assert status == 'DISC'
+        assert Case.query.get(1).status == 'DISC'
+
+    def test_all_complete(self, db_session):
+        status = complete_action(Action.query.get(2))
+        db_session.commit()
+
+        assert status == 'COMP'
+        assert Case.query.get(1).status == 'COMP'
+
+    def test_update_case_status_queries(self, db_session, query_counter):
+        Case.query.get(1).status = 'TBD'
+        db_session.flush()
+        db_session.expire_all()
+        with query_counter:
+            update_case_status(1)
+            db_session.flush()
+
+        # case query, update and its audit entry
+        assert query_counter.count == 3
+        assert AuditEntry.query.filter_by(table_name='cases', row_id=1,
+                                          operation='update').count()
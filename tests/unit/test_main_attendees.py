@@ -0,0 +1,61 @@
+import pytest
+
+from mdt_app.models import *
+from mdt_app.main.attendees import attendee_names, sync_attendees
+
+
+@pytest.mark.usefixtures('db_session', 'populate_db')
+class TestSyncAttendees:
+    def user_ids(self, meeting_id):
+        return {attendee.user_id for attendee in
+                Attendee.query.filter_by(meeting_id=meeting_id)}
+
+    def test_add(self, db_session):
+        added, removed = sync_attendees(1, [1, 3])
+        db_session.commit()
+
+        assert added == {1, 3}
+        assert removed == set()
+        assert self.user_ids(1) == {1, 3}
+
+    def test_add_and_remove(self, db_session, query_counter):
+        with query_counter:
+            added, removed = sync_attendees(1, [3, 4])
+
+        # select existing, delete, insert and select the new ids, then (as
+        # AUDIT_ASYNC is off) the audit entries of the delete and insert
+        assert query_counter.count == 6
+        db_session.commit()
+        assert added == {4}
+        assert removed == {1}
+        assert self.user_ids(1) == {3, 4}
+
+    def test_unchanged(self, db_session, query_counter):
+        sync_attendees(1, [3, 4])
+        db_session.commit()
+        assert self.user_ids(1) == {3, 4}
+        with query_counter:
+            added, removed = sync_attendees(1, [3, 4])
+
+        assert query_counter.count == 1
+        assert added == removed == set()
+
+    def test_other_meetings_unchanged(self, db_session):
+        sync_attendees(3, [1])
+        sync_attendees(1, [])
+        db_session.commit()
+
+        assert self.user_ids(1) == set()
+        assert self.user_ids(3) == {1}
+
+    def test_session_collections_refreshed(self, db_session):
+        sync_attendees(3, [1])
+        db_session.commit()
+        meeting = Meeting.query.get(3)
+        assert len(meeting.attendees) == 1
+        sync_attendees(3, [1, 3])
+        db_session.commit()
+
+        assert len(meeting.attendees) == 2
+        assert attendee_names(3) == [('consultant', 'test'),
+                                     ('first', 'user')]
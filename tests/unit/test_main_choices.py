@@ -0,0 +1,80 @@
+import pytest
+
+from werkzeug.datastructures import MultiDict
+from wtforms.validators import ValidationError
+
+from mdt_app.main.forms import *
+from mdt_app.models import *
+
+
+@pytest.mark.usefixtures('db_session', 'populate_db')
+class TestCachedQuerySelectField:
+    def test_choices(self):
+        form = ActionForm()
+
+        assert [(pk, label) for pk, label, selected
+                in form.assigned_to.iter_choices()] == [
+            ('__None', '---'), ('4', 'aconsultant'), ('3', 'ctest'),
+            ('1', 'fuser')]
+
+    def test_cached(self, query_counter):
+        ActionForm().assigned_to()
+        with query_counter:
+            html = CaseEditForm().action_to()
+
+        assert query_counter.count == 0
+        assert 'fuser' in html
+
+    def test_formdata(self):
+        form = ActionForm(formdata=MultiDict({'assigned_to': '3'}))
+
+        form.assigned_to.pre_validate(form)
+        assert form.assigned_to.data is User.query.get(3)
+
+    def test_invalid_choice(self):
+        # unconfirmed user isn't a choice
+        form = ActionForm(formdata=MultiDict({'assigned_to': '2'}))
+
+        with pytest.raises(ValidationError):
+            form.assigned_to.pre_validate(form)
+        assert form.assigned_to.data is None
+
+    def test_selected_object(self):
+        form = ActionForm(assigned_to=User.query.get(1))
+
+        assert [pk for pk, label, selected in form.assigned_to.iter_choices()
+                if selected] == ['1']
+
+    def test_invalidated(self, db_session):
+        ActionForm().assigned_to()
+        User.query.get(1).username = 'renamed'
+        db_session.commit()
+
+        assert 'renamed' in ActionForm().assigned_to()
+
+
+@pytest.mark.usefixtures('db_session', 'populate_db')
+class TestCachedQuerySelectMultipleField:
+    def test_formdata(self, query_counter):
+        AttendeeForm().user()
+        form = AttendeeForm(formdata=MultiDict([('user', '1'),
+                                                ('user', '3')]))
+        with query_counter:
+            users = form.user.data
+
+        # chosen users loaded in one query, in the order of the choices
+        assert query_counter.count == 1
+        assert [user.id for user in users] == [3, 1]
+
+    def test_invalid_choice(self):
+        form = AttendeeForm(formdata=MultiDict([('user', '1'),
+                                                ('user', '2')]))
+
+        with pytest.raises(ValidationError):
+            form.user.pre_validate(form)
+
+    def test_selected(self):
+        form = AttendeeForm(user=[User.query.get(3)])
+
+        assert [label for pk, label, selected in form.user.iter_choices()
+                if selected] == ['consultant test']
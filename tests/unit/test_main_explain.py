@@ -0,0 +1,44 @@
+import pytest
+
+from mdt_app.models import *
+from mdt_app.main.explain import explain, explain_all, hot_queries
+
+
+@pytest.mark.usefixtures('db_session', 'populate_db')
+class TestExplain:
+    def test_explain_all(self):
+        plans = explain_all()
+
+        assert list(plans) == list(hot_queries())
+        assert all(plans.values())
+
+    @pytest.mark.parametrize('analyze', [True, False])
+    def test_plan_lines(self, analyze):
+        plan = explain(Case.query.filter_by(meeting_id=1), analyze)
+
+        assert plan
+        assert all(isinstance(line, str) and line for line in plan)
+
+    def test_uses_index(self, db_session):
+        dialect = db_session.connection().dialect.name
+        if dialect == 'postgresql':
+            # the test tables are too small for the planner to pick an index
+            db_session.execute('SET LOCAL enable_seqscan = off')
+        elif dialect != 'sqlite':
+            pytest.skip('plan text checked is from sqlite and postgres')
+        try:
+            plan = ' '.join(explain(Case.query.filter_by(meeting_id=1,
+                                                         status='TBD')))
+        finally:
+            db_session.rollback()
+
+        assert 'ix_cases_meeting_id_status' in plan
+        if dialect == 'postgresql':
+            # run with ANALYZE and BUFFERS
+            assert 'actual time=' in plan
+            assert 'Buffers' in plan or 'Planning' in plan
+
+
+class TestExplainEmpty:
+    def test_no_data(self, db_session):
+        assert explain_all() == {}
@@ -0,0 +1,40 @@
+import pytest
+
+from mdt_app.main.lookup import find_patients
+from mdt_app.models import *
+
+
+def hospital_numbers(term, **kwargs):
+    return [patient.hospital_number
+            for patient in find_patients(term, **kwargs)]
+
+
+@pytest.mark.usefixtures('db_session', 'populate_db')
+class TestFindPatients:
+    def test_hospital_number(self):
+        # ordered by last name
+        assert hospital_numbers('9') == ['95765432', '98765432']
+        assert hospital_numbers('957') == ['95765432']
+        # only matches start of hospital number
+        assert hospital_numbers('765432') == []
+
+    def test_names(self):
+        assert hospital_numbers('sec') == ['98765432']
+        assert hospital_numbers('dum') == ['95765432']
+        # every word must match
+        assert hospital_numbers('third entry') == []
+        assert hospital_numbers('third dummy') == ['95765432']
+
+    def test_date_of_birth(self):
+        assert hospital_numbers('09-Oct-1988') == ['12345678']
+        assert hospital_numbers('1953-01-02') == ['98765432']
+
+    def test_wildcards_escaped(self):
+        assert hospital_numbers('%') == []
+        assert hospital_numbers('_') == []
+
+    def test_limit(self):
+        assert len(find_patients('9', limit=1)) == 1
+
+    def test_blank(self):
+        assert find_patients('  ') == []
@@ -0,0 +1,47 @@
+import pytest
+from datetime import date
+
+from mdt_app.main.meetings import meeting_page
+from mdt_app.models import *
+
+
+def dates(page):
+    return [str(row.meeting.date) for row in page.rows]
+
+
+@pytest.mark.usefixtures('db_session', 'populate_db')
+class TestMeetingPage:
+    def test_counts(self, db_session, query_counter):
+        db_session.add(Attendee(meeting_id=1, user_id=1))
+        db_session.commit()
+        meeting_page()
+        with query_counter:
+            page = meeting_page()
+
+        assert query_counter.count == 1
+        row = page.rows[0]
+        assert str(row.meeting.date) == '2050-10-30'
+        assert (row.tbd, row.disc, row.comp, row.total) == (2, 1, 0, 3)
+        assert row.attendees == 1
+        assert page.rows[1].total == 0
+
+    def test_first_page(self):
+        page = meeting_page(per_page=2)
+
+        assert dates(page) == ['2050-10-30', '2050-10-23']
+        assert page.newer is None
+        assert page.older == date(2050, 10, 23)
+
+    def test_older_page(self):
+        page = meeting_page(before=date(2050, 10, 23), per_page=2)
+
+        assert dates(page) == ['2050-10-16', '2010-11-15']
+        assert page.newer == date(2050, 10, 16)
+        assert page.older is None
+
+    def test_newer_page(self):
+        page = meeting_page(after=date(2050, 10, 16), per_page=2)
+
+        assert dates(page) == ['2050-10-30', '2050-10-23']
+        assert page.newer is None
+        assert page.older == date(2050, 10, 23)
@@ -0,0 +1,68 @@
+import pytest
+
+from mdt_app.models import *
+from mdt_app.main.push import next_meeting_after, push_cases
+
+
+@pytest.mark.usefixtures('db_session', 'populate_db')
+class TestNextMeetingAfter:
+    def test_skips_cancelled(self):
+        meeting = Meeting.query.filter_by(date='2050-10-16').first()
+
+        assert str(next_meeting_after(meeting.date).date) == '2050-10-30'
+
+    def test_none_after_last(self):
+        meeting = Meeting.query.filter_by(date='2050-10-30').first()
+
+        assert next_meeting_after(meeting.date) is None
+
+
+@pytest.mark.usefixtures('db_session', 'populate_db')
+class TestPushCases:
+    def test_clash_skipped(self):
+        # patient 2 has cases on both 16th and 30th Oct
+        meeting = Meeting.query.filter_by(date='2050-10-16').first()
+        next_meeting = Meeting.query.filter_by(date='2050-10-30').first()
+        report = push_cases(meeting.id, next_meeting, statuses=['TBD'])
+
+        assert report.moved == []
+        assert report.skipped == [(2, 'Second', 'ENTRY')]
+        assert Case.query.get(2).meeting_id == meeting.id
+
+    def test_moves_in_few_statements(self, db_session, query_counter):
+        meeting = Meeting.query.filter_by(date='2050-10-30').first()
+        new_meeting = Meeting(id=10, date='2050-12-30')
+        db_session.add(new_meeting)
+        db_session.commit()
+        meeting_id = meeting.id
+        # load the meeting expired by the commit before counting statements
+        db_session.refresh(new_meeting)
+        with query_counter:
+            report = push_cases(meeting_id, new_meeting, statuses=['TBD'])
+
+        # select, update and (as AUDIT_ASYNC is off) the audit entries
+        assert query_counter.count == 3
+        assert [case_id for case_id, f_name, l_name in report.moved] == [4, 3]
+        assert report.skipped == []
+        db_session.commit()
+        assert Case.query.get(3).meeting_id == new_meeting.id
+        # discussed case is not moved
+        assert Case.query.get(1).meeting_id == meeting.id
+        assert len(new_meeting.cases) == 2
+
+    def test_all_statuses(self, db_session):
+        meeting = Meeting.query.get(1)
+        case_ids = sorted(case.id for case in meeting.cases)
+        new_meeting = Meeting(id=11, date='2051-01-06')
+        db_session.add(new_meeting)
+        db_session.flush()
+        try:
+            report = push_cases(meeting.id, new_meeting)
+
+            assert sorted(case_id for case_id, f_name, l_name
+                          in report.moved) == case_ids
+            assert 1 in case_ids
+            assert report.skipped == []
+        finally:
+            # not committed, so the other tests' cases are left in place
+            db_session.rollback()
@@ -0,0 +1,63 @@
+import io
+import zipfile
+
+import pytest
+
+from mdt_app.main.reports import (case_report, meeting_reports, render_pdf,
+                                  render_reports, zip_chunks)
+
+
+@pytest.mark.usefixtures('db_session', 'populate_db')
+class TestReportData:
+    def test_case_report(self):
+        report = case_report(1)
+        details = dict(report.details)
+
+        assert report.filename == '2050-10-30-12345678-case-1.pdf'
+        assert details['Consultant'] == 'consultant test'
+        assert details['Added by'] == 'first user on 15-Oct-2017'
+        assert dict(report.sections)['Discussion'] == ''
+        assert report.actions == [
+            ('this is something that you need to do', 'first user', 'No'),
+            ('contact gp', 'first user', 'No')]
+
+    def test_no_case(self):
+        assert case_report(100) is None
+
+    def test_meeting_reports_one_query(self, db_session, query_counter):
+        db_session.expunge_all()
+        db_session.connection()
+        with query_counter:
+            reports = meeting_reports(1)
+
+        assert query_counter.count == 1
+        # in the order cases were added
+        assert [report.filename[-10:] for report in reports] == [
+            'case-4.pdf', 'case-3.pdf', 'case-1.pdf']
+
+
+def test_zip_chunks():
+    chunks = list(zip_chunks([('a.pdf', b'first'), ('b.pdf', b'second')]))
+    zip_file = zipfile.ZipFile(io.BytesIO(b''.join(chunks)))
+
+    # a chunk per file then the central directory
+    assert len(chunks) == 3
+    assert zip_file.namelist() == ['a.pdf', 'b.pdf']
+    assert zip_file.read('b.pdf') == b'second'
+
+
+@pytest.mark.usefixtures('db_session', 'populate_db')
+class TestRenderPdf:
+    def setup(self):
+        pytest.importorskip('reportlab')
+
+    def test_render_pdf(self):
+        assert render_pdf(case_report(1)).startswith(b'%PDF')
+
+    def test_render_reports_pool(self):
+        reports = meeting_reports(1)
+        rendered = list(render_reports(reports, workers=2))
+
+        assert [filename for filename, pdf in rendered] == [
+            report.filename for report in reports]
+        assert all(pdf.startswith(b'%PDF') for filename, pdf in rendered)
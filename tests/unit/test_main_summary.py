@@ -0,0 +1,65 @@
+import pytest
+
+from mdt_app.models import *
+from mdt_app.main.summary import meeting_summary
+
+
+@pytest.mark.usefixtures('db_session', 'populate_db')
+class TestMeetingSummary:
+    def test_counts(self):
+        counts = meeting_summary(1)
+
+        assert counts == {'tbd': 2, 'disc': 1, 'comp': 0, 'total': 3,
+                          'percent_discussed': 33}
+
+    def test_no_cases(self):
+        counts = meeting_summary(2)
+
+        assert counts['total'] == 0
+        assert counts['percent_discussed'] == 0
+
+    def test_cached(self, query_counter):
+        meeting_summary(1)
+        with query_counter:
+            meeting_summary(1)
+
+        assert query_counter.count == 0
+
+    def test_status_change_invalidates(self, db_session):
+        meeting_summary(1)
+        case = Case.query.filter_by(meeting_id=1, status='TBD').first()
+        case.status = 'COMP'
+        db_session.commit()
+
+        assert meeting_summary(1)['comp'] == 1
+        assert meeting_summary(1)['tbd'] == 1
+
+    def test_meeting_change_invalidates(self, db_session):
+        meeting_summary(1)
+        meeting_summary(4)
+        case = Case.query.filter_by(meeting_id=1).first()
+        case.meeting_id = 4
+        db_session.commit()
+
+        assert meeting_summary(1)['total'] == 2
+        assert meeting_summary(4)['total'] == 1
+
+    def test_other_changes_keep_cache(self, db_session, query_counter):
+        meeting_summary(3)
+        case = Case.query.filter_by(meeting_id=3).first()
+        case.question = 'a different question'
+        db_session.commit()
+
+        with query_counter:
+            meeting_summary(3)
+        assert query_counter.count == 0
+
+    def test_rollback_invalidates(self, db_session):
+        case = Case.query.filter_by(meeting_id=1, status='TBD').first()
+        case.status = 'COMP'
+        db_session.flush()
+        # cached from the flushed change
+        assert meeting_summary(1)['comp'] == 1
+        db_session.rollback()
+
+        assert meeting_summary(1)['comp'] == 0
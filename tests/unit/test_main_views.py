@@ -1,9 +1,10 @@
 import pytest
 
-from flask import url_for
+from flask import current_app, url_for
 from pytest_flask import fixtures
 from flask_login import login_user, current_user, logout_user
 
+from mdt_app.cache import clear_all as clear_caches
 from mdt_app.models import *
 from mdt_app.main.forms import *
 
@@ -28,9 +29,9 @@ class TestCaseList:
 
         assert request.status_code == 200
 
-        # Cases are listed with patient name
-        assert b"PATIENT" in request.data
-        assert b"ENTRY" in request.data
+        # All cases are loaded by the table from case_list_data
+        assert b"case_table" in request.data
+        assert b"PATIENT" not in request.data
 
     def test_meeting_filter(self):
         request = self.client.get(url_for('main.case_list',
@@ -48,6 +49,24 @@ class TestCaseList:
         assert "to be actioned: 1 / 3" in html
         assert "& actioned: 0 / 3" in html
 
+    def test_meeting_summary_data(self):
+        request = self.client.get(url_for('main.meeting_summary_data',
+                                          pk=self.meeting.id))
+
+        assert request.json['total'] == 3
+        assert request.json['percent_discussed'] == 33
+
+    def test_save_attendees(self):
+        request = self.client.post(url_for('main.meeting_attendees',
+                                           pk=self.meeting.id),
+                                   data={'user': ['1', '3'],
+                                         'comment': 'quorate'})
+
+        assert request.status_code == 200
+        assert request.json['attendees'] == ['consultant test', 'first user']
+        assert request.json['added'] == 2
+        assert self.meeting.comment == 'quorate'
+
     def test_push_cases_no_future(self):
         request = self.client.get(url_for('main.case_list',
                                           meeting=self.meeting.date,
@@ -76,6 +95,312 @@ class TestCaseList:
         assert b'Case for patient Third DUMMY was moved to ' in request.data
 
 
+@pytest.mark.usefixtures('client_class', 'db_session', 'populate_db')
+class TestMeetingEdit:
+    def test_cancel_pushes_cases(self, db_session):
+        db_session.add(Meeting(id=10, date='2050-12-30'))
+        db_session.commit()
+        meeting = Meeting.query.filter_by(date='2050-10-30').first()
+        request = self.client.post(url_for('main.meeting_edit', pk=meeting.id),
+                                   data={'date': '30-Oct-2050', 'comment': '',
+                                         'is_cancelled': 'y',
+                                         'id': meeting.id},
+                                   follow_redirects=True)
+
+        assert b'was moved from 30-Oct-2050 to 30-Dec-2050' in request.data
+        assert len(Meeting.query.get(10).cases) == 3
+
+    def test_edit_cancelled_meeting(self, db_session):
+        meeting = Meeting.query.filter_by(date='2050-10-16').first()
+        meeting.is_cancelled = True
+        db_session.commit()
+        jobs = Job.query.count()
+        request = self.client.post(url_for('main.meeting_edit', pk=meeting.id),
+                                   data={'date': '16-Oct-2050',
+                                         'comment': 'changed',
+                                         'is_cancelled': 'y',
+                                         'id': meeting.id})
+
+        assert request.status_code == 302
+        assert 'job=' not in request.location
+        assert Job.query.count() == jobs
+
+
+@pytest.mark.usefixtures('client_class', 'db_session', 'populate_db')
+class TestCaseListData:
+    def get_data(self, **kwargs):
+        request = self.client.get(url_for('main.case_list_data', draw=1,
+                                          **kwargs))
+        assert request.status_code == 200
+        return request.json
+
+    def test_all_cases(self):
+        data = self.get_data(start=0, length=10)
+
+        assert data['draw'] == 1
+        assert data['recordsTotal'] == 4
+        assert data['recordsFiltered'] == 4
+        assert len(data['data']) == 4
+        # default order is newest meeting first
+        assert '30-Oct-2050' in data['data'][0]['meeting']
+        assert '16-Oct-2050' in data['data'][-1]['meeting']
+        # then oldest case first within a meeting, first case discussed
+        assert 'fourth' in data['data'][0]['medical_history']
+        assert data['data'][0]['DT_RowClass'] == ''
+        assert data['data'][2]['DT_RowClass'] == 'alert alert-warning'
+
+    def test_paging(self):
+        first_page = self.get_data(start=0, length=3)
+        second_page = self.get_data(start=3, length=3)
+
+        assert len(first_page['data']) == 3
+        assert len(second_page['data']) == 1
+        assert second_page['recordsTotal'] == 4
+
+    def test_global_search(self):
+        data = self.get_data(**{'search[value]': 'dummy question'})
+
+        assert data['recordsFiltered'] == 1
+        assert 'DUMMY' in data['data'][0]['patient']
+
+    def test_column_search(self):
+        # column 3 is the patient column
+        data = self.get_data(**{'columns[3][search][value]': '98765432'})
+
+        assert data['recordsFiltered'] == 2
+        assert all('ENTRY' in row['patient'] for row in data['data'])
+
+    def test_search_displayed_date(self):
+        data = self.get_data(**{'search[value]': '16-oct'})
+        column = self.get_data(**{'columns[0][search][value]': '30-Oct-2050'})
+
+        assert data['recordsFiltered'] == 1
+        assert '16-Oct-2050' in data['data'][0]['meeting']
+        assert column['recordsFiltered'] == 3
+
+    def test_search_not_applied_to_unsearchable_column(self):
+        # column 8 (actions) is not searchable, so the term is ignored
+        data = self.get_data(**{'columns[8][search][value]': 'nothing'})
+
+        assert data['recordsFiltered'] == 4
+
+    def test_order(self):
+        data = self.get_data(**{'order[0][column]': 5, 'order[0][dir]': 'asc'})
+        histories = [row['medical_history'] for row in data['data']]
+
+        assert histories == sorted(histories)
+
+
+@pytest.mark.usefixtures('client_class', 'db_session', 'populate_db')
+class TestQueryCounts:
+    """Number of SQL statements per view does not grow with rows shown"""
+
+    urls = [('main.case_list', {'meeting': '2050-10-30'}),
+            ('main.case_list_data', {'draw': 1}),
+            ('main.case_edit', {'patient_id': 1, 'case_id': 1}),
+            ('main.action_list', {'user_id': 1}),
+            ('main.action_list', {})]
+
+    def count_queries(self, db_session, query_counter):
+        counts = {}
+        for endpoint, kwargs in self.urls:
+            # clear identity map and caches, so earlier requests can't save
+            # a query
+            db_session.expunge_all()
+            clear_caches()
+            with query_counter:
+                request = self.client.get(url_for(endpoint, **kwargs))
+            assert request.status_code == 200
+            counts[(endpoint, str(kwargs))] = query_counter.count
+        return counts
+
+    def add_cases(self, db_session, number):
+        for index in range(number):
+            patient = Patient(hospital_number='Q{:07d}'.format(index),
+                              first_name='Query', last_name='COUNT',
+                              date_of_birth='1960-01-01', sex='F')
+            case = Case(created_by_id=1, created_on='2017-10-01',
+                        patient=patient, meeting_id=1, consultant_id=3,
+                        medical_history='history', question='question',
+                        status='DISC')
+            db_session.add(case)
+            for number in range(2):
+                db_session.add(Action(case=case, assigned_to_id=1,
+                                      action='action {}'.format(number)))
+        db_session.commit()
+
+    def test_counts_constant(self, db_session, query_counter):
+        before = self.count_queries(db_session, query_counter)
+        self.add_cases(db_session, 10)
+        after = self.count_queries(db_session, query_counter)
+
+        assert before == after
+
+
+@pytest.mark.usefixtures('client_class', 'db_session', 'populate_db')
+class TestMeetingList:
+    def test_page_load(self):
+        request = self.client.get(url_for('main.meeting_list'))
+
+        assert request.status_code == 200
+        assert b'30-Oct-2050' in request.data
+        assert b'count-total' in request.data
+
+    def test_before(self):
+        request = self.client.get(url_for('main.meeting_list',
+                                          before='2050-10-20'))
+
+        assert b'30-Oct-2050' not in request.data
+        assert b'16-Oct-2050' in request.data
+        assert b'after=2050-10-16' in request.data
+
+    def test_invalid_date_ignored(self):
+        request = self.client.get(url_for('main.meeting_list',
+                                          before='not a date'))
+
+        assert request.status_code == 200
+        assert b'30-Oct-2050' in request.data
+
+
+@pytest.mark.usefixtures('client_class', 'db_session', 'populate_db')
+class TestPatientList:
+    def test_page_load(self):
+        request = self.client.get(url_for('main.patient_list'))
+
+        assert request.status_code == 200
+        assert b'patient_lookup' in request.data
+        assert b'98765432' in request.data
+
+    def test_lookup(self):
+        request = self.client.get(url_for('main.patient_lookup', q='entry'))
+        patients = request.json['patients']
+
+        assert request.status_code == 200
+        assert [patient['id'] for patient in patients] == [2]
+        assert patients[0]['cases_url'] == url_for('main.case_create',
+                                                   patient_id=2)
+
+    def test_lookup_limit(self):
+        request = self.client.get(url_for('main.patient_lookup', q='9',
+                                          limit=500))
+
+        assert len(request.json['patients']) == 2
+
+
+@pytest.mark.usefixtures('client_class', 'db_session', 'populate_db')
+class TestExport:
+    def get_export(self, **kwargs):
+        # pytest-flask's client keeps request contexts, which a streamed
+        # response pushes twice, so use a client that doesn't
+        client = current_app.test_client()
+        return client.get(url_for('main.export_rows', **kwargs))
+
+    def test_page_load(self):
+        request = self.client.get(url_for('main.export'))
+
+        assert request.status_code == 200
+        assert b'export_form' in request.data
+        assert b'ctest' in request.data
+
+    def test_csv(self):
+        request = self.get_export(kind='cases', file_type='csv',
+                                  start='2050-10-17', status=['TBD', 'DISC'])
+        lines = request.data.decode().splitlines()
+
+        assert request.status_code == 200
+        assert request.mimetype == 'text/csv'
+        assert 'attachment' in request.headers['Content-Disposition']
+        assert lines[0].startswith('meeting,hospital_number')
+        assert len(lines) == 4
+
+    def test_invalid_status(self):
+        request = self.get_export(kind='actions', file_type='csv',
+                                  status='OPEN')
+
+        assert request.status_code == 400
+
+    def test_xlsx_unavailable(self, monkeypatch):
+        monkeypatch.setattr('mdt_app.main.views.FILE_TYPES', ('csv',))
+        page = self.client.get(url_for('main.export'))
+        request = self.get_export(kind='cases', file_type='xlsx')
+
+        assert b'(XLSX)' not in page.data
+        assert request.status_code == 501
+
+
+@pytest.mark.usefixtures('client_class', 'db_session', 'populate_db')
+class TestReports:
+    def test_missing(self, monkeypatch):
+        monkeypatch.setattr('mdt_app.main.views.PDF_REPORTS', True)
+        assert self.client.get(url_for('main.case_report_pdf',
+                                       case_id=100)).status_code == 404
+        assert self.client.get(url_for('main.meeting_reports_zip',
+                                       pk=100)).status_code == 404
+
+    def test_meeting_zip(self):
+        pytest.importorskip('reportlab')
+        request = self.client.get(url_for('main.meeting_reports_zip', pk=1))
+
+        assert request.status_code == 200
+        assert request.mimetype == 'application/zip'
+        assert request.data.startswith(b'PK')
+
+    def test_pdf_unavailable(self, monkeypatch):
+        monkeypatch.setattr('mdt_app.main.views.PDF_REPORTS', False)
+
+        assert self.client.get(url_for('main.case_report_pdf',
+                                       case_id=1)).status_code == 501
+        assert self.client.get(url_for('main.meeting_reports_zip',
+                                       pk=1)).status_code == 501
+
+    def test_first_report_before_response(self, monkeypatch):
+        def render_pdf(report):
+            raise ValueError('bad text')
+        monkeypatch.setattr('mdt_app.main.views.PDF_REPORTS', True)
+        monkeypatch.setattr('mdt_app.main.reports.render_pdf', render_pdf)
+
+        with pytest.raises(ValueError):
+            self.client.get(url_for('main.meeting_reports_zip', pk=1))
+
+
+@pytest.mark.usefixtures('client_class', 'db_session', 'populate_db')
+class TestActionList:
+    def test_page_load(self):
+        request = self.client.get(url_for('main.action_list', user_id=1))
+
+        assert request.status_code == 200
+        assert b'contact gp' in request.data
+        assert b'Mark as complete' in request.data
+
+    def test_pagination(self, db_session, monkeypatch):
+        monkeypatch.setattr('mdt_app.main.views.ACTIONS_PER_PAGE', 1)
+        first = self.client.get(url_for('main.action_list'))
+        second = self.client.get(url_for('main.action_list', page=2))
+
+        assert b'contact gp' in first.data
+        assert b'contact gp' not in second.data
+        assert b'this is something' in second.data
+        assert b'class="pagination' in first.data
+
+    def test_complete_ajax(self):
+        request = self.client.post(url_for('main.action_complete',
+                                           action_id=1),
+                                   headers={'X-Requested-With':
+                                            'XMLHttpRequest'})
+
+        assert request.json == {'action_id': 1, 'case_id': 1,
+                                'case_status': 'DISC'}
+        assert Action.query.get(1).is_completed
+
+    def test_complete_redirect(self):
+        request = self.client.post(url_for('main.action_complete',
+                                           action_id=2, user_id=1))
+
+        assert request.status_code == 302
+        assert '/actions/1/' in request.location
+        assert Case.query.get(1).status == 'COMP'
+
+
 @pytest.mark.usefixtures('client_class', 'db_session', 'populate_db')
 class TestCaseCreate:
     def setup(self):
@@ -0,0 +1,95 @@
+import os
+
+import pytest
+from flask import url_for
+
+from mdt_app.metrics import Registry, collect, render, write
+
+# above the largest pid Linux gives, so never running
+EXITED_PID = 2 ** 22 + 1
+
+
+@pytest.fixture
+def metrics_token(app):
+    app.config['METRICS_TOKEN'] = 'secret'
+    yield {'Authorization': 'Bearer secret'}
+    app.config['METRICS_TOKEN'] = None
+
+
+def test_histogram():
+    histograms = Registry()
+    for seconds in (0.003, 0.04, 0.04, 20):
+        histograms.observe('mdt_http_request_duration_seconds',
+                           {'endpoint': 'main.case_list'}, seconds)
+    name, labels, value = histograms.snapshot()['histograms'][0]
+    text = render({(name, tuple(map(tuple, labels))): value})
+
+    assert ('mdt_http_request_duration_seconds_bucket{endpoint='
+            '"main.case_list",le="0.005"} 1') in text
+    assert ('mdt_http_request_duration_seconds_bucket{endpoint='
+            '"main.case_list",le="0.05"} 3') in text
+    assert ('mdt_http_request_duration_seconds_bucket{endpoint='
+            '"main.case_list",le="+Inf"} 4') in text
+    assert ('mdt_http_request_duration_seconds_count{endpoint='
+            '"main.case_list"} 4') in text
+    assert '# TYPE mdt_http_request_duration_seconds histogram' in text
+
+
+def test_label_escaping():
+    text = render({('mdt_cache_hits_total', (('cache', 'a"b\\c'),)): 2})
+
+    assert 'mdt_cache_hits_total{cache="a\\"b\\\\c"} 2' in text
+
+
+def test_collect_workers(app, tmpdir):
+    exited = Registry()
+    exited.inc('mdt_http_requests_total',
+               {'endpoint': 'main.case_list', 'method': 'GET',
+                'status': '200'}, 5)
+    exited.add_in_flight(3)
+    running = Registry()
+    running.add_in_flight(2)
+    write(str(tmpdir), dict(exited.snapshot(), pid=EXITED_PID))
+    write(str(tmpdir), dict(running.snapshot(), pid=os.getppid()))
+    before = collect()
+
+    totals = collect(str(tmpdir))
+    requests = ('mdt_http_requests_total',
+                (('endpoint', 'main.case_list'), ('method', 'GET'),
+                 ('status', '200')))
+    in_flight = ('mdt_http_requests_in_flight', ())
+
+    assert totals[requests] == before.get(requests, 0) + 5
+    # gauges of the exited worker are left out
+    assert totals[in_flight] == before[in_flight] + 2
+    assert not [name for name in os.listdir(str(tmpdir))
+                if name.endswith('.tmp')]
+
+
+@pytest.mark.usefixtures('client_class', 'db_session', 'populate_db')
+class TestMetricsView:
+    def test_forbidden(self):
+        request = self.client.get(url_for('main.metrics_text'))
+
+        assert request.status_code == 403
+
+    def test_token(self, metrics_token):
+        self.client.get(url_for('main.patient_list'))
+        request = self.client.get(url_for('main.metrics_text'),
+                                  headers=metrics_token)
+        text = request.data.decode()
+
+        assert request.status_code == 200
+        assert request.mimetype == 'text/plain'
+        assert ('mdt_http_requests_total{endpoint="main.patient_list",'
+                'method="GET",status="200"}') in text
+        assert 'mdt_db_pool_checkouts_total ' in text
+        assert 'mdt_cache_hits_total{cache=' in text
+        # this request is still being handled
+        assert 'mdt_http_requests_in_flight 1' in text
+
+    def test_wrong_token(self, metrics_token):
+        request = self.client.get(url_for('main.metrics_text'),
+                                  headers={'Authorization': 'Bearer wrong'})
+
+        assert request.status_code == 403
@@ -0,0 +1,121 @@
+import time
+from datetime import date
+
+import pytest
+from flask import url_for
+from sqlalchemy.engine.url import make_url
+
+from mdt_app.models import *
+from mdt_app.routing import PIN_COOKIE, REPLICA_BIND, primary, read_from
+
+
+@pytest.yield_fixture
+def replica(app, db, tmpdir):
+    """SQLite database standing in for a replica, with a patient that
+    isn't in the test database and a meeting without its cases"""
+    app.config['SQLALCHEMY_BINDS'] = {
+        REPLICA_BIND: 'sqlite:///{}'.format(tmpdir.join('replica.db'))}
+    engine = db.get_engine(app, bind=REPLICA_BIND)
+    db.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(Patient.__table__.insert(),
+                           hospital_number=55555555, first_name='Only',
+                           last_name='REPLICA', date_of_birth='1970-01-01',
+                           sex='F')
+        connection.execute(Meeting.__table__.insert(), id=1,
+                           date=date(2050, 10, 30))
+
+    yield engine
+
+    app.config['SQLALCHEMY_BINDS'] = None
+    app.extensions['sqlalchemy'].connectors.pop(REPLICA_BIND, None)
+    engine.dispose()
+
+
+@pytest.mark.usefixtures('client_class', 'db_session', 'populate_db',
+                         'replica')
+class TestRouting:
+    def test_read_only_view(self):
+        request = self.client.get(url_for('main.patient_list'))
+
+        assert b'REPLICA' in request.data
+        assert b'PATIENT' not in request.data
+
+    def test_other_view(self):
+        request = self.client.get(url_for('main.patient_edit', pk=1))
+
+        assert request.status_code == 200
+        assert b'PATIENT' in request.data
+
+    def test_header(self):
+        request = self.client.get(url_for('main.patient_list'),
+                                  headers={'X-Read-From': 'primary'})
+
+        assert b'PATIENT' in request.data
+        assert b'REPLICA' not in request.data
+
+    def test_pinned_after_write(self):
+        request = self.client.post(url_for('main.action_complete',
+                                           action_id=1),
+                                   headers={'X-Requested-With':
+                                            'XMLHttpRequest'})
+        cookie = request.headers['Set-Cookie']
+        assert cookie.startswith(PIN_COOKIE + '=')
+
+        # the test client sends the cookie back
+        request = self.client.get(url_for('main.patient_list'))
+        assert b'PATIENT' in request.data
+
+    def test_expired_pin(self):
+        self.client.set_cookie('localhost', PIN_COOKIE,
+                               str(int(time.time()) - 1))
+        request = self.client.get(url_for('main.patient_list'))
+
+        assert b'REPLICA' in request.data
+
+    def test_cache_filled_from_primary(self):
+        request = self.client.get(url_for('main.meeting_summary_data', pk=1))
+
+        assert request.json['total'] == 3
+
+    def test_primary_block(self, app, db_session, replica):
+        with app.test_request_context():
+            read_from('replica')
+            with primary():
+                assert db_session.get_bind(Patient.__mapper__) is not replica
+            assert db_session.get_bind(Patient.__mapper__) is replica
+
+    def test_get_bind(self, app, db_session, replica):
+        with app.test_request_context():
+            read_from('replica')
+            assert db_session.get_bind(Patient.__mapper__) is replica
+
+            update = Patient.__table__.update().values(sex='M')
+            assert db_session.get_bind(clause=update) is not replica
+            # reads after a write go to the primary
+            assert db_session.get_bind(Patient.__mapper__) is not replica
+
+
+def test_no_replica(app, db_session):
+    with app.test_request_context():
+        read_from('replica')
+        assert db_session.get_bind(Patient.__mapper__) is db_session.bind
+
+
+def test_engine_profile(app, db, monkeypatch):
+    monkeypatch.setitem(app.config, 'ENGINE_PROFILE',
+                        {'pool_size': 7, 'max_overflow': 3,
+                         'pool_timeout': None, 'statement_timeout': 5000})
+    options = {}
+    db.apply_driver_hacks(app, make_url('postgresql://mdt@localhost/mdt'),
+                          options)
+
+    assert options['pool_size'] == 7
+    assert options['max_overflow'] == 3
+    assert 'pool_timeout' not in options
+    assert options['connect_args'] == {
+        'options': '-c statement_timeout=5000'}
+
+    options = {}
+    db.apply_driver_hacks(app, make_url('sqlite://'), options)
+    assert 'pool_size' not in options
@@ -0,0 +1,90 @@
+import pytest
+
+from flask import url_for
+
+from mdt_app.models import *
+from mdt_app.search import rebuild_index, search_cases
+
+
+def found(query_string):
+    total, case_ids = search_cases(query_string)
+    return sorted(case_ids)
+
+
+@pytest.mark.usefixtures('db_session', 'populate_db')
+class TestSearch:
+    def setup(self):
+        rebuild_index(db.session)
+
+    def test_rebuild(self):
+        assert rebuild_index(db.session) == 4
+
+    def test_case_text(self):
+        assert found('medical history') == [1, 2, 3]
+        # all words must match
+        assert found('second history') == [2]
+        assert found('fourth') == [4]
+
+    def test_patient(self):
+        assert found('entry') == [2, 4]
+        assert found('12345678') == [1]
+
+    def test_pages(self):
+        total, case_ids = search_cases('question', page=2, per_page=3)
+
+        assert total == 4
+        assert len(case_ids) == 1
+        assert search_cases('question', page=3, per_page=3) == (4, [])
+
+
+@pytest.mark.usefixtures('db_session', 'populate_db')
+class TestIncrementalIndex:
+    def setup(self):
+        rebuild_index(db.session)
+
+    def test_case_changed(self, db_session):
+        Case.query.get(1).discussion = 'botox for BPH'
+        db_session.commit()
+
+        assert found('BPH botox') == [1]
+
+    def test_patient_changed(self, db_session):
+        Patient.query.get(2).last_name = 'RENAMED'
+        db_session.commit()
+
+        assert found('renamed') == [2, 4]
+        assert found('entry') == []
+
+    def test_case_deleted(self, db_session):
+        db_session.delete(Case.query.get(4))
+        db_session.commit()
+
+        assert found('fourth') == []
+
+    def test_rolled_back(self, db_session):
+        Case.query.get(3).question = 'not saved'
+        db_session.flush()
+        db_session.rollback()
+
+        assert found('saved') == []
+
+
+@pytest.mark.usefixtures('client_class', 'db_session', 'populate_db')
+class TestCaseSearch:
+    def setup(self):
+        rebuild_index(db.session)
+
+    def test_page_load(self):
+        request = self.client.get(url_for('main.case_search'))
+
+        assert request.status_code == 200
+        assert 'search_results' not in request.get_data(as_text=True)
+
+    def test_results(self):
+        request = self.client.get(url_for('main.case_search', q='entry'))
+        page = request.get_data(as_text=True)
+
+        assert request.status_code == 200
+        assert '2 cases found' in page
+        assert 'fourth' in page
+        assert 'third case' not in page
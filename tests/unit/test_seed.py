@@ -0,0 +1,58 @@
+from datetime import date
+
+import pytest
+
+from mdt_app.counters import mismatched_counts
+from mdt_app.models import *
+from mdt_app.seed import SeedSizes, generate, seed
+
+SIZES = SeedSizes(users=5, consultants=2, patients=50, years=1,
+                  cases_per_meeting=4, actions_per_case=2,
+                  attendees_per_meeting=4)
+END = date(2050, 10, 16)
+
+
+def without_passwords(tables):
+    return {name: [{key: value for key, value in row.items()
+                    if key != 'password_hash'} for row in rows]
+            for name, rows in tables.items()}
+
+
+def test_reproducible():
+    first = without_passwords(generate(SIZES, seed=1, end=END))
+
+    assert first == without_passwords(generate(SIZES, seed=1, end=END))
+    assert first != without_passwords(generate(SIZES, seed=2, end=END))
+
+
+def test_sizes():
+    tables = generate(SIZES, seed=1, end=END)
+    meetings = tables['meetings']
+
+    assert len(tables['users']) == 7
+    assert sum(user['is_consultant'] for user in tables['users']) == 2
+    assert len(tables['patients']) == 50
+    assert len(meetings) == 57
+    assert meetings[-1]['date'] > END
+    upcoming = {meeting['id'] for meeting in meetings
+                if meeting['date'] > END}
+    assert all(case['status'] == 'TBD' for case in tables['cases']
+               if case['meeting_id'] in upcoming)
+    assert len({(case['patient_id'], case['meeting_id'])
+                for case in tables['cases']}) == len(tables['cases'])
+
+
+@pytest.mark.usefixtures('db_session')
+class TestSeed:
+    def test_seed(self, db_session):
+        counts = seed(db_session.connection(), SIZES, seed=1, end=END)
+
+        assert counts['cases'] == Case.query.count() > 0
+        assert counts['actions'] == Action.query.count()
+        assert Meeting.query.count() == 57
+        assert mismatched_counts() == []
+        assert User.query.get(1).verify_password('password')
+
+    def test_not_empty(self, db_session):
+        with pytest.raises(ValueError):
+            seed(db_session.connection(), SIZES, seed=1, end=END)
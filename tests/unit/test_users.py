@@ -0,0 +1,62 @@
+import pytest
+from flask import url_for
+from sqlalchemy.orm.exc import DetachedInstanceError
+
+from mdt_app.models import *
+from mdt_app.users import cached_user, user_cache
+
+
+@pytest.mark.usefixtures('db_session', 'populate_db')
+class TestCachedUser:
+    def test_cached(self, db_session, query_counter):
+        cached_user(1)
+        db_session.expunge_all()
+        hits = user_cache.hits
+        with query_counter:
+            user = cached_user(1)
+            username = user.username
+
+        assert query_counter.count == 0
+        assert user_cache.hits == hits + 1
+        assert username == 'fuser'
+        assert user not in db_session
+
+    def test_not_found(self):
+        assert cached_user(-1) is None
+
+    def test_invalidated(self, db_session):
+        cached_user(2)
+        User.query.get(2).is_confirmed = True
+        db_session.commit()
+        db_session.expunge_all()
+
+        assert cached_user(2).is_confirmed is True
+
+    def test_password_not_cached(self):
+        user = cached_user(1)
+
+        assert 'password_hash' not in user_cache.get(1)
+        with pytest.raises(DetachedInstanceError):
+            user.verify_password('test_pass')
+
+    def test_change_user(self, db_session):
+        cached_user(1)
+        User.query.get(1).password = 'new_password'
+        db_session.commit()
+
+        assert User.query.get(1).verify_password('new_password')
+        assert user_cache.get(1) is None
+
+
+@pytest.mark.usefixtures('client_class', 'db_session', 'populate_db')
+class TestChangePassword:
+    def test_change_password(self):
+        self.client.post(url_for('auth.login'),
+                         data={'username': 'fuser', 'password': 'test_pass'})
+        request = self.client.post(url_for('auth.change_password'),
+                                   data={'old_password': 'test_pass',
+                                         'password': 'new_password',
+                                         'password2': 'new_password'})
+
+        assert request.status_code == 302
+        assert User.query.get(1).verify_password('new_password')